@@ -0,0 +1,27 @@
+"""
+Attendance adjustments on the shared multi-level approval engine in
+leave_management.approvals.
+"""
+from leave_management.approvals import ApprovalBatch, ApprovalWorkflow
+
+from .models import AdjustmentApproval, AttendanceAdjustment
+
+
+class AdjustmentApprovalWorkflow(ApprovalWorkflow):
+    approval_model = AdjustmentApproval
+    request_model = AttendanceAdjustment
+    request_field = 'adjustment_request'
+    decided_at_field = 'approved_date'
+    request_label = 'adjustment request'
+
+
+ADJUSTMENT_APPROVALS = AdjustmentApprovalWorkflow()
+
+
+def create_adjustment_approval_chain(request_id):
+    """Job run for a new adjustment request when the job queue is on"""
+    ADJUSTMENT_APPROVALS.create_chain_for(request_id)
+
+
+class AdjustmentApprovalBatch(ApprovalBatch):
+    workflow = ADJUSTMENT_APPROVALS
@@ -0,0 +1,289 @@
+"""
+Derives ShiftInOut and AttendanceSummary rows from raw attendance punches.
+
+The rules (shift windows, late and early-out thresholds) live in plain functions. The
+derivation itself runs off the request path: `derive_incremental` picks up every
+(employee, local date) pair whose punches changed since a stored watermark, computes
+first-in and last-out with one grouped Min/Max query per batch and upserts the shift and
+summary rows, so late or corrected punches update days that were already derived.
+
+A deleted punch leaves nothing to pick up, so the Attendance post_delete receiver calls
+`touch_day` to mark the rest of its day changed; the Attendance queryset's update() sets
+updated_at like save() does.
+
+Punches carry their local date and time of day (Attendance.attendance_day/attendance_time,
+filled from attendance_date by save() and by the Attendance queryset's update() and
+bulk_update()), so day grouping and shift-window filters are plain column comparisons
+that the (employee, attendance_day, attendance_time) index serves.
+"""
+from datetime import datetime, time, timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from employee.models import Employee
+from leave.instrumentation import instrument
+
+
+WATERMARK_NAME = 'shift_in_out'
+# Reprocess a little before the watermark so rows committed late by concurrent writers are not missed
+WATERMARK_OVERLAP = timedelta(minutes=5)
+BATCH_SIZE = 500
+
+DEFAULT_OFFICE_START = time(9, 0)
+DEFAULT_OFFICE_END = time(18, 0)
+
+
+def shift_windows():
+    """(in_start, in_end, out_start, out_end) from the ShiftInOut field defaults"""
+    from .models import ShiftInOut
+
+    return tuple(
+        ShiftInOut._meta.get_field(name).default
+        for name in ('shifting_in_start', 'shifting_in_end', 'shifting_out_start', 'shifting_out_end')
+    )
+
+
+def shift_name(in_start, out_end):
+    if in_start == time(8, 0) and out_end == time(20, 0):
+        return "Day Shift"
+    if in_start == time(20, 0) and out_end == time(8, 0):
+        return "Night Shift"
+    return ""
+
+
+def local_date_and_time(moment):
+    """(local date, local time) of an aware datetime in TIME_ZONE, or (None, None)"""
+    if moment is None:
+        return None, None
+    local = timezone.localtime(moment)
+    return local.date(), local.time()
+
+
+def local_attendance_day(attendance):
+    """The stored local day of a punch, computed from attendance_date when it was never filled"""
+    if attendance is None or attendance.attendance_date is None:
+        return None
+    return attendance.attendance_day or local_date_and_time(attendance.attendance_date)[0]
+
+
+def office_hours(employee):
+    office_time = getattr(employee, 'office_time', None)
+    if office_time and '-' in office_time:
+        start, end = office_time.split('-')
+        return datetime.strptime(start.strip(), "%H:%M").time(), datetime.strptime(end.strip(), "%H:%M").time()
+    return DEFAULT_OFFICE_START, DEFAULT_OFFICE_END
+
+
+def _difference(later, earlier):
+    today = timezone.now().date()
+    return datetime.combine(today, later) - datetime.combine(today, earlier)
+
+
+def summarize_shift(shift, employee):
+    """
+    Late and early-out durations for a shift, as (late_by, early_out_by).
+
+    Returns None when no summary is kept, i.e. the employee arrived before and left after
+    office hours. Raises ValidationError when the punches fall outside the shift windows.
+    """
+    office_time_start, office_time_end = office_hours(employee)
+
+    if (shift.in_time and shift.in_time < shift.shifting_in_start) or (shift.out_time and shift.out_time > shift.shifting_out_end):
+        raise ValidationError("Your leave history not created because you are out of shift in and out time range")
+
+    if shift.in_time and shift.out_time and shift.in_time < office_time_start and shift.out_time > office_time_end:
+        return None
+
+    late_by = None
+    early_out_by = None
+    consideration = shift.consideration_time or timedelta(minutes=20)
+
+    if shift.in_time:
+        diff = _difference(shift.in_time, office_time_start)
+        if diff >= consideration:
+            late_by = diff
+    if shift.out_time:
+        diff = _difference(office_time_end, shift.out_time)
+        if diff >= consideration:
+            early_out_by = diff
+
+    return late_by, early_out_by
+
+
+def _pair_filter(pairs):
+    condition = Q()
+    for employee_id, day in pairs:
+        condition |= Q(employee_id=employee_id, attendance_day=day)
+    return condition
+
+
+@instrument
+def derive_shifts(pairs):
+    """
+    Create or update ShiftInOut and AttendanceSummary rows for (employee_id, date) pairs.
+
+    Dates are local (Asia/Dhaka) calendar days. Returns the number of shifts written.
+    """
+    from .models import Attendance, AttendanceSummary, ShiftInOut
+
+    pairs = {(employee_id, day) for employee_id, day in pairs if employee_id and day}
+    if not pairs:
+        return 0
+
+    employee_ids = {employee_id for employee_id, _ in pairs}
+    in_start, in_end, out_start, out_end = shift_windows()
+
+    punches = Attendance.objects.filter(
+        employee_id__in=employee_ids,
+        attendance_day__gte=min(day for _, day in pairs),
+        attendance_day__lte=max(day for _, day in pairs)
+    )
+    bounds = {
+        (row['employee_id'], row['attendance_day']): (row['first_in'], row['last_out'])
+        for row in punches.values('employee_id', 'attendance_day').annotate(
+            first_in=Min('attendance_date', filter=Q(attendance_time__gte=in_start, attendance_time__lte=in_end)),
+            last_out=Max('attendance_date', filter=Q(attendance_time__gte=out_start, attendance_time__lte=out_end)),
+        ).order_by()
+        if (row['employee_id'], row['attendance_day']) in pairs and row['first_in'] and row['last_out']
+    }
+    # Days that no longer have both an in and an out punch, e.g. after a punch was deleted
+    without_shift = pairs - set(bounds)
+    if not bounds:
+        _drop_shifts(without_shift)
+        return 0
+
+    # The shift points at the first-in punch
+    in_punch_ids = {
+        (employee_id, attendance_date): pk
+        for pk, employee_id, attendance_date in punches.filter(
+            attendance_date__in={first_in for first_in, _ in bounds.values()}
+        ).values_list('pk', 'employee_id', 'attendance_date')
+    }
+
+    employees = Employee.objects.in_bulk({employee_id for employee_id, _ in bounds})
+    name = shift_name(in_start, out_end)
+
+    shifts = []
+    summaries = []
+    without_summary = []
+    for (employee_id, day), (first_in, last_out) in sorted(bounds.items()):
+        in_attendance = Attendance(
+            pk=in_punch_ids[(employee_id, first_in)], employee_id=employee_id, attendance_date=first_in
+        )
+        shift = ShiftInOut(
+            name=name,
+            employee=employees[employee_id],
+            attendance=in_attendance,
+            attendance_day=day,
+            in_time=timezone.localtime(first_in).time(),
+            out_time=timezone.localtime(last_out).time(),
+        )
+        shifts.append(shift)
+
+        try:
+            summary = summarize_shift(shift, shift.employee)
+        except ValidationError:
+            # Punches outside the shift windows get a shift but no summary
+            summary = None
+        if summary is None:
+            without_summary.append((employee_id, day))
+            continue
+        late_by, early_out_by = summary
+        summaries.append(AttendanceSummary(
+            employee=shift.employee,
+            attendance=in_attendance,
+            attendance_day=day,
+            late_by=late_by,
+            early_out_by=early_out_by
+        ))
+
+    with transaction.atomic():
+        ShiftInOut.objects.bulk_create(
+            shifts,
+            update_conflicts=True,
+            unique_fields=['employee', 'attendance_day'],
+            update_fields=['name', 'attendance', 'in_time', 'out_time'],
+        )
+        AttendanceSummary.objects.bulk_create(
+            summaries,
+            update_conflicts=True,
+            unique_fields=['employee', 'attendance_day'],
+            update_fields=['attendance', 'late_by', 'early_out_by'],
+        )
+        if without_summary:
+            AttendanceSummary.objects.filter(_pair_filter(without_summary)).delete()
+        _drop_shifts(without_shift)
+    return len(shifts)
+
+
+def _drop_shifts(pairs):
+    from .models import AttendanceSummary, ShiftInOut
+
+    if not pairs:
+        return
+    with transaction.atomic():
+        AttendanceSummary.objects.filter(_pair_filter(pairs)).delete()
+        ShiftInOut.objects.filter(_pair_filter(pairs)).delete()
+
+
+def touch_day(employee_id, day):
+    """
+    Mark an employee's punches on a local day as changed so the next incremental run
+    re-derives that day. When none are left, the day's shift went with its first-in punch.
+    """
+    from .models import Attendance
+
+    if not (employee_id and day):
+        return
+    touched = Attendance.objects.filter(employee_id=employee_id, attendance_day=day).update(updated_at=timezone.now())
+    if touched:
+        schedule_derivation()
+
+
+def schedule_derivation():
+    """
+    With the job queue on, queue an incremental derivation run for punches just written,
+    rather than waiting for the next scheduled `derive_shifts`. Every punch written before
+    the run starts shares the one pending job.
+    """
+    from leave_management import jobs
+    if jobs.queue_enabled():
+        jobs.enqueue('attendence.derivation.derive_incremental', key=WATERMARK_NAME)
+
+
+def derive_incremental(batch_size=BATCH_SIZE, full=False):
+    """
+    Derive shifts for every (employee, date) pair touched since the stored watermark.
+
+    Returns (pairs processed, shifts written). With `full`, every pair is reprocessed.
+    """
+    from .models import Attendance, DerivationWatermark
+
+    watermark, _ = DerivationWatermark.objects.get_or_create(name=WATERMARK_NAME)
+    started_at = timezone.now()
+
+    touched = Attendance.objects.filter(employee__isnull=False, attendance_date__isnull=False)
+    if watermark.processed_until and not full:
+        touched = touched.filter(updated_at__gte=watermark.processed_until - WATERMARK_OVERLAP)
+
+    pairs = touched.values_list('employee_id', 'attendance_day').distinct().order_by('employee_id', 'attendance_day')
+
+    processed = 0
+    written = 0
+    batch = []
+    for pair in pairs.iterator():
+        batch.append(pair)
+        if len(batch) >= batch_size:
+            written += derive_shifts(batch)
+            processed += len(batch)
+            batch = []
+    if batch:
+        written += derive_shifts(batch)
+        processed += len(batch)
+
+    watermark.processed_until = started_at
+    watermark.save(update_fields=['processed_until', 'updated_at'])
+    return processed, written
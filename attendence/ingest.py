@@ -0,0 +1,117 @@
+"""
+Batch ingestion of raw RFID punches.
+
+Card readers post punches in batches keyed by `rfid_no`. Cards are resolved to employees
+through a process-wide map of `Employee.rfid_code` (dropped whenever an employee is saved
+or deleted) and the punches are inserted with one bulk_create. Shifts and summaries for the
+touched days are derived later by the `derive_shifts` command, or by a queued derivation
+job when the job queue is on (see derivation.py).
+"""
+import threading
+
+from employee.models import Employee
+from .derivation import schedule_derivation
+from .models import Attendance
+from .serializers import RfidPunchSerializer
+
+
+_rfid_map = None
+_lock = threading.Lock()
+
+
+def _load_rfid_map():
+    return dict(
+        Employee.objects.exclude(rfid_code__isnull=True).exclude(rfid_code='').values_list('rfid_code', 'pk')
+    )
+
+
+def get_rfid_map(refresh=False):
+    """Return the process-wide {rfid_code: employee pk} map, loading it on first use"""
+    global _rfid_map
+    rfid_map = _rfid_map
+    if rfid_map is None or refresh:
+        with _lock:
+            if _rfid_map is None or refresh:
+                _rfid_map = _load_rfid_map()
+            rfid_map = _rfid_map
+    return rfid_map
+
+
+def invalidate_rfid_map(**kwargs):
+    global _rfid_map
+    with _lock:
+        _rfid_map = None
+
+
+class PunchIngestor:
+    """Validates, resolves and stores one batch of RFID punches"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.errors = []
+        self.created = 0
+        self.duplicates = 0
+
+    def run(self):
+        parsed = self._parse_rows()
+        punches = self._resolve(parsed)
+        self.errors.sort(key=lambda error: error['index'])
+        if not punches:
+            return self
+
+        employee_ids = {attendance.employee_id for attendance in punches}
+        existing = set(Attendance.objects.filter(
+            employee_id__in=employee_ids,
+            attendance_day__gte=min(attendance.attendance_day for attendance in punches),
+            attendance_day__lte=max(attendance.attendance_day for attendance in punches)
+        ).values_list('employee_id', 'attendance_date'))
+
+        new_punches = []
+        for attendance in punches:
+            key = (attendance.employee_id, attendance.attendance_date)
+            if key in existing:
+                self.duplicates += 1
+                continue
+            existing.add(key)
+            new_punches.append(attendance)
+
+        # ignore_conflicts covers taps recorded by a concurrent batch
+        Attendance.objects.bulk_create(new_punches, ignore_conflicts=True)
+        if new_punches:
+            schedule_derivation()
+
+        self.created = len(new_punches)
+        return self
+
+    def _parse_rows(self):
+        parsed = []
+        for index, row in enumerate(self.rows):
+            serializer = RfidPunchSerializer(data=row)
+            if serializer.is_valid():
+                parsed.append((index, serializer.validated_data))
+            else:
+                self.errors.append({'index': index, 'errors': serializer.errors})
+        return parsed
+
+    def _resolve(self, parsed):
+        rfid_map = get_rfid_map()
+        if any(data['rfid_no'] not in rfid_map for _, data in parsed):
+            # Cards issued since the map was loaded, possibly by another process
+            rfid_map = get_rfid_map(refresh=True)
+
+        punches = []
+        for index, data in parsed:
+            employee_id = rfid_map.get(data['rfid_no'])
+            if employee_id is None:
+                self.errors.append({'index': index, 'errors': {'rfid_no': [f'Unknown RFID card "{data["rfid_no"]}".']}})
+                continue
+            attendance = Attendance(
+                employee_id=employee_id,
+                rfid_no=data['rfid_no'],
+                attendance_date=data['attendance_date'],
+                status=data['status'],
+            )
+            # bulk_create skips save()
+            attendance.fill_local_fields()
+            punches.append(attendance)
+        return punches
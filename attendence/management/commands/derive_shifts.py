@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from attendence.derivation import BATCH_SIZE, derive_incremental
+
+
+class Command(BaseCommand):
+    help = 'Derive ShiftInOut and AttendanceSummary rows for days whose punches changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Reprocess every employee and day instead of only those touched since the last run'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help=f'Number of (employee, date) pairs derived per batch (default {BATCH_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        processed, written = derive_incremental(batch_size=options['batch_size'], full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} employee days, wrote {written} shifts"
+        ))
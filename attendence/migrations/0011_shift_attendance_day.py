@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:49
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_attendance_day(apps, schema_editor):
+    """Fill attendance_day from the linked punch, keeping the newest row per employee and day"""
+    for model_name in ('ShiftInOut', 'AttendanceSummary'):
+        model = apps.get_model('attendence', model_name)
+        seen = set()
+        duplicates = []
+        rows = model.objects.filter(attendance__isnull=False).select_related('attendance').order_by('-pk')
+        for row in rows.iterator():
+            if row.attendance.attendance_date is None:
+                continue
+            row.attendance_day = timezone.localtime(row.attendance.attendance_date).date()
+            key = (row.employee_id, row.attendance_day)
+            if row.employee_id and key in seen:
+                duplicates.append(row.pk)
+                continue
+            seen.add(key)
+            row.save(update_fields=['attendance_day'])
+        model.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendence', '0010_shiftinout'),
+        ('employee', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DerivationWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('processed_until', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='attendancesummary',
+            name='attendance_day',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='shiftinout',
+            name='attendance_day',
+            field=models.DateField(blank=True, help_text='Local date of the shift, one shift per employee per day', null=True),
+        ),
+        migrations.RunPython(backfill_attendance_day, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='attendancesummary',
+            constraint=models.UniqueConstraint(fields=('employee', 'attendance_day'), name='unique_summary_per_employee_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='shiftinout',
+            constraint=models.UniqueConstraint(fields=('employee', 'attendance_day'), name='unique_shift_per_employee_day'),
+        ),
+    ]
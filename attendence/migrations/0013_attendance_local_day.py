@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:08
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+BATCH_SIZE = 1000
+
+
+def backfill_local_day_and_time(apps, schema_editor):
+    """Fill attendance_day and attendance_time from attendance_date in TIME_ZONE"""
+    Attendance = apps.get_model('attendence', 'Attendance')
+    batch = []
+    rows = Attendance.objects.filter(attendance_date__isnull=False).only('attendance_date').order_by('pk')
+    for row in rows.iterator(chunk_size=BATCH_SIZE):
+        local = timezone.localtime(row.attendance_date)
+        row.attendance_day, row.attendance_time = local.date(), local.time()
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            Attendance.objects.bulk_update(batch, ['attendance_day', 'attendance_time'])
+            batch = []
+    Attendance.objects.bulk_update(batch, ['attendance_day', 'attendance_time'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendence', '0012_attendance_list_index'),
+        ('employee', '0003_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='attendance_day',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='attendance',
+            name='attendance_time',
+            field=models.TimeField(blank=True, editable=False, null=True),
+        ),
+        # Before the index, so the backfill doesn't maintain it row by row
+        migrations.RunPython(backfill_local_day_and_time, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['employee', 'attendance_day', 'attendance_time'], name='attendance_emp_day_time_idx'),
+        ),
+    ]
@@ -3,12 +3,39 @@ from django.db import models
 from employee.models import Employee
 from leave_management.models import Supervisor
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from employee.models import Employee, Department, Branch
-from django.core.exceptions import ValidationError
+from leave.instrumentation import instrument
+from .derivation import local_attendance_day, local_date_and_time, schedule_derivation, summarize_shift, touch_day
 
 # Create your models here.
 
+class AttendanceQuerySet(models.QuerySet):
+    """Keeps attendance_day, attendance_time and updated_at in step on bulk writes"""
+
+    def update(self, **kwargs):
+        # auto_now is not applied by update(); derive_incremental finds changed days by updated_at
+        kwargs.setdefault('updated_at', timezone.now())
+        if 'attendance_date' in kwargs and not {'attendance_day', 'attendance_time'} & set(kwargs):
+            attendance_date = kwargs['attendance_date']
+            if hasattr(attendance_date, 'resolve_expression'):
+                raise ValueError("Updating attendance_date with an expression must also set attendance_day and attendance_time")
+            kwargs['attendance_day'], kwargs['attendance_time'] = local_date_and_time(attendance_date)
+        return super().update(**kwargs)
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        now = timezone.now()
+        for obj in objs:
+            obj.updated_at = now
+            if 'attendance_date' in fields:
+                obj.fill_local_fields()
+        added = {'updated_at'}
+        if 'attendance_date' in fields:
+            added |= {'attendance_day', 'attendance_time'}
+        return super().bulk_update(objs, [*fields, *(added - set(fields))], batch_size=batch_size)
+
+
 class Attendance(models.Model):
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='attendances', blank=True, null=True)
     rfid_no = models.CharField(max_length=20, blank=True, null=True)
@@ -28,15 +55,61 @@ class Attendance(models.Model):
     remarks = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
     updated_at = models.DateTimeField(auto_now=True, blank=True, null=True)
+    # attendance_date in local time (TIME_ZONE), stored so per-day queries are index range scans.
+    # Never written directly: save(), the queryset's update() and bulk_update() fill them from
+    # attendance_date, and bulk_create callers must call fill_local_fields() first.
+    attendance_day = models.DateField(blank=True, null=True, editable=False)
+    attendance_time = models.TimeField(blank=True, null=True, editable=False)
+
+    objects = AttendanceQuerySet.as_manager()
 
 
     class Meta:
         unique_together = ('employee', 'attendance_date')
         ordering = ['-attendance_date']
+        indexes = [
+            # Keyset pagination of the attendance list
+            models.Index(fields=['-attendance_date', 'id'], name='attendance_date_id_idx'),
+            # An employee's punches per local day, filtered by time of day when deriving shifts
+            models.Index(fields=['employee', 'attendance_day', 'attendance_time'], name='attendance_emp_day_time_idx'),
+        ]
     
     def __str__(self):
         attendance_local_time = timezone.localtime(self.attendance_date) if self.attendance_date else None
         return f"{self.employee} - {attendance_local_time} - {self.status}"
+
+    def fill_local_fields(self):
+        """Set attendance_day and attendance_time from attendance_date; bulk_create callers must call this"""
+        self.attendance_day, self.attendance_time = local_date_and_time(self.attendance_date)
+
+    def save(self, *args, **kwargs):
+        self.fill_local_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'attendance_date' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'attendance_day', 'attendance_time'}
+        super().save(*args, **kwargs)
+
+
+@receiver(post_save, sender=Attendance)
+def schedule_shift_derivation(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_derivation()
+
+
+@receiver(post_delete, sender=Attendance)
+def rederive_day_of_deleted_punch(sender, instance, **kwargs):
+    """A deleted punch can move the day's first-in or last-out"""
+    touch_day(instance.employee_id, local_attendance_day(instance))
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+def invalidate_rfid_map_cache(sender, **kwargs):
+    """Drop the cached RFID map so the next punch batch reloads it"""
+    from .ingest import invalidate_rfid_map
+    invalidate_rfid_map()
+    # Also drop it after commit, in case another thread reloaded it mid-transaction
+    transaction.on_commit(invalidate_rfid_map)
     
 class ShiftInOut(models.Model):
     """Tracks in and out times for employees"""
@@ -50,66 +123,23 @@ class ShiftInOut(models.Model):
     shifting_out_start = models.TimeField(default=timezone.datetime.strptime("16:00", "%H:%M").time() , blank=True, null=True)
     shifting_out_end = models.TimeField(default=timezone.datetime.strptime("20:00", "%H:%M").time() , blank=True, null=True)
     consideration_time = models.DurationField(blank=True, null=True, default=timezone.timedelta(minutes=20), help_text="Time considered for attendance calculation")
+    attendance_day = models.DateField(blank=True, null=True, help_text="Local date of the shift, one shift per employee per day")
 
     class Meta:
         unique_together = ('employee', 'attendance')
         ordering = ['-attendance__attendance_date']
+        constraints = [
+            models.UniqueConstraint(fields=['employee', 'attendance_day'], name='unique_shift_per_employee_day'),
+        ]
     
     def __str__(self):
         locals_attendance_time = timezone.localtime(self.attendance.attendance_date) if self.attendance and self.attendance.attendance_date else None
         return f"{self.employee} - {locals_attendance_time} - In: {self.in_time} - Out: {self.out_time}"
-    
-@receiver(post_save, sender=Attendance)
-def create_shift_in_out(sender, instance, created, **kwargs):
-    if not created or not instance.employee or not instance.attendance_date:
-        return
 
-    attendance_date = instance.attendance_date.date()
-    attendances = Attendance.objects.filter(
-        employee=instance.employee,
-        attendance_date__date=attendance_date
-    ).order_by('attendance_date')
-
-    # Use the default shift window values from ShiftInOut model
-    default_in_start = ShiftInOut._meta.get_field('shifting_in_start').default
-    default_in_end = ShiftInOut._meta.get_field('shifting_in_end').default
-    default_out_start = ShiftInOut._meta.get_field('shifting_out_start').default
-    default_out_end = ShiftInOut._meta.get_field('shifting_out_end').default
-
-    # Find in-time attendance
-    in_attendance = attendances.filter(
-        attendance_date__time__gte=default_in_start,
-        attendance_date__time__lte=default_in_end
-    ).first()
-
-    # Find out-time attendance
-    out_attendance = attendances.filter(
-        attendance_date__time__gte=default_out_start,
-        attendance_date__time__lte=default_out_end
-    ).last()
-
-    # Only create if both in and out attendance exist
-    if in_attendance and out_attendance:
-        # Check if ShiftInOut already exists for this employee and date
-        if not ShiftInOut.objects.filter(
-            employee=instance.employee,
-            attendance__attendance_date__date=attendance_date
-        ).exists():
-            shift_name = ""
-            if(
-                default_in_start == timezone.datetime.strptime("08:00", "%H:%M").time() and default_out_end == timezone.datetime.strptime("20:00", "%H:%M").time()
-            ):
-                shift_name = "Day Shift"
-            elif(
-                default_in_start == timezone.datetime.strptime("20:00", "%H:%M").time() and default_out_end == timezone.datetime.strptime("08:00", "%H:%M").time()):
-                shift_name = "Night Shift"
-            ShiftInOut.objects.create(
-                name=shift_name,
-                employee=instance.employee,
-                attendance=in_attendance,  # You can also use out_attendance, as both are for the same date
-                in_time=timezone.localtime(in_attendance.attendance_date).time(),
-                out_time=timezone.localtime(out_attendance.attendance_date).time(),
-            )
+    def save(self, *args, **kwargs):
+        if self.attendance_day is None:
+            self.attendance_day = local_attendance_day(self.attendance)
+        super().save(*args, **kwargs)
     
 class AttendanceAdjustment(models.Model):
     ADJUSTMENT_TYPE = [
@@ -171,138 +201,72 @@ class AdjustmentApproval(models.Model):
             self._handle_workflow_progression()
 
     def _handle_workflow_progression(self):
-        adjustment = self.adjustment_request
-
-        if self.status == 'rejected':
-            # Reject the entire adjustment request
-            adjustment.status = 'rejected'
-            adjustment.approved_at = timezone.localtime()
-            adjustment.save()
-            # Reject ALL approvals when any supervisor rejects
-            AdjustmentApproval.objects.filter(
-                adjustment_request=adjustment
-            ).update(
-                status='rejected',
-                approved_date=timezone.localtime()
-            )
-            
-        elif self.status == 'approved':
-            # Auto-approve all lower level approvals when a higher level approves
-            AdjustmentApproval.objects.filter(
-                adjustment_request=adjustment,
-                level__lt=self.level,
-                status='pending'
-            ).update(
-                status='approved',
-                approved_date=timezone.localtime()
-            )
-
-            # Check if there are higher level approvals needed
-            next_level = self.level + 1
-            has_next_approval = AdjustmentApproval.objects.filter(
-                adjustment_request=adjustment,
-                level=next_level
-            ).exists()
-
-            if has_next_approval:
-                # Move to next approval level
-                adjustment.status = f'pending_L{next_level}'
-                self.status = f'pending_L{next_level}'
-                adjustment.save()
-            else:
-                # Final approval - update approved_at
-                adjustment.status = 'approved'
-                adjustment.approved_at = timezone.localtime()
-                adjustment.save()
+        from .approvals import ADJUSTMENT_APPROVALS
+        ADJUSTMENT_APPROVALS.transition([self])
 
 @receiver(post_save, sender=AttendanceAdjustment)
+@instrument
 def create_approval_entries(sender, instance, created, **kwargs):
     if created and instance.employee:
-        supervisors = Supervisor.objects.filter(employee=instance.employee).order_by('level')
-        for supervisor in supervisors:
-            AdjustmentApproval.objects.create(
-                adjustment_request=instance,
-                supervisor=supervisor,
-                level=supervisor.level,
-                status='pending',
+        from leave_management import jobs
+        if jobs.queue_enabled():
+            jobs.enqueue(
+                'attendence.approvals.create_adjustment_approval_chain',
+                {'request_id': instance.pk}, key=f'adjustment-approval-chain:{instance.pk}'
             )
+            return
+        from .approvals import ADJUSTMENT_APPROVALS
+        ADJUSTMENT_APPROVALS.create_chains([instance])
 
 class AttendanceSummary(models.Model):
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='attendance_semployee', blank=True, null=True)
     attendance = models.ForeignKey(Attendance, on_delete=models.CASCADE, related_name='attendance_summaries', blank=True, null=True)
     late_by = models.DurationField(blank=True, null=True)
     early_out_by = models.DurationField(blank=True, null=True)
+    attendance_day = models.DateField(blank=True, null=True)
 
     class Meta:
         unique_together = ('employee', 'attendance')
         ordering = ['-attendance__attendance_date']
+        constraints = [
+            models.UniqueConstraint(fields=['employee', 'attendance_day'], name='unique_summary_per_employee_day'),
+        ]
 
     def __str__(self):
         return f"{self.employee.employee_name} - {self.attendance.attendance_date} - Late: {self.late_by} - Early Out: {self.early_out_by}"
 
     def save(self, *args, **kwargs):
+        if self.attendance_day is None:
+            self.attendance_day = local_attendance_day(self.attendance)
         super().save(*args, **kwargs)
 
 
+class DerivationWatermark(models.Model):
+    """How far a background derivation job has processed the attendance table"""
+    name = models.CharField(max_length=50, unique=True)
+    processed_until = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} - {self.processed_until}"
+
+
 @receiver(post_save, sender=ShiftInOut)
+@instrument
 def create_attendance_summary(sender, instance, created, **kwargs):
     if not created or not instance.employee or not instance.attendance:
         return
-    
-    office_time = instance.employee.office_time if hasattr(instance.employee, 'office_time') else None
-    if office_time and '-' in office_time:
-        office_time_start_str, office_time_end_str = office_time.split('-')
-        office_time_start = timezone.datetime.strptime(office_time_start_str.strip(), "%H:%M").time()
-        office_time_end = timezone.datetime.strptime(office_time_end_str.strip(), "%H:%M").time()
-    else:
-        office_time_start = timezone.datetime.strptime("09:00", "%H:%M").time()
-        office_time_end = timezone.datetime.strptime("18:00", "%H:%M").time()
-
-    if (instance.in_time and instance.in_time < instance.shifting_in_start) or (instance.out_time and instance.out_time > instance.shifting_out_end):
-        # Do not create summary, raise error
-        raise ValidationError("Your leave history not created because you are out of shift in and out time range")
-
-    skip_late_early = (
-        instance.in_time and instance.out_time and 
-        instance.in_time < office_time_start and
-        instance.out_time > office_time_end
-    )
-
-    late_by = None
-    early_out_by = None
-
-    consideration = instance.consideration_time or timezone.timedelta(minutes=20)
-
-    if not skip_late_early:
-        # Calculate late_by
-        if instance.in_time and office_time_start:
-            diff = (
-                timezone.datetime.combine(timezone.now().date(), instance.in_time) -
-                timezone.datetime.combine(timezone.now().date(), office_time_start)
-            )
-            if diff >= consideration:
-                late_by = diff
-        # Calculate early_out_by
-        if instance.out_time and office_time_end:
-            diff = (
-                timezone.datetime.combine(timezone.now().date(), office_time_end) -
-                timezone.datetime.combine(timezone.now().date(), instance.out_time)
-            )
-            if diff >= consideration:
-                early_out_by = diff
-
-        AttendanceSummary.objects.create(
-            employee=instance.employee,
-            attendance=instance.attendance,
-            late_by=late_by,
-            early_out_by=early_out_by
-        )
-
-
-
-
-    
-
-
 
+    summary = summarize_shift(instance, instance.employee)
+    if summary is None:
+        # Arrived before and left after office hours
+        return
 
+    late_by, early_out_by = summary
+    AttendanceSummary.objects.create(
+        employee=instance.employee,
+        attendance=instance.attendance,
+        attendance_day=instance.attendance_day,
+        late_by=late_by,
+        early_out_by=early_out_by
+    )
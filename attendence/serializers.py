@@ -16,6 +16,17 @@ class AttendanceSerializer(serializers.ModelSerializer):
             value = value.replace(tzinfo=ZoneInfo('Asia/Dhaka'))
         return value
 
+class RfidPunchSerializer(serializers.Serializer):
+    """One raw punch from a card reader"""
+    rfid_no = serializers.CharField(max_length=20)
+    attendance_date = serializers.DateTimeField()
+    status = serializers.ChoiceField(choices=Attendance._meta.get_field('status').choices, default='present')
+
+    def validate_attendance_date(self, value):
+        if timezone.is_naive(value):
+            value = value.replace(tzinfo=ZoneInfo('Asia/Dhaka'))
+        return value
+
 class AttendanceAdjustmentSerializer(serializers.ModelSerializer):
     employee_name = serializers.CharField(source='employee.__str__', read_only=True)
     attendance_date = serializers.DateTimeField(source='attendance.attendance_date', read_only=True)
@@ -1,3 +1,418 @@
+import json
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from employee.models import Employee
+from users.models import User
+from attendence.derivation import derive_incremental
+from attendence.ingest import get_rfid_map, invalidate_rfid_map
+from attendence.models import AdjustmentApproval, Attendance, AttendanceAdjustment, AttendanceSummary, ShiftInOut
+from leave_management.holiday_calendar import invalidate_holiday_calendar
+from leave_management.models import Supervisor
+
+
+def local(day, hour, minute=0):
+    return timezone.make_aware(datetime.combine(day, time(hour, minute)))
+
+
+class PunchIngestionTestCase(TestCase):
+    url = '/attendance/api/attendance/punches/'
+
+    def setUp(self):
+        invalidate_holiday_calendar()
+        invalidate_rfid_map()
+        self.employees = []
+        for index in range(2):
+            user = User.objects.create(name=f'punch{index}', email=f'punch{index}@example.com')
+            self.employees.append(Employee.objects.create(
+                employee_id=f'P{index}', employee_name=user, rfid_code=f'CARD{index}'
+            ))
+
+    def _post(self, rows):
+        return self.client.post(self.url, rows, content_type='application/json')
+
+    def _derive(self):
+        output = StringIO()
+        call_command('derive_shifts', stdout=output)
+        return output.getvalue()
+
+    def test_batch_is_stored_and_derived(self):
+        response = self._post([
+            {'rfid_no': 'CARD0', 'attendance_date': '2024-04-03T09:05:00'},
+            {'rfid_no': 'CARD0', 'attendance_date': '2024-04-03T09:05:00'},
+            {'rfid_no': 'CARD0', 'attendance_date': '2024-04-03T17:00:00'},
+            {'rfid_no': 'CARD1', 'attendance_date': '2024-04-03T10:00:00'},
+            {'rfid_no': 'LOST', 'attendance_date': '2024-04-03T09:00:00'},
+            {'rfid_no': 'CARD1', 'attendance_date': 'yesterday'},
+        ])
+
+        self.assertEqual(response.status_code, 207)
+        body = response.json()
+        self.assertEqual((body['created'], body['duplicates']), (3, 1))
+        self.assertEqual([error['index'] for error in body['errors']], [4, 5])
+        self.assertIn('rfid_no', body['errors'][0]['errors'])
+        # Derivation happens in the background job, not while ingesting
+        self.assertFalse(ShiftInOut.objects.exists())
+
+        self.assertIn('Processed 2 employee days, wrote 1 shifts', self._derive())
+        shift = ShiftInOut.objects.get()
+        self.assertEqual((shift.employee, shift.in_time, shift.out_time), (self.employees[0], time(9, 5), time(17, 0)))
+        summary = AttendanceSummary.objects.get()
+        self.assertEqual((summary.late_by, summary.early_out_by), (None, timedelta(hours=1)))
+
+        # Resending the same batch changes nothing
+        response = self._post([{'rfid_no': 'CARD0', 'attendance_date': '2024-04-03T17:00:00'}])
+        self.assertEqual(response.json()['duplicates'], 1)
+
+    def test_new_cards_are_resolved_without_restart(self):
+        get_rfid_map()
+        user = User.objects.create(name='newcomer', email='newcomer@example.com')
+        # Simulates a card issued by another process, which this process never hears about
+        Employee.objects.bulk_create([Employee(employee_id='P9', employee_name=user, rfid_code='CARD9')])
+
+        response = self._post([{'rfid_no': 'CARD9', 'attendance_date': '2024-04-03T09:00:00'}])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Attendance.objects.get().employee.employee_id, 'P9')
+
+
+class ShiftDerivationTestCase(TestCase):
+    def setUp(self):
+        invalidate_holiday_calendar()
+        user = User.objects.create(name='shift', email='shift@example.com')
+        self.employee = Employee.objects.create(employee_id='S1', employee_name=user)
+        self.day = date(2024, 4, 3)
+
+    def _punch(self, hour, minute=0, day=None):
+        return Attendance.objects.create(employee=self.employee, attendance_date=local(day or self.day, hour, minute))
+
+    def test_late_punches_update_a_derived_day(self):
+        self._punch(9, 45)
+        self._punch(16, 30)
+        # Saving a punch no longer derives anything on the request path
+        self.assertFalse(ShiftInOut.objects.exists())
+
+        call_command('derive_shifts', stdout=StringIO())
+        shift = ShiftInOut.objects.get()
+        self.assertEqual((shift.attendance_day, shift.in_time, shift.out_time), (self.day, time(9, 45), time(16, 30)))
+        summary = AttendanceSummary.objects.get()
+        self.assertEqual((summary.late_by, summary.early_out_by), (timedelta(minutes=45), timedelta(hours=1, minutes=30)))
+
+        # An earlier tap and a later one arrive after the day was derived
+        first_in = self._punch(9, 5)
+        self._punch(18, 10)
+        call_command('derive_shifts', stdout=StringIO())
+
+        shift = ShiftInOut.objects.get()
+        self.assertEqual((shift.attendance, shift.in_time, shift.out_time), (first_in, time(9, 5), time(18, 10)))
+        summary = AttendanceSummary.objects.get()
+        self.assertEqual((summary.late_by, summary.early_out_by), (None, None))
+
+    def test_only_days_touched_since_the_watermark_are_processed(self):
+        self._punch(9, 0)
+        self._punch(17, 0)
+        self.assertEqual(derive_incremental(), (1, 1))
+
+        next_day = self.day + timedelta(days=1)
+        self._punch(9, 0, day=next_day)
+        self._punch(17, 0, day=next_day)
+        # The watermark overlap would pick up everything saved within the last minutes
+        Attendance.objects.filter(attendance_day=self.day).update(
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(derive_incremental(), (1, 1))
+        self.assertEqual(derive_incremental(full=True), (2, 2))
+        self.assertEqual(ShiftInOut.objects.count(), 2)
+        self.assertEqual(AttendanceSummary.objects.count(), 2)
+
+    def test_deleted_punches_rederive_their_day(self):
+        self._punch(9, 0)
+        early_out = self._punch(16, 30)
+        last_out = self._punch(17, 0)
+        derive_incremental()
+        self.assertEqual(ShiftInOut.objects.get().out_time, time(17, 0))
+        # Keep the day out of the watermark overlap, so only the delete can bring it back
+        Attendance.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+        last_out.delete()
+        self.assertEqual(derive_incremental(), (1, 1))
+        self.assertEqual(ShiftInOut.objects.get().out_time, time(16, 30))
+        self.assertEqual(AttendanceSummary.objects.get().early_out_by, timedelta(hours=1, minutes=30))
+
+        Attendance.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        early_out.delete()
+        self.assertEqual(derive_incremental(), (1, 0))
+        self.assertFalse(ShiftInOut.objects.exists())
+        self.assertFalse(AttendanceSummary.objects.exists())
+
+    def test_punches_store_their_local_day_and_time(self):
+        # 20:30 UTC is 02:30 the next morning in Asia/Dhaka
+        punch = Attendance.objects.create(
+            employee=self.employee, attendance_date=datetime(2024, 4, 2, 20, 30, tzinfo=dt_timezone.utc)
+        )
+        self.assertEqual((punch.attendance_day, punch.attendance_time), (self.day, time(2, 30)))
+
+        punch.attendance_date = local(self.day, 9, 15)
+        punch.save(update_fields=['attendance_date'])
+        punch.refresh_from_db()
+        self.assertEqual((punch.attendance_day, punch.attendance_time), (self.day, time(9, 15)))
+
+    def test_bulk_writes_keep_the_local_day_in_step(self):
+        punch = self._punch(9, 0)
+        next_day = self.day + timedelta(days=1)
+
+        Attendance.objects.filter(pk=punch.pk).update(attendance_date=local(next_day, 9, 30))
+        punch.refresh_from_db()
+        self.assertEqual((punch.attendance_day, punch.attendance_time), (next_day, time(9, 30)))
+
+        punch.attendance_date = local(self.day, 10, 0)
+        Attendance.objects.bulk_update([punch], ['attendance_date'])
+        punch.refresh_from_db()
+        self.assertEqual((punch.attendance_day, punch.attendance_time), (self.day, time(10, 0)))
+
+        with self.assertRaises(ValueError):
+            Attendance.objects.update(attendance_date=F('created_at'))
+
+    def test_queryset_writes_mark_their_day_changed(self):
+        punch = self._punch(9, 0)
+        self._punch(17, 0)
+        derive_incremental()
+        Attendance.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+        Attendance.objects.filter(pk=punch.pk).update(attendance_date=local(self.day, 9, 40))
+        self.assertEqual(derive_incremental(), (1, 1))
+        self.assertEqual(ShiftInOut.objects.get().in_time, time(9, 40))
+
+        Attendance.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        punch.attendance_date = local(self.day, 9, 10)
+        Attendance.objects.bulk_update([punch], ['attendance_date'])
+        self.assertEqual(derive_incremental(), (1, 1))
+        self.assertEqual(ShiftInOut.objects.get().in_time, time(9, 10))
+
+    def test_arriving_early_and_leaving_late_drops_the_summary(self):
+        self._punch(10, 0)
+        self._punch(17, 0)
+        derive_incremental()
+        self.assertTrue(AttendanceSummary.objects.exists())
+
+        self._punch(8, 30)
+        self._punch(19, 0)
+        derive_incremental()
+        self.assertFalse(AttendanceSummary.objects.exists())
+
+
+class MonthlyAttendanceSummaryTestCase(TestCase):
+    def setUp(self):
+        self.employees = []
+        for index in range(4):
+            user = User.objects.create(name=f'team{index}', email=f'team{index}@example.com')
+            self.employees.append(Employee.objects.create(employee_id=f'T{index}', employee_name=user))
+        self.manager = self.employees[0]
+        for employee in self.employees[1:]:
+            Supervisor.objects.create(employee=employee, supervisor=self.manager, level=1)
+        # Supervised at two levels by the same manager; must not be counted twice
+        Supervisor.objects.create(employee=self.employees[1], supervisor=self.manager, level=2)
+
+        for employee, day, late_minutes in [
+            (self.employees[1], date(2024, 4, 3), 30),
+            (self.employees[1], date(2024, 4, 4), 45),
+            (self.employees[1], date(2023, 4, 4), 60),
+            (self.employees[2], date(2024, 4, 10), 0),
+            (self.employees[2], date(2024, 5, 1), 25),
+        ]:
+            attendance = Attendance.objects.create(employee=employee, attendance_date=local(day, 9))
+            AttendanceSummary.objects.create(
+                employee=employee, attendance=attendance,
+                late_by=timedelta(minutes=late_minutes) if late_minutes else None,
+                early_out_by=timedelta(minutes=10),
+            )
+
+    def test_supervisor_totals_for_one_month_of_one_year(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/attendance/supervisor/T0/4/', {'year': 2024})
+
+        self.assertEqual(response.status_code, 200)
+        totals = {row['employee']: row for row in response.json()}
+        self.assertEqual(set(totals), {employee.pk for employee in self.employees[1:]})
+        first = totals[self.employees[1].pk]
+        self.assertEqual((first['total_attendance_days'], first['total_late_by'], first['total_early_out_by']),
+                         (2, '01:15:00', '00:20:00'))
+        second = totals[self.employees[2].pk]
+        self.assertEqual((second['total_attendance_days'], second['total_late_by']), (1, '00:00:00'))
+        self.assertEqual(totals[self.employees[3].pk]['total_attendance_days'], 0)
+
+    def test_employee_totals_and_bad_input(self):
+        response = self.client.get('/attendance/employee/T1/4/', {'year': 2023})
+        self.assertEqual(response.json()['total_late_by'], '01:00:00')
+
+        self.assertEqual(self.client.get('/attendance/employee/T1/13/').status_code, 400)
+        self.assertEqual(self.client.get('/attendance/supervisor/T0/4/', {'year': 'last'}).status_code, 400)
+        self.assertEqual(self.client.get('/attendance/supervisor/NOPE/4/').status_code, 404)
+
+
+class DailyAttendanceSummaryTestCase(TestCase):
+    url = '/attendance/supervisor/D0/'
+
+    def setUp(self):
+        self.employees = []
+        for index in range(3):
+            user = User.objects.create(name=f'daily{index}', email=f'daily{index}@example.com')
+            self.employees.append(Employee.objects.create(employee_id=f'D{index}', employee_name=user))
+        for employee in self.employees[1:]:
+            Supervisor.objects.create(employee=employee, supervisor=self.employees[0], level=1)
+
+        self.days = [date(2024, 4, day) for day in (1, 2, 3)]
+        for day in self.days:
+            for employee in self.employees[1:]:
+                attendance = Attendance.objects.create(employee=employee, attendance_date=local(day, 9, 30))
+                AttendanceSummary.objects.create(
+                    employee=employee, attendance=attendance, late_by=timedelta(minutes=30)
+                )
+
+    def test_pages_follow_attendance_date_then_id(self):
+        seen = []
+        url = self.url + '?limit=4'
+        while url:
+            with self.assertNumQueries(2):
+                body = self.client.get(url).json()
+            seen.extend(body['results'])
+            url = body['next']
+
+        self.assertEqual(len(seen), 6)
+        self.assertEqual([row['attendance_date'][:10] for row in seen], ['2024-04-01'] * 2 + ['2024-04-02'] * 2 + ['2024-04-03'] * 2)
+        self.assertEqual(seen[0]['late_by'], '0:30:00')
+        self.assertEqual(seen[0]['early_out_by'], '00:00:00')
+
+    def test_date_bounds_and_streaming(self):
+        body = self.client.get(self.url, {'from': '2024-04-02', 'to': '2024-04-02'}).json()
+        self.assertEqual(len(body['results']), 2)
+        self.assertIsNone(body['next'])
+
+        response = self.client.get(self.url, {'from': '2024-04-02', 'stream': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['employee'] for line in lines], [employee.pk for employee in self.employees[1:]] * 2)
+
+    def test_bad_input(self):
+        self.assertEqual(self.client.get(self.url, {'from': 'April'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'cursor': 'garbage'}).status_code, 404)
+        self.assertEqual(self.client.get('/attendance/supervisor/NOPE/').status_code, 404)
+
+
+class AttendanceListPaginationTestCase(TestCase):
+    url = '/attendance/api/attendance/'
+
+    def setUp(self):
+        user = User.objects.create(name='pager', email='pager@example.com')
+        employee = Employee.objects.create(employee_id='PG0', employee_name=user)
+        same_time = local(date(2024, 4, 2), 9)
+        self.punches = [
+            Attendance.objects.create(employee=employee, attendance_date=local(date(2024, 4, 1), 9)),
+            Attendance.objects.create(employee=employee, attendance_date=same_time),
+            Attendance.objects.create(rfid_no='A', attendance_date=same_time),
+            Attendance.objects.create(employee=employee, attendance_date=local(date(2024, 4, 3), 9)),
+            Attendance.objects.create(rfid_no='B'),
+            Attendance.objects.create(rfid_no='C'),
+        ]
+
+    def test_pages_newest_first_with_undated_rows_where_the_database_sorts_nulls(self):
+        seen = []
+        url = self.url + '?limit=2'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                body = self.client.get(url).json()
+            self.assertNotIn('NULLS', queries[-1]['sql'])
+            self.assertLessEqual(len(body['results']), 2)
+            seen.extend(row['id'] for row in body['results'])
+            url = body['next']
+
+        p = self.punches
+        dated = [p[3].pk, p[1].pk, p[2].pk, p[0].pk]
+        undated = [p[4].pk, p[5].pk]
+        # Descending, NULLs come first where the database sorts them as the largest values
+        expected = undated + dated if connection.features.nulls_order_largest else dated + undated
+        self.assertEqual(seen, expected)
+
+    def test_default_page_size_applies(self):
+        body = self.client.get(self.url).json()
+        self.assertEqual(len(body['results']), 6)
+        self.assertIsNone(body['next'])
+
+
+class AdjustmentApprovalBatchTestCase(TestCase):
+    url = '/attendance/api/adjustment-approval/bulk-decide/'
+
+    def setUp(self):
+        names = ['manager', 'director', 'first', 'second']
+        self.people = {}
+        for name in names:
+            user = User.objects.create(name=f'adj-{name}', email=f'adj-{name}@example.com')
+            self.people[name] = Employee.objects.create(employee_id=f'ADJ-{name}', employee_name=user)
+        for name in ('first', 'second'):
+            Supervisor.objects.create(employee=self.people[name], supervisor=self.people['manager'], level=1)
+        Supervisor.objects.create(employee=self.people['first'], supervisor=self.people['director'], level=2)
+
+        self.adjustments = {}
+        for name in ('first', 'second'):
+            with self.assertNumQueries(3):
+                # Insert, the supervisor chain lookup and one bulk insert of the chain
+                self.adjustments[name] = AttendanceAdjustment.objects.create(
+                    employee=self.people[name], adjustment_type='traffic_delay'
+                )
+
+    def _approval(self, name, level):
+        return AdjustmentApproval.objects.get(adjustment_request=self.adjustments[name], level=level)
+
+    def _post(self, rows):
+        return self.client.post(self.url, rows, content_type='application/json')
+
+    def test_chains_follow_supervisor_levels(self):
+        self.assertEqual(
+            list(self.adjustments['first'].employee_approvals.order_by('level').values_list('level', 'status')),
+            [(1, 'pending'), (2, 'pending')]
+        )
+        self.assertEqual(self.adjustments['second'].employee_approvals.count(), 1)
+
+    def test_batch_moves_each_adjustment(self):
+        response = self._post({'decisions': [
+            {'id': self._approval('first', 1).pk, 'status': 'approved'},
+            {'id': self._approval('second', 1).pk, 'status': 'rejected', 'comments': 'No delay reported'},
+        ]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['adjustment_request'], row['request_status']) for row in response.json()['decided']],
+            [(self.adjustments['first'].pk, 'pending_L2'), (self.adjustments['second'].pk, 'rejected')]
+        )
+        second = AttendanceAdjustment.objects.get(pk=self.adjustments['second'].pk)
+        self.assertEqual(second.status, 'rejected')
+        self.assertIsNotNone(second.approved_at)
+        self.assertEqual(self._approval('second', 1).comments, 'No delay reported')
+
+        # Deciding level 2 one row at a time goes through the same engine
+        final = self._approval('first', 2)
+        final.status = 'approved'
+        final.save()
+        self.assertEqual(AttendanceAdjustment.objects.get(pk=self.adjustments['first'].pk).status, 'approved')
+
+    def test_already_decided_rows_are_reported(self):
+        self._post([{'id': self._approval('second', 1).pk, 'status': 'approved'}])
+
+        response = self._post([
+            {'id': self._approval('second', 1).pk, 'status': 'rejected'},
+            {'id': 0, 'status': 'approved'},
+            {'id': self._approval('first', 2).pk, 'status': 'maybe'},
+            {'id': self._approval('first', 2).pk, 'status': 'approved'},
+        ])
 
-# Create your tests here.
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [0, 1, 2])
+        first = AttendanceAdjustment.objects.get(pk=self.adjustments['first'].pk)
+        self.assertEqual(first.status, 'approved')
+        self.assertEqual(self._approval('first', 1).status, 'approved')
@@ -1,17 +1,57 @@
 from django.shortcuts import render
 from .models import Attendance, AttendanceAdjustment, AdjustmentApproval, ShiftInOut, AttendanceSummary
 from .serializers import AttendanceSerializer, AttendanceAdjustmentSerializer, AdjustmentApprovalSerializer, ShiftInOutSerializer, AttendanceSummarySerializer
-from rest_framework import viewsets
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
 # Create your views here.
 from employee.models import Employee
-from leave_management.models import Supervisor
+from leave_management.hierarchy import parse_depth, team_members
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from datetime import date
+import calendar
+import json
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+from leave.pagination import KeysetPagination
+from .ingest import PunchIngestor
+from .approvals import ADJUSTMENT_APPROVALS, AdjustmentApprovalBatch
 
 class AttendanceViewSet(viewsets.ModelViewSet):
     queryset = Attendance.objects.all()
     serializer_class = AttendanceSerializer
+    # Newest punches first; served by attendance_date_id_idx
+    keyset_ordering = ('-attendance_date', 'id')
+
+    @action(detail=False, methods=['post'], url_path='punches')
+    def punches(self, request):
+        """
+        Ingest a batch of raw RFID punches: [{"rfid_no": ..., "attendance_date": ...}, ...]
+
+        Punches are stored in one insert; shifts and summaries for the touched days are
+        derived once the batch is committed. Rows that fail are reported by index.
+        """
+        rows = request.data.get('punches') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not rows:
+            return Response({'error': 'Expected a non-empty list of punches'}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = PunchIngestor(rows).run()
+        if not result.errors:
+            response_status = status.HTTP_201_CREATED
+        elif result.created or result.duplicates:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+
+        return Response({
+            'received': len(rows),
+            'created': result.created,
+            'duplicates': result.duplicates,
+            'errors': result.errors,
+        }, status=response_status)
     
 class AttendanceAdjustmentViewSet(viewsets.ModelViewSet):
     queryset = AttendanceAdjustment.objects.all()
@@ -21,6 +61,30 @@ class AdjustmentApprovalViewSet(viewsets.ModelViewSet):
     queryset = AdjustmentApproval.objects.all()
     serializer_class = AdjustmentApprovalSerializer
 
+    @action(detail=False, methods=['post'], url_path='bulk-decide')
+    def bulk_decide(self, request):
+        """
+        Approve or reject many adjustment approvals at once: [{"id": ..., "status": "approved", "comments": ...}, ...]
+
+        Same contract as the leave approval bulk-decide endpoint.
+        """
+        rows = request.data.get('decisions') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not rows:
+            return Response({'error': 'Expected a non-empty list of decisions'}, status=status.HTTP_400_BAD_REQUEST)
+
+        decided, errors = AdjustmentApprovalBatch(rows).run()
+        if not errors:
+            response_status = status.HTTP_200_OK
+        elif decided:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+
+        return Response({
+            'decided': [ADJUSTMENT_APPROVALS.describe(approval) for approval in decided],
+            'errors': errors,
+        }, status=response_status)
+
 class ShiftInOutViewSet(viewsets.ModelViewSet):
     queryset = ShiftInOut.objects.all()
     serializer_class = ShiftInOutSerializer
@@ -29,96 +93,131 @@ class AttendanceSummaryViewSet(viewsets.ModelViewSet):
     queryset = AttendanceSummary.objects.all()
     serializer_class = AttendanceSummarySerializer
 
+def seconds_to_hms(seconds):
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = int(seconds % 60)
+    return f"{hours:02}:{minutes:02}:{secs:02}"
+
+
+def parse_year_month(request, month_serial):
+    """Year from ?year= (defaults to the current year) and the month from the URL"""
+    try:
+        year = int(request.query_params.get('year', timezone.localdate().year))
+    except ValueError:
+        return None
+    if not 1 <= month_serial <= 12 or not 1 <= year <= 9999:
+        return None
+    return year, month_serial
+
+
+def parse_optional_date(value):
+    return date.fromisoformat(value) if value else None
+
+
+def monthly_attendance_totals(employees, year, month):
+    """
+    Attendance days and total late/early-out time per employee for one month.
+
+    Everything is aggregated in a single grouped query over the (employee, attendance_day)
+    index, so the cost does not grow with the number of employees or years of history.
+    """
+    first_day = date(year, month, 1)
+    last_day = date(year, month, calendar.monthrange(year, month)[1])
+    in_month = Q(attendance_semployee__attendance_day__gte=first_day, attendance_semployee__attendance_day__lte=last_day)
+
+    rows = employees.select_related('employee_name').annotate(
+        total_attendance_days=Count('attendance_semployee', filter=in_month),
+        total_late_by=Sum('attendance_semployee__late_by', filter=in_month),
+        total_early_out_by=Sum('attendance_semployee__early_out_by', filter=in_month),
+    ).order_by('pk')
+
+    return [{
+        "employee": employee.id,
+        "employee_name": str(employee),
+        "total_attendance_days": employee.total_attendance_days,
+        "total_late_by": seconds_to_hms(employee.total_late_by.total_seconds() if employee.total_late_by else 0),
+        "total_early_out_by": seconds_to_hms(employee.total_early_out_by.total_seconds() if employee.total_early_out_by else 0),
+    } for employee in rows]
+
+
 class EmployeeMonthlyAttendanceSummaryView(APIView):
     def get(self, request, employee_id, month_serial, *args, **kwargs):
         employee = get_object_or_404(Employee, employee_id=employee_id)
-        summaries = AttendanceSummary.objects.filter(
-            employee=employee,
-            attendance__attendance_date__month=month_serial
-        )
+        year_month = parse_year_month(request, month_serial)
+        if year_month is None:
+            return Response({"error": "Invalid year or month"}, status=status.HTTP_400_BAD_REQUEST)
 
-        total_attendance_days = summaries.count()
-        total_late_by = sum([s.late_by.total_seconds() if s.late_by else 0 for s in summaries])
-        total_early_out_by = sum([s.early_out_by.total_seconds() if s.early_out_by else 0 for s in summaries])
-
-        def seconds_to_hms(seconds):
-            hours = int(seconds // 3600)
-            minutes = int((seconds % 3600) // 60)
-            secs = int(seconds % 60)
-            return f"{hours:02}:{minutes:02}:{secs:02}"
-
-        return Response({
-            "employee": employee.id,
-            "employee_name": str(employee),
-            "total_attendance_days": total_attendance_days,
-            "total_late_by": seconds_to_hms(total_late_by),
-            "total_early_out_by": seconds_to_hms(total_early_out_by),
-        })
+        return Response(monthly_attendance_totals(Employee.objects.filter(pk=employee.pk), *year_month)[0])
 
 class SupervisorMonthlyAttendanceSummaryView(APIView):
     def get(self, request, supervisor_employee_id, month_serial, *args, **kwargs):
-        supervisor = Employee.objects.get(employee_id=supervisor_employee_id)
-        supervisor_entries = Supervisor.objects.filter(supervisor=supervisor)
+        supervisor = get_object_or_404(Employee, employee_id=supervisor_employee_id)
+        year_month = parse_year_month(request, month_serial)
+        if year_month is None:
+            return Response({"error": "Invalid year or month"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            depth = parse_depth(request.query_params.get('depth'))
+        except ValueError:
+            return Response({"error": 'Invalid depth. Use a positive number or "all"'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # A subquery rather than a join, so several supervision levels don't multiply the sums
+        supervised_employees = team_members(supervisor, depth).filter(status='active')
+        return Response(monthly_attendance_totals(supervised_employees, *year_month))
+    
+def daily_summary_row(summary):
+    return {
+        "employee": summary.employee_id,
+        "employee_name": str(summary.employee),
+        "attendance_date": summary.attendance.attendance_date,
+        "late_by": str(summary.late_by) if summary.late_by else "00:00:00",
+        "early_out_by": str(summary.early_out_by) if summary.early_out_by else "00:00:00",
+    }
+
 
-        if not supervisor_entries.exists():
-            return []
+class SupervisorDailyAttendanceSummaryView(APIView):
+    """
+    Daily attendance summaries of a supervisor's active team, oldest first.
 
-        employee_ids = [entry.employee.employee_id for entry in supervisor_entries]
+    Optional ?from= and ?to= (YYYY-MM-DD) bound the days returned. Results are keyset
+    paginated on (attendance_date, id); pass ?stream=ndjson to stream every matching row
+    as newline-delimited JSON instead. ?depth= widens the team to indirect reports (a number
+    of levels, or "all"); the default of 1 is the direct team.
+    """
+    pagination_class = KeysetPagination
+    keyset_ordering = ('attendance__attendance_date', 'id')
 
-        supervised_employees = Employee.objects.filter(
-            employee_id__in=employee_ids,
-            status='active'
-        )
-        data = []
+    def get(self, request, supervisor_employee_id, *args, **kwargs):
+        supervisor = get_object_or_404(Employee, employee_id=supervisor_employee_id)
+
+        try:
+            from_date = parse_optional_date(request.query_params.get('from'))
+            to_date = parse_optional_date(request.query_params.get('to'))
+        except ValueError:
+            return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            depth = parse_depth(request.query_params.get('depth'))
+        except ValueError:
+            return Response({"error": 'Invalid depth. Use a positive number or "all"'}, status=status.HTTP_400_BAD_REQUEST)
 
-        for employee in supervised_employees:
-            summaries = AttendanceSummary.objects.filter(
-                employee__employee_id=employee.employee_id,
-                attendance__attendance_date__month=month_serial
+        summaries = AttendanceSummary.objects.filter(
+            employee__in=team_members(supervisor, depth).filter(status='active'),
+            attendance__isnull=False,
+            attendance__attendance_date__isnull=False
+        ).select_related('attendance', 'employee__employee_name')
+        if from_date:
+            summaries = summaries.filter(attendance_day__gte=from_date)
+        if to_date:
+            summaries = summaries.filter(attendance_day__lte=to_date)
+
+        if request.query_params.get('stream') == 'ndjson':
+            rows = summaries.order_by(*self.keyset_ordering).iterator(chunk_size=1000)
+            return StreamingHttpResponse(
+                (json.dumps(daily_summary_row(summary), cls=JSONEncoder) + "\n" for summary in rows),
+                content_type='application/x-ndjson'
             )
-            total_attendance_days = summaries.count()
-            total_late_by = sum([s.late_by.total_seconds() if s.late_by else 0 for s in summaries])
-            total_early_out_by = sum([s.early_out_by.total_seconds() if s.early_out_by else 0 for s in summaries])
-
-            def seconds_to_hms(seconds):
-                hours = int(seconds // 3600)
-                minutes = int((seconds % 3600) // 60)
-                secs = int(seconds % 60)
-                return f"{hours:02}:{minutes:02}:{secs:02}"
-
-            data.append({
-                "employee": employee.id,
-                "employee_name": str(employee),
-                "total_attendance_days": total_attendance_days,
-                "total_late_by": seconds_to_hms(total_late_by),
-                "total_early_out_by": seconds_to_hms(total_early_out_by),
-            })
-        return Response(data)
-    
-class SupervisorDailyAttendanceSummaryView(APIView):
-    def get(self, request, supervisor_employee_id, *args, **kwargs):
-        supervisor = Employee.objects.get(employee_id=supervisor_employee_id)
-        supervisor_entries = Supervisor.objects.filter(supervisor=supervisor)
-
-        if not supervisor_entries.exists():
-            return []
-
-        employee_ids = [entry.employee.employee_id for entry in supervisor_entries]
-
-        supervised_employees = Employee.objects.filter(
-            employee_id__in=employee_ids,
-            status='active'
-        )
-        data = []
-
-        for employee in supervised_employees:
-            summaries = AttendanceSummary.objects.filter(employee=employee)
-            for summary in summaries:
-                data.append({
-                    "employee": employee.id,
-                    "employee_name": str(employee),
-                    "attendance_date": summary.attendance.attendance_date,
-                    "late_by": str(summary.late_by) if summary.late_by else "00:00:00",
-                    "early_out_by": str(summary.early_out_by) if summary.early_out_by else "00:00:00",
-                })
-        return Response(data)
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(summaries, request, view=self)
+        return paginator.get_paginated_response([daily_summary_row(summary) for summary in page])
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employee', '0002_initial'),
+        ('leave_management', '0010_supervisor_closure'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['status', 'leave_group'], name='employee_status_group_idx'),
+        ),
+    ]
@@ -5,6 +5,8 @@ from django.db.models.signals import pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 
+from leave.instrumentation import instrument
+
 
 class Department(models.Model):
     name = models.CharField(max_length=100, blank=True, null=True)
@@ -137,12 +139,20 @@ class Employee(models.Model):
     resign_date = models.DateField(null=True, blank=True, verbose_name="Resigned / Terminated Date")
     resign_reason = models.TextField(blank=True, verbose_name="Resigned / Terminated Reason")
 
+    class Meta:
+        indexes = [
+            # Active employees of a leave group, as listed by the balance reports
+            models.Index(fields=['status', 'leave_group'], name='employee_status_group_idx'),
+        ]
+
     def __str__(self):
         return str(self.employee_name) if self.employee_name else f"Employee {self.employee_id or 'Unknown'}"
 
 
 @receiver(pre_save, sender=Employee)
+@instrument
 def set_employee_dates(sender, instance, **kwargs):
+    from leave_management.config_cache import get_leave_group
     from leave_management.models import LeaveGroup
 
     if instance.joining_date:
@@ -153,10 +163,10 @@ def set_employee_dates(sender, instance, **kwargs):
         try:
             if instance.employment_type == 'general_probation':
                 instance.employment_type = 'general_regular'
-                instance.leave_group = LeaveGroup.objects.get(name='general_regular')
+                instance.leave_group = get_leave_group('general_regular')
             elif instance.employment_type == 'teacher_probation':
                 instance.employment_type = 'teacher_regular'
-                instance.leave_group = LeaveGroup.objects.get(name='teachers_regular')
+                instance.leave_group = get_leave_group('teachers_regular')
         except LeaveGroup.DoesNotExist:
             # Handle case where LeaveGroup doesn't exist
             pass
\ No newline at end of file
@@ -24,12 +24,30 @@ class BranchSerializer(serializers.ModelSerializer):
         model = Branch
         fields = '__all__'
 
-# --- Section: Official Information ---
+# --- Sections ---
+from django.db.models import Prefetch
+from leave_management.models import Supervisor
 from leave_management.serializers import SupervisorSerializer
 
-class OfficialInfoSerializer(serializers.ModelSerializer):
+class SectionSerializer(serializers.ModelSerializer):
+    """One section of the employee record; only_fields narrows it to some of its fields"""
+
+    def __init__(self, *args, only_fields=None, **kwargs):
+        self.only_fields = only_fields
+        super().__init__(*args, **kwargs)
+
+    def get_field_names(self, declared_fields, info):
+        names = super().get_field_names(declared_fields, info)
+        if self.only_fields is None:
+            return names
+        # Fields left out here are never built
+        return [name for name in names if name in self.only_fields]
+
+# --- Section: Official Information ---
+class OfficialInfoSerializer(SectionSerializer):
     probation_period = serializers.IntegerField(default=3)
-    supervisors = SupervisorSerializer(many=True, read_only=True)
+    # The Supervisor rows naming this employee, as the list and the approval chains read them
+    supervisors = SupervisorSerializer(source='supervised_employees', many=True, read_only=True)
     
     class Meta:
         model = Employee
@@ -41,7 +59,7 @@ class OfficialInfoSerializer(serializers.ModelSerializer):
         ]
 
 # --- Section: Personal Information ---
-class PersonalInfoSerializer(serializers.ModelSerializer):
+class PersonalInfoSerializer(SectionSerializer):
     class Meta:
         model = Employee
         fields = [
@@ -52,24 +70,110 @@ class PersonalInfoSerializer(serializers.ModelSerializer):
         ]
 
 # --- Section: Access & Permissions ---
-class AccessPermissionsSerializer(serializers.ModelSerializer):
+class AccessPermissionsSerializer(SectionSerializer):
     class Meta:
         model = Employee
         fields = ['system_access', 'security_clearance']
 
 # --- Section: Work Preferences ---
-class WorkPreferenceSerializer(serializers.ModelSerializer):
+class WorkPreferenceSerializer(SectionSerializer):
     class Meta:
         model = Employee
         fields = ['shift_preference']
 
 # --- Section: Optional Info ---
-class OptionalInfoSerializer(serializers.ModelSerializer):
+class OptionalInfoSerializer(SectionSerializer):
     class Meta:
         model = Employee
         fields = ['bank_details', 'resign_date', 'resign_reason']
 
+EMPLOYEE_SECTIONS = {
+    'official_info': OfficialInfoSerializer,
+    'personal_info': PersonalInfoSerializer,
+    'access_permissions': AccessPermissionsSerializer,
+    'work_preferences': WorkPreferenceSerializer,
+    'optional_info': OptionalInfoSerializer,
+}
+
+def _split(value):
+    return [item.strip() for item in value.split(',') if item.strip()] if value else []
+
+def parse_employee_selection(query_params):
+    """
+    Sections and fields requested with ?sections= and ?fields= (comma separated).
+
+    Returns None when everything is wanted, otherwise {section: set of fields, or None
+    for the whole section}. A field pulls in its own section with just the fields named.
+    """
+    sections = _split(query_params.get('sections'))
+    fields = _split(query_params.get('fields'))
+    if not sections and not fields:
+        return None
+
+    unknown = [name for name in sections if name not in EMPLOYEE_SECTIONS]
+    if unknown:
+        raise serializers.ValidationError({'sections': [f'Unknown section: {name}' for name in unknown]})
+
+    selection = {name: None for name in sections}
+    section_of = {
+        field: section
+        for section, section_class in EMPLOYEE_SECTIONS.items()
+        for field in section_class.Meta.fields
+    }
+    unknown = [name for name in fields if name not in section_of and name != 'id']
+    if unknown:
+        raise serializers.ValidationError({'fields': [f'Unknown field: {name}' for name in unknown]})
+    for name in fields:
+        section = section_of.get(name)
+        if section and (section not in selection or selection[section] is not None):
+            selection.setdefault(section, set()).add(name)
+    return selection
+
+def supervisors_prefetch():
+    return Prefetch(
+        'supervised_employees',
+        queryset=Supervisor.objects.select_related('supervisor__employee_name', 'employee__employee_name')
+    )
+
+class SupervisorSummarySerializer(serializers.Serializer):
+    employee_id = serializers.CharField(source='supervisor.employee_id', default=None)
+    name = serializers.CharField(source='supervisor.employee_name.name', default=None)
+    level = serializers.IntegerField()
+
+class EmployeeListSerializer(serializers.ModelSerializer):
+    """Flat, read-only row for employee listings; load rows with setup_queryset()"""
+    employee_name = serializers.CharField(source='employee_name.name', default=None, read_only=True)
+    designation = serializers.CharField(source='designation.title', default=None, read_only=True)
+    department = serializers.CharField(source='department.name', default=None, read_only=True)
+    location = serializers.CharField(source='location.name', default=None, read_only=True)
+    supervisors = SupervisorSummarySerializer(source='supervised_employees', many=True, read_only=True)
+
+    class Meta:
+        model = Employee
+        fields = [
+            'id', 'employee_id', 'employee_name', 'email_id', 'designation', 'department',
+            'location', 'leave_group', 'employment_type', 'joining_date', 'status', 'supervisors'
+        ]
+        read_only_fields = fields
+
+    @staticmethod
+    def setup_queryset(queryset):
+        """Only the listed columns, with names joined in and supervisors in one extra query"""
+        return queryset.select_related('employee_name', 'designation', 'department', 'location').only(
+            'id', 'employee_id', 'email_id', 'leave_group_id', 'employment_type', 'joining_date', 'status',
+            'employee_name__name', 'designation__title', 'department__name', 'location__name',
+        ).prefetch_related(Prefetch(
+            'supervised_employees',
+            queryset=Supervisor.objects.select_related('supervisor__employee_name').only(
+                'id', 'employee_id', 'level', 'supervisor__employee_id', 'supervisor__employee_name__name'
+            )
+        ))
+
 class EmployeeSerializer(serializers.ModelSerializer):
+    """
+    The full employee record in sections. Pass `selection` (see parse_employee_selection)
+    to build and render only some sections or fields.
+    """
     official_info = OfficialInfoSerializer(source='*', read_only=True)
     personal_info = PersonalInfoSerializer(source='*', read_only=True)
     access_permissions = AccessPermissionsSerializer(source='*', read_only=True)
@@ -87,6 +191,40 @@ class EmployeeSerializer(serializers.ModelSerializer):
             'optional_info'
         ]
 
+    def __init__(self, *args, selection=None, **kwargs):
+        self.selection = selection
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        if self.selection is None:
+            return super().get_fields()
+        fields = {'id': serializers.IntegerField(read_only=True)}
+        for name, section_class in EMPLOYEE_SECTIONS.items():
+            if name in self.selection:
+                fields[name] = section_class(source='*', read_only=True, only_fields=self.selection[name])
+        return fields
+
+    @staticmethod
+    def setup_queryset(queryset, selection=None):
+        """Load only the columns the selected sections render, and their supervisors in one query"""
+        if selection is None:
+            return queryset.prefetch_related(supervisors_prefetch())
+
+        columns = {'id'}
+        wants_supervisors = False
+        for section, names in selection.items():
+            for name in names or EMPLOYEE_SECTIONS[section].Meta.fields:
+                if name == 'supervisors':
+                    wants_supervisors = True
+                    continue
+                field = Employee._meta.get_field(name)
+                if field.concrete and not field.many_to_many:
+                    columns.add(field.name)
+        queryset = queryset.only(*columns)
+        if wants_supervisors:
+            queryset = queryset.prefetch_related(supervisors_prefetch())
+        return queryset
+
     def create(self, validated_data):
         return Employee.objects.create(**validated_data)
 
@@ -1,3 +1,115 @@
 from django.test import TestCase
 
-# Create your tests here.
+from employee.models import Department, Designation, Employee
+from leave_management.models import Supervisor
+from users.models import User
+
+
+class EmployeeListTestCase(TestCase):
+    url = '/employee/employees/'
+
+    def setUp(self):
+        department = Department.objects.create(name='Engineering')
+        designation = Designation.objects.create(title='Engineer')
+        self.employees = []
+        for index in range(12):
+            user = User.objects.create(name=f'staff{index}', email=f'staff{index}@example.com')
+            self.employees.append(Employee.objects.create(
+                employee_id=f'S{index:02d}', employee_name=user,
+                department=department, designation=designation,
+            ))
+        lead, head = self.employees[:2]
+        for employee in self.employees[2:]:
+            Supervisor.objects.create(employee=employee, supervisor=lead, level=1)
+            Supervisor.objects.create(employee=employee, supervisor=head, level=2)
+
+    def test_rows_are_flat_and_paginated(self):
+        body = self.client.get(self.url, {'limit': 5}).json()
+        self.assertEqual([row['employee_id'] for row in body['results']], ['S00', 'S01', 'S02', 'S03', 'S04'])
+        row = body['results'][2]
+        self.assertEqual(
+            {key: row[key] for key in ('employee_name', 'department', 'designation', 'location')},
+            {'employee_name': 'staff2', 'department': 'Engineering', 'designation': 'Engineer', 'location': None}
+        )
+        self.assertEqual(row['supervisors'], [
+            {'employee_id': 'S00', 'name': 'staff0', 'level': 1},
+            {'employee_id': 'S01', 'name': 'staff1', 'level': 2},
+        ])
+
+        seen = []
+        url = self.url + '?limit=5'
+        while url:
+            body = self.client.get(url).json()
+            seen.extend(row['employee_id'] for row in body['results'])
+            url = body['next']
+        self.assertEqual(seen, [employee.employee_id for employee in self.employees])
+
+    def test_detail_reads_the_same_supervisors_as_the_list(self):
+        listed = self.client.get(self.url, {'limit': 3}).json()['results'][2]['supervisors']
+        for params in ({}, {'fields': 'supervisors'}):
+            body = self.client.get(self.url + 'S02/', params).json()
+            self.assertEqual(
+                [row['level'] for row in body['official_info']['supervisors']], [row['level'] for row in listed]
+            )
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        # The page itself and the supervisors prefetch
+        with self.assertNumQueries(2):
+            self.client.get(self.url, {'limit': 3})
+        with self.assertNumQueries(2):
+            body = self.client.get(self.url, {'limit': 1000}).json()
+        self.assertEqual(len(body['results']), 12)
+
+
+class EmployeeSectionSelectionTestCase(TestCase):
+    url = '/employee/employees/'
+
+    def setUp(self):
+        user = User.objects.create(name='sections', email='sections@example.com')
+        self.employee = Employee.objects.create(
+            employee_id='SEC1', employee_name=user, bank_details='secret', personal_mobile='0170000000'
+        )
+        boss = Employee.objects.create(
+            employee_id='SEC0', employee_name=User.objects.create(name='boss', email='boss@example.com')
+        )
+        Supervisor.objects.create(employee=self.employee, supervisor=boss, level=1)
+
+    def test_sections_limit_the_record(self):
+        body = self.client.get(self.url + 'SEC1/', {'sections': 'official_info'}).json()
+        self.assertEqual(set(body), {'id', 'official_info'})
+        self.assertEqual(body['official_info']['employee_id'], 'SEC1')
+        self.assertEqual(len(body['official_info']['supervisors']), 1)
+        self.assertEqual(body['official_info']['supervisors'][0]['supervisor'], str(Employee.objects.get(employee_id='SEC0')))
+
+        body = self.client.get(self.url + 'SEC1/').json()
+        self.assertEqual(body['optional_info']['bank_details'], 'secret')
+
+    def test_fields_pick_columns_across_sections(self):
+        body = self.client.get(self.url + 'SEC1/', {'fields': 'employee_id,personal_mobile'}).json()
+        self.assertEqual(body, {
+            'id': self.employee.pk,
+            'official_info': {'employee_id': 'SEC1'},
+            'personal_info': {'personal_mobile': '0170000000'},
+        })
+
+        # No supervisors asked for, so no prefetch
+        with self.assertNumQueries(1):
+            body = self.client.get(self.url, {'sections': 'work_preferences', 'fields': 'status'}).json()
+        self.assertEqual(body['results'][0], {
+            'id': self.employee.pk,
+            'official_info': {'status': 'active'},
+            'work_preferences': {'shift_preference': ''},
+        })
+
+    def test_only_the_needed_columns_are_loaded(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url + 'SEC1/', {'fields': 'employee_id'})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('bank_details', queries[0]['sql'])
+
+    def test_unknown_names_are_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'sections': 'salary_info'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url + 'SEC1/', {'fields': 'password'}).status_code, 400)
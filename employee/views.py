@@ -1,7 +1,7 @@
 from django.shortcuts import render
 from rest_framework import viewsets
 from .models import Department, Designation, Nominee, Branch, Employee
-from .serializers import DepartmentSerializer, DesignationSerializer, NomineeSerializer, BranchSerializer, EmployeeSerializer
+from .serializers import DepartmentSerializer, DesignationSerializer, NomineeSerializer, BranchSerializer, EmployeeSerializer, EmployeeListSerializer, parse_employee_selection
 from rest_framework.response import Response
 
 # Create your views here.
@@ -27,10 +27,21 @@ class EmployeeViewSet(viewsets.ModelViewSet):
     lookup_field = 'employee_id'  # This is the key line you were missing
 
     def list(self, request):
-        """GET /employee/api/employees/ - Get all employees"""
-        employees = Employee.objects.all()
-        serializer = EmployeeSerializer(employees, many=True)
-        return Response(serializer.data)
+        """
+        GET /employee/api/employees/ - Employees a page at a time (?limit=, ?cursor=)
+
+        Rows are flat summaries unless ?sections= or ?fields= asks for parts of the full record.
+        """
+        selection = parse_employee_selection(request.query_params)
+        if selection is None:
+            employees = EmployeeListSerializer.setup_queryset(Employee.objects.all())
+            page = self.paginate_queryset(employees)
+            serializer = EmployeeListSerializer(page, many=True)
+        else:
+            employees = EmployeeSerializer.setup_queryset(Employee.objects.all(), selection)
+            page = self.paginate_queryset(employees)
+            serializer = EmployeeSerializer(page, many=True, selection=selection)
+        return self.get_paginated_response(serializer.data)
     
     def create(self, request):
         """POST /employee/api/employees/ - Create a new employee"""
@@ -44,8 +55,9 @@ class EmployeeViewSet(viewsets.ModelViewSet):
         """GET /employee/api/employees/{employee_id}/ - Get single employee by employee_id"""
         try:
             # pk will contain the employee_id value due to lookup_field setting
-            employee = Employee.objects.get(employee_id=employee_id)
-            serializer = EmployeeSerializer(employee)
+            selection = parse_employee_selection(request.query_params)
+            employee = EmployeeSerializer.setup_queryset(Employee.objects.all(), selection).get(employee_id=employee_id)
+            serializer = EmployeeSerializer(employee, selection=selection)
             return Response(serializer.data)
         except Employee.DoesNotExist:
             return Response({'error': 'Employee not found'}, status=404)
@@ -0,0 +1,204 @@
+"""
+Endpoint benchmarks over synthetic organisations.
+
+Every GET route in leave/urls.py (admin, API roots and format-suffix variants aside) is
+requested against an organisation built by `OrgGenerator`, at each requested size. For
+each URL the query count, median wall time and peak Python memory (tracemalloc, on an
+extra request) are recorded.
+Process and response caches are cleared before every request, so each measurement is a
+cold request and query counts are comparable between runs.
+
+`run_benchmarks` returns a plain dict that is written as JSON with sorted keys, so two
+result files can be diffed directly or with `compare`.
+"""
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, reverse
+
+from attendence.ingest import invalidate_rfid_map
+from leave_management import config_cache
+from leave_management.holiday_calendar import invalidate_holiday_calendar
+
+from .synthetic import OrgGenerator
+
+
+DEFAULT_SCALES = (20, 100, 300)
+BENCHMARK_MONTH = 6
+# Wall time changes below this ratio are treated as noise by `compare`
+WALL_TIME_TOLERANCE = 1.5
+
+
+def get_routes(patterns=None, prefix=''):
+    """(url name, route, URLPattern) of every GET endpoint, depth first"""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    for pattern in patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            if not route.startswith('admin/'):
+                yield from get_routes(pattern.url_patterns, route)
+            continue
+        if pattern.name in (None, 'api-root') or 'format' in pattern.pattern.regex.groupindex:
+            continue
+        actions = getattr(pattern.callback, 'actions', None)
+        view_class = getattr(pattern.callback, 'view_class', None)
+        if actions is not None and 'get' not in actions:
+            continue
+        if actions is None and not hasattr(view_class, 'get'):
+            continue
+        yield pattern.name, route, pattern
+
+
+class EndpointBenchmark:
+    """Builds concrete URLs for the routes of one generated organisation and measures them"""
+
+    def __init__(self, org, repeat=3):
+        self.org = org
+        self.repeat = repeat
+        self.client = Client()
+        self.query_params = {
+            'leaveapproval-inbox': {'supervisor': org.head.employee_id},
+            'leave-balance-all': {'year': org.year},
+            'employee-leave-balance-detail': {'year': org.year},
+            'supervisor-employee-leave-balance': {'year': org.year},
+            'employee-monthly-attendance-summary': {'year': org.year},
+            'supervisor-monthly-attendance-summary': {'year': org.year},
+            'supervisor-daily-attendance-summary': {
+                'from': f'{org.year}-{BENCHMARK_MONTH:02d}-01', 'to': f'{org.year}-{BENCHMARK_MONTH:02d}-28'
+            },
+        }
+
+    def url_kwargs(self, pattern):
+        """Path arguments for a route, or None when there is nothing to point it at"""
+        kwargs = {}
+        view_class = getattr(pattern.callback, 'cls', None)
+        lookup_field = getattr(view_class, 'lookup_field', None)
+        lookup_kwarg = getattr(view_class, 'lookup_url_kwarg', None) or lookup_field
+        # A member of the head's team, so per-employee views have attendance and leave to show
+        employee = self.org.employees[1]
+        for name in pattern.pattern.regex.groupindex:
+            if view_class is not None and name == lookup_kwarg:
+                instance = view_class.queryset.model.objects.order_by('pk').first()
+                if instance is None:
+                    return None
+                kwargs[name] = getattr(instance, lookup_field)
+            elif name == 'employee_id':
+                kwargs[name] = employee.employee_id
+            elif name in ('supervisor_id', 'supervisor_employee_id'):
+                kwargs[name] = self.org.head.employee_id
+            elif name == 'month_serial':
+                kwargs[name] = BENCHMARK_MONTH
+            else:
+                return None
+        return kwargs
+
+    def measure(self, url, params):
+        samples = []
+        for _ in range(self.repeat):
+            reset_caches()
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params)
+            samples.append((response.status_code, len(queries), time.perf_counter() - started))
+
+        # Measured on a separate request, since tracing allocations slows them down
+        reset_caches()
+        tracemalloc.start()
+        self.client.get(url, params)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {
+            'status': samples[-1][0],
+            'queries': samples[-1][1],
+            'wall_ms': round(statistics.median(sample[2] for sample in samples) * 1000, 2),
+            'peak_kib': round(peak / 1024, 1),
+        }
+
+    def run(self):
+        results = {}
+        for name, route, pattern in get_routes():
+            kwargs = self.url_kwargs(pattern)
+            if kwargs is None:
+                results[name] = {'route': route, 'skipped': 'no sample arguments'}
+                continue
+            url = reverse(name, kwargs=kwargs)
+            results[name] = {'route': route, 'url': url, **self.measure(url, self.query_params.get(name, {}))}
+        return results
+
+
+def reset_caches():
+    config_cache.invalidate_config_cache()
+    invalidate_holiday_calendar()
+    invalidate_rfid_map()
+    for alias in caches:
+        caches[alias].clear()
+
+
+def row_counts():
+    from attendence.models import Attendance, AttendanceSummary
+    from employee.models import Employee
+    from leave_management.models import LeaveApproval, LeaveRequest, Supervisor
+
+    return {
+        model.__name__: model.objects.count()
+        for model in (Employee, Supervisor, Attendance, AttendanceSummary, LeaveRequest, LeaveApproval)
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scales=DEFAULT_SCALES, days=365, repeat=3, seed=0, log=None):
+    """
+    Generate an organisation of each size in turn and benchmark every endpoint against it.
+
+    The database is flushed before each scale, so this must only run against a scratch
+    database (the management command creates a test database for it).
+    """
+    report = {'revision': git_revision(), 'days': days, 'repeat': repeat, 'seed': seed, 'scales': {}}
+    for employees in scales:
+        call_command('flush', interactive=False, verbosity=0)
+        reset_caches()
+        if log:
+            log(f'Generating {employees} employees...')
+        started = time.perf_counter()
+        org = OrgGenerator(employees=employees, days=days, seed=seed).generate()
+        generated_in = time.perf_counter() - started
+        if log:
+            log(f'Benchmarking endpoints at {employees} employees...')
+        report['scales'][str(employees)] = {
+            'generate_s': round(generated_in, 2),
+            'rows': row_counts(),
+            'endpoints': EndpointBenchmark(org, repeat).run(),
+        }
+    return report
+
+
+def compare(baseline, current):
+    """Lines describing endpoints that got more queries or clearly slower than the baseline"""
+    lines = []
+    for scale, results in current['scales'].items():
+        before = baseline.get('scales', {}).get(scale, {}).get('endpoints', {})
+        for name, result in sorted(results['endpoints'].items()):
+            old = before.get(name)
+            if not old or 'queries' not in old or 'queries' not in result:
+                continue
+            if result['queries'] > old['queries']:
+                lines.append(f"{scale} {name}: {old['queries']} -> {result['queries']} queries")
+            if old['wall_ms'] and result['wall_ms'] > old['wall_ms'] * WALL_TIME_TOLERANCE:
+                lines.append(f"{scale} {name}: {old['wall_ms']} -> {result['wall_ms']} ms")
+    return lines
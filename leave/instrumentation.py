@@ -0,0 +1,140 @@
+"""
+Timing of the model save() methods and signal receivers on the write paths.
+
+Much of the cost of a write is spent in hooks that run inside another request's view or
+a management command (LeaveRequest.save, the approval chain receivers, shift derivation,
+the Employee pre_save receivers), so it never shows up as view time. Functions decorated
+with `instrument` count their calls, errors, wall time and database queries per hook.
+Times and queries are inclusive, so a receiver that runs inside an instrumented save()
+is counted in both.
+
+`metrics` serves the counters, together with the configuration cache statistics, in the
+Prometheus text format at /metrics. Counters are per process: with several workers each
+reports its own, as Prometheus expects of a scrape target. The timing is off unless
+HOOK_METRICS is set. /metrics only answers METRICS_ALLOWED_IPS and staff users, since it
+names internals and the endpoint must not be reachable from outside.
+"""
+import functools
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class HookMetrics:
+    """Calls, errors, seconds and queries per hook name"""
+
+    FIELDS = ('calls', 'errors', 'seconds', 'queries')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hooks = {}
+
+    def record(self, name, seconds, queries, failed):
+        with self._lock:
+            hook = self._hooks.setdefault(name, dict.fromkeys(self.FIELDS, 0))
+            hook['calls'] += 1
+            hook['errors'] += failed
+            hook['seconds'] += seconds
+            hook['queries'] += queries
+
+    def reset(self):
+        with self._lock:
+            self._hooks.clear()
+
+    def stats(self):
+        with self._lock:
+            return {name: dict(hook) for name, hook in sorted(self._hooks.items())}
+
+
+hook_metrics = HookMetrics()
+
+
+def instrument(func=None, *, name=None):
+    """Record every call of the decorated function in `hook_metrics`, under its dotted path by default"""
+    if func is None:
+        return functools.partial(instrument, name=name)
+    hook = name or f'{func.__module__}.{func.__qualname__}'
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not getattr(settings, 'HOOK_METRICS', False):
+            return func(*args, **kwargs)
+
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        failed = True
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(count_query))
+                result = func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            hook_metrics.record(hook, time.perf_counter() - started, queries, failed)
+
+    return wrapper
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _family(lines, metric, kind, help_text, samples):
+    lines.append(f'# HELP {metric} {help_text}')
+    lines.append(f'# TYPE {metric} {kind}')
+    for labels, value in samples:
+        label_text = ','.join(f'{key}="{_label(label)}"' for key, label in labels.items())
+        lines.append(f'{metric}{{{label_text}}} {value}')
+
+
+def render_prometheus():
+    from leave_management.config_cache import cache_stats
+
+    hooks = hook_metrics.stats()
+    lines = []
+    for field, kind, help_text in (
+        ('calls', 'calls_total', 'Calls of an instrumented save() or signal receiver'),
+        ('errors', 'errors_total', 'Calls that raised'),
+        ('seconds', 'seconds_total', 'Wall time spent in the hook, including nested hooks'),
+        ('queries', 'queries_total', 'Database queries run by the hook, including nested hooks'),
+    ):
+        _family(lines, f'leave_hook_{kind}', 'counter', help_text, [
+            ({'hook': name}, round(hook[field], 6) if field == 'seconds' else hook[field])
+            for name, hook in hooks.items()
+        ])
+
+    config = cache_stats()
+    _family(lines, 'leave_config_cache_hits_total', 'counter', 'Configuration cache hits',
+            [({'entry': name}, entry['hits']) for name, entry in config.items()])
+    _family(lines, 'leave_config_cache_misses_total', 'counter', 'Configuration cache loads from the database',
+            [({'entry': name}, entry['misses']) for name, entry in config.items()])
+    _family(lines, 'leave_config_cache_cached', 'gauge', 'Whether the entry is currently cached',
+            [({'entry': name}, int(entry['cached'])) for name, entry in config.items()])
+    return '\n'.join(lines) + '\n'
+
+
+def may_scrape(request):
+    if request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ()):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_active and user.is_staff)
+
+
+def metrics(request):
+    if not may_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
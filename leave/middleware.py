@@ -0,0 +1,151 @@
+"""
+Per-request SQL profiling.
+
+With QUERY_PROFILING on, QueryProfilingMiddleware records every query a request runs
+(through connection.execute_wrapper, so DEBUG is not needed) and:
+
+* adds an `X-Query-Count` header and a `Server-Timing` header with the database and
+  total time, which browser dev tools show next to the request;
+* groups the queries by normalized SQL (literals, placeholders and IN lists collapsed)
+  and flags any statement run QUERY_PROFILING_REPEAT_THRESHOLD times or more, the mark of
+  a per-row loop (N+1);
+* writes one JSON line per request to the `leave.queries` logger, at WARNING when
+  something was flagged;
+* checks QUERY_BUDGETS, the most queries allowed per URL name. An endpoint over its
+  budget is logged, or with QUERY_BUDGET_STRICT raises QueryBudgetExceeded, which the
+  test client re-raises so the test fails.
+
+Streaming responses send their headers before the body runs its queries, so they get no
+headers; they are logged once the body has been consumed.
+
+QUERY_PROFILING_SAMPLE_RATE profiles only that fraction of requests, for production.
+"""
+import json
+import logging
+import random
+import re
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger('leave.queries')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def normalize_sql(sql):
+    """The shape of a statement, so the same query with other values groups together"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """execute_wrapper that keeps the SQL and duration of every query run through it"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.queries)
+
+    def repeated(self, threshold):
+        """Statements run at least `threshold` times, most frequent first"""
+        groups = {}
+        for sql, duration in self.queries:
+            group = groups.setdefault(normalize_sql(sql), {'count': 0, 'duration': 0.0})
+            group['count'] += 1
+            group['duration'] += duration
+        return [
+            {'sql': sql, 'count': group['count'], 'db_ms': round(group['duration'] * 1000, 2)}
+            for sql, group in sorted(groups.items(), key=lambda item: -item[1]['count'])
+            if group['count'] >= threshold
+        ]
+
+
+class QueryProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_PROFILING', False):
+            return self.get_response(request)
+        if random.random() >= getattr(settings, 'QUERY_PROFILING_SAMPLE_RATE', 1.0):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+            if response.streaming and not response.is_async:
+                # The body runs its queries while it is iterated, after the headers are sent
+                response.streaming_content = self._profile_stream(
+                    response.streaming_content, stack.pop_all(), request, response, recorder, started
+                )
+                return response
+        total = time.perf_counter() - started
+
+        count = len(recorder.queries)
+        response['X-Query-Count'] = str(count)
+        response['Server-Timing'] = (
+            f'db;dur={recorder.duration * 1000:.2f};desc="{count} queries", total;dur={total * 1000:.2f}'
+        )
+        self._report(request, response, recorder, total)
+        return response
+
+    def _profile_stream(self, content, stack, request, response, recorder, started):
+        with stack:
+            yield from content
+        self._report(request, response, recorder, time.perf_counter() - started)
+
+    def _report(self, request, response, recorder, total):
+        count = len(recorder.queries)
+        match = request.resolver_match
+        view = match.url_name if match else None
+        budget = getattr(settings, 'QUERY_BUDGETS', {}).get(view)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'queries': count,
+            'db_ms': round(recorder.duration * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'repeated': recorder.repeated(getattr(settings, 'QUERY_PROFILING_REPEAT_THRESHOLD', 10)),
+        }
+        if response.streaming:
+            record['streaming'] = True
+        over_budget = budget is not None and count > budget
+        if over_budget:
+            record['budget'] = budget
+        logger.log(
+            logging.WARNING if record['repeated'] or over_budget else logging.INFO,
+            json.dumps(record, sort_keys=True),
+        )
+
+        if over_budget and getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            repeated = ''.join(f"\n  {group['count']}x {group['sql']}" for group in record['repeated'])
+            raise QueryBudgetExceeded(f'{view} ran {count} queries, over its budget of {budget}{repeated}')
@@ -0,0 +1,154 @@
+"""
+Keyset (seek) pagination.
+
+Pages are addressed by the ordering values of the last row served rather than by an
+offset, so fetching page 500 costs the same indexed range scan as fetching page 1 and rows
+inserted meanwhile never shift or repeat a page. The ordering must end in a unique field
+(usually "id") so every row has a distinct position.
+"""
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connections
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a multi-column ordering such as ('attendance_date', 'id').
+
+    Views set `keyset_ordering` (fields may be prefixed with "-" and span relations) and
+    otherwise page by id; the page size can be changed per request with ?limit= up to
+    `max_page_size`. The ORDER BY carries no NULLS FIRST/LAST, so a plain index on the
+    ordering serves it on every backend; NULLs stay where the database sorts them (as the
+    largest values on PostgreSQL, the smallest on SQLite) and cursors follow suit.
+    """
+    ordering = ('id',)
+    page_size = api_settings.PAGE_SIZE or 100
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, view):
+        return tuple(getattr(view, 'keyset_ordering', None) or self.ordering)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(view)
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        self.nulls_largest = connections[queryset.db].features.nulls_order_largest
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self._after(position))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = self._position(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_first_link(self):
+        return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+
+    # Cursor encoding
+
+    def _fields(self):
+        return [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    def _position(self, row):
+        values = []
+        for name, _ in self._fields():
+            value = row
+            for part in name.split(LOOKUP_SEP):
+                value = value.get(part) if isinstance(value, dict) else getattr(value, part, None)
+            values.append(value)
+        return values
+
+    def encode_cursor(self, position):
+        payload = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value for value in position])
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if not isinstance(raw, list) or len(raw) != len(self.ordering):
+                raise ValueError
+            return [
+                None if value is None else self._model_field(model, name).to_python(value)
+                for (name, _), value in zip(self._fields(), raw)
+            ]
+        except (TypeError, ValueError, UnicodeDecodeError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def _model_field(model, name):
+        parts = name.split(LOOKUP_SEP)
+        for part in parts[:-1]:
+            model = model._meta.get_field(part).related_model
+        field = model._meta.get_field(parts[-1])
+        # Foreign keys are stored in the cursor by their raw id
+        return field.target_field if field.is_relation else field
+
+    def _beyond(self, name, descending, value):
+        """Rows whose value for one field sorts strictly after the given one"""
+        nulls_at_end = descending != self.nulls_largest
+        if value is None:
+            # Past the NULLs at the end there is nothing; past those at the start, every value
+            return Q(pk__in=[]) if nulls_at_end else Q(**{f'{name}__isnull': False})
+        beyond = Q(**{f'{name}__lt' if descending else f'{name}__gt': value})
+        if nulls_at_end:
+            beyond |= Q(**{f'{name}__isnull': True})
+        return beyond
+
+    def _after(self, position):
+        """Rows strictly after the given position: (a > x) | (a = x & b > y) | ..."""
+        clauses = []
+        equal = Q()
+        for (name, descending), value in zip(self._fields(), position):
+            clauses.append(equal & self._beyond(name, descending, value))
+            equal &= Q(**{f'{name}__isnull': True}) if value is None else Q(**{name: value})
+        return reduce(or_, clauses)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 # AUTH_USER_MODEL = 'users.User'
 
@@ -61,6 +62,9 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
     'rest_framework.permissions.AllowAny',
     ),
+    # Keyset pagination on every list; views pick their ordering with `keyset_ordering`
+    'DEFAULT_PAGINATION_CLASS': 'leave.pagination.KeysetPagination',
+    'PAGE_SIZE': 100,
 
 }
 
@@ -73,6 +77,8 @@ REST_FRAMEWORK = {
 # }
 
 MIDDLEWARE = [
+    # First, so it sees every query and times the whole request
+    'leave.middleware.QueryProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -113,6 +119,76 @@ DATABASES = {
 }
 
 
+# Cache
+# Local memory by default (and in tests). Set CACHE_URL to a redis:// URL to share the
+# cache between processes; any Redis-protocol server works and needs the redis package.
+
+CACHE_URL = os.environ.get('CACHE_URL')
+
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'leave',
+        }
+    }
+
+# Leave balance responses (see leave_management/balance_cache.py)
+LEAVE_BALANCE_CACHE = 'default'
+LEAVE_BALANCE_CACHE_TIMEOUT = int(os.environ.get('LEAVE_BALANCE_CACHE_TIMEOUT', 300))
+# Seconds between checks for configuration changes made by other processes
+# (see leave_management/config_cache.py)
+CONFIG_CACHE_SYNC_INTERVAL = 1.0
+
+
+# Query profiling (see leave/middleware.py)
+# QUERY_PROFILING=1 adds X-Query-Count and Server-Timing headers and logs every profiled
+# request to the `leave.queries` logger; QUERY_PROFILING_SAMPLE_RATE limits it to a
+# fraction of requests in production.
+
+QUERY_PROFILING = os.environ.get('QUERY_PROFILING') == '1'
+QUERY_PROFILING_SAMPLE_RATE = float(os.environ.get('QUERY_PROFILING_SAMPLE_RATE', 1.0))
+# Same statement this many times in one request is reported as a likely N+1
+QUERY_PROFILING_REPEAT_THRESHOLD = 10
+# URL name -> most queries the endpoint may run; over budget raises with QUERY_BUDGET_STRICT
+QUERY_BUDGETS = {}
+QUERY_BUDGET_STRICT = False
+
+# HOOK_METRICS=1 counts calls, time and queries of instrumented save()s and signal
+# receivers, served at /metrics (see leave/instrumentation.py)
+HOOK_METRICS = os.environ.get('HOOK_METRICS') == '1'
+# /metrics answers only these addresses (comma-separated) and logged-in staff users
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Background jobs (see leave_management/jobs.py)
+# JOB_QUEUE=1 defers approval chains, leave transfers and shift derivation to the
+# `run_jobs` worker instead of running them inside the write's transaction.
+JOB_QUEUE = os.environ.get('JOB_QUEUE') == '1'
+JOB_MAX_ATTEMPTS = 5
+# Seconds before the first retry; doubled for every further attempt
+JOB_RETRY_DELAY = 30
+# Seconds after which a running job is assumed abandoned and claimed again
+JOB_LOCK_TIMEOUT = 600
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'leave.queries': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
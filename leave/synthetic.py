@@ -0,0 +1,307 @@
+"""
+Synthetic organisation for benchmarks and load tests.
+
+`OrgGenerator` fills a database with a deterministic organisation (same seed, same data):
+the leave groups and policies of the `leave_type` command, departments, designations and
+branches, a supervisor tree with levels 1-3, public holidays, a year of punches on working
+days, approved and pending leave requests with their approval chains, and the rows derived
+from them (ledger, supervisor closure and, optionally, shifts and summaries).
+
+By default rows are written with bulk_create, and punches, the bulk of the data, with
+plain executemany INSERTs, so no model signals fire and the derived tables are rebuilt
+once at the end. With `signals=True` employees, supervisors, holidays and leave requests
+are saved one by one instead, so every receiver runs as it would for API writes.
+"""
+import random
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from attendence.derivation import derive_incremental
+from attendence.models import Attendance
+from employee.models import Branch, Department, Designation, Employee
+from leave_management import hierarchy, ledger
+from leave_management.approvals import LEAVE_APPROVALS
+from leave_management.holiday_calendar import get_holiday_calendar, invalidate_holiday_calendar
+from leave_management.models import LeaveApproval, LeavePolicy, LeaveRequest, Supervisor, holiday
+from users.models import User
+
+
+BATCH_SIZE = 2000
+
+# employment_type -> leave group, as set_employee_dates assigns them after confirmation
+EMPLOYMENT_GROUPS = {
+    'general_regular': 'general_regular',
+    'general_probation': 'general_probation',
+    'teacher_regular': 'teachers_regular',
+    'teacher_probation': 'teachers_probation',
+}
+
+DEPARTMENTS = ['Administration', 'Accounts', 'Human Resources', 'IT', 'Science', 'Humanities', 'Operations']
+DESIGNATIONS = ['Officer', 'Senior Officer', 'Executive', 'Lecturer', 'Assistant Professor', 'Professor']
+BRANCHES = ['Dhaka', 'Chattogram', 'Khulna', 'Rajshahi', 'Sylhet']
+
+# (month, day, name) of fixed-date public holidays
+PUBLIC_HOLIDAYS = [
+    (2, 21, 'Language Martyrs Day'),
+    (3, 17, 'Birthday of the Father of the Nation'),
+    (3, 26, 'Independence Day'),
+    (4, 14, 'Bengali New Year'),
+    (5, 1, 'May Day'),
+    (12, 16, 'Victory Day'),
+    (12, 25, 'Christmas Day'),
+]
+
+# (local hour, +/- minutes) around which the in and out punches of a working day fall
+PUNCH_WINDOWS = ((9, 40), (18, 60))
+
+
+def insert_rows(model, field_names, rows, batch_size=BATCH_SIZE):
+    """
+    INSERT value tuples for `field_names` with executemany, without building model instances.
+
+    Values are converted with each field's get_db_prep_save, so aware datetimes, dates and
+    foreign key ids are stored exactly as the ORM would store them. Conversions are
+    memoised per column, since generated columns repeat a small set of values; that is
+    most of the speed-up over bulk_create. Returns the row count.
+    """
+    db = connections[router.db_for_write(model)]
+    fields = [model._meta.get_field(name) for name in field_names]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        db.ops.quote_name(model._meta.db_table),
+        ', '.join(db.ops.quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    converted = [{} for _ in fields]
+
+    def prepare(row):
+        values = []
+        for field, cache, value in zip(fields, converted, row):
+            try:
+                values.append(cache[value])
+            except KeyError:
+                cache[value] = prepared = field.get_db_prep_save(value, db)
+                values.append(prepared)
+        return values
+
+    count = 0
+    batch = []
+    with db.cursor() as cursor:
+        for row in rows:
+            batch.append(prepare(row))
+            if len(batch) >= batch_size:
+                cursor.executemany(sql, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+            count += len(batch)
+    return count
+
+
+class OrgGenerator:
+    """
+    Builds an organisation of `employees` people in a tree where everyone but the head
+    reports to one manager with up to `team_size` direct reports. Each employee gets a
+    Supervisor row for each of their nearest `levels` managers.
+    """
+
+    def __init__(self, employees=100, team_size=8, levels=3, year=None, days=365,
+                 leave_requests=2, seed=0, prefix='E', signals=False, derive=True):
+        self.employee_count = employees
+        self.team_size = team_size
+        self.levels = levels
+        self.year = year or date.today().year - 1
+        self.days = days
+        self.leave_requests = leave_requests
+        self.random = random.Random(seed)
+        self.prefix = prefix
+        self.signals = signals
+        self.derive = derive
+        self.employees = []
+        # employee id -> Supervisor rows ordered by level, as create_chains takes them
+        self.supervisors = {}
+        self.holidays = set()
+        self.counts = {}
+
+    @property
+    def head(self):
+        return self.employees[0]
+
+    def manager_index(self, index):
+        return (index - 1) // self.team_size if index else None
+
+    def generate(self):
+        call_command('leave_type', stdout=StringIO())
+        self.create_reference_data()
+        self.create_employees()
+        self.create_supervisors()
+        self.create_holidays()
+        self.create_attendance()
+        self.create_leave_requests()
+        return self
+
+    def _create(self, model, objects):
+        """bulk_create, or save() each object so its signals fire"""
+        if not self.signals:
+            objects = model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+        else:
+            for instance in objects:
+                instance.save()
+        self.counts[model.__name__] = self.counts.get(model.__name__, 0) + len(objects)
+        return objects
+
+    def _reuse(self, model, field, values, build):
+        """One row per value of `field`: the existing row when there is one, else a new one from build(value)"""
+        existing = {}
+        for instance in model.objects.filter(**{f'{field}__in': values}).order_by('pk'):
+            existing.setdefault(getattr(instance, field), instance)
+        created = iter(self._create(model, [build(value) for value in values if value not in existing]))
+        return [existing[value] if value in existing else next(created) for value in values]
+
+    def create_reference_data(self):
+        # Shared by every org generated into the database, whatever its prefix
+        self.departments = self._reuse(Department, 'name', DEPARTMENTS, lambda name: Department(name=name))
+        self.designations = self._reuse(Designation, 'title', DESIGNATIONS, lambda title: Designation(title=title))
+        self.branches = self._reuse(Branch, 'name', BRANCHES, lambda name: Branch(name=name, location=name))
+
+    def create_employees(self):
+        users = self._create(User, [
+            User(name=f'{self.prefix}{index:06d}', email=f'{self.prefix.lower()}{index:06d}@example.com')
+            for index in range(self.employee_count)
+        ])
+
+        employees = []
+        for index, user in enumerate(users):
+            employment_type = self.random.choices(list(EMPLOYMENT_GROUPS), weights=(6, 1, 3, 1))[0]
+            joining_date = date(self.year, 1, 1) - timedelta(days=self.random.randint(30, 3650))
+            employees.append(Employee(
+                employee_id=f'{self.prefix}{index:06d}',
+                employee_name=user,
+                employment_type=employment_type,
+                leave_group_id=EMPLOYMENT_GROUPS[employment_type],
+                department=self.random.choice(self.departments),
+                designation=self.random.choice(self.designations),
+                location=self.random.choice(self.branches),
+                joining_date=joining_date,
+                # What set_employee_dates stores for the default 3 month probation
+                confirmation_date=joining_date + timedelta(days=90),
+                rfid_code=f'{self.prefix}C{index:06d}',
+            ))
+        self.employees = self._create(Employee, employees)
+
+    def create_supervisors(self):
+        rows = []
+        for index, employee in enumerate(self.employees):
+            manager = self.manager_index(index)
+            level = 1
+            while manager is not None and level <= self.levels:
+                rows.append(Supervisor(employee=employee, supervisor=self.employees[manager], level=level))
+                manager = self.manager_index(manager)
+                level += 1
+        self._create(Supervisor, rows)
+        for row in rows:
+            self.supervisors.setdefault(row.employee_id, []).append(row)
+        if not self.signals:
+            hierarchy.rebuild()
+
+    def create_holidays(self):
+        names = {date(self.year, month, day): name for month, day, name in PUBLIC_HOLIDAYS}
+        self._reuse(holiday, 'from_date', list(names), lambda day: holiday(
+            name=names[day], from_date=day, to_date=day, days_count=1
+        ))
+        self.holidays = set(names)
+        invalidate_holiday_calendar()
+
+    def working_days(self):
+        first = date(self.year, 1, 1)
+        for offset in range(self.days):
+            day = first + timedelta(days=offset)
+            if day.year == self.year and day.weekday() < 5 and day not in self.holidays:
+                yield day
+
+    def punch_slots(self, day):
+        """(instant, local day, local time) of every possible in and out punch minute on `day`"""
+        tz = timezone.get_current_timezone()
+        slots = []
+        for hour, spread in PUNCH_WINDOWS:
+            start = datetime.combine(day, time(hour))
+            window = []
+            for minutes in range(-spread, spread + 1):
+                local = start + timedelta(minutes=minutes)
+                window.append((local.replace(tzinfo=tz).astimezone(dt_timezone.utc), local.date(), local.time()))
+            slots.append(window)
+        return slots
+
+    def punches(self):
+        """Attendance rows, an in and an out punch per employee and working day, employee by employee"""
+        now = timezone.now()
+        days = [self.punch_slots(day) for day in self.working_days()]
+        choice = self.random.choice
+        for employee in self.employees:
+            pk, rfid_code = employee.pk, employee.rfid_code
+            for slots in days:
+                for window in slots:
+                    moment, day, moment_time = choice(window)
+                    yield (pk, rfid_code, moment, 'present', now, now, day, moment_time)
+
+    def create_attendance(self):
+        with transaction.atomic():
+            self.counts['Attendance'] = insert_rows(Attendance, [
+                'employee', 'rfid_no', 'attendance_date', 'status', 'created_at', 'updated_at',
+                'attendance_day', 'attendance_time',
+            ], self.punches())
+        if self.derive:
+            derive_incremental(full=True)
+
+    def create_leave_requests(self):
+        policies = {}
+        for policy in LeavePolicy.objects.filter(is_active=True, leave_type__in=['casual', 'medical']):
+            policies.setdefault(policy.leave_group_id, []).append(policy)
+        working_days = list(self.working_days())
+        calendar = get_holiday_calendar()
+
+        requests = []
+        for employee in self.employees:
+            for number in range(self.leave_requests):
+                from_date = self.random.choice(working_days)
+                to_date = from_date + timedelta(days=self.random.randint(0, 2))
+                request = LeaveRequest(
+                    employee=employee,
+                    leave_policy=self.random.choice(policies[employee.leave_group_id]),
+                    from_date=from_date,
+                    to_date=to_date,
+                    # The last request of each employee is still waiting on their managers
+                    status='pending_L1' if number == self.leave_requests - 1 else 'approved',
+                )
+                request.days_count = request.calculate_days_count(calendar)
+                requests.append(request)
+
+        if self.signals:
+            # save_base rather than save: full_clean rejects requests dated before the
+            # cut-off, which a year of history mostly is. The approval chain and ledger
+            # receivers still run for each request.
+            for request in requests:
+                request.save_base()
+            self.counts['LeaveRequest'] = len(requests)
+            return
+
+        requests = self._create(LeaveRequest, requests)
+        self._create_approvals(requests)
+        ledger.rebuild()
+
+    def _create_approvals(self, requests):
+        """Pending chains for pending requests, fully approved chains for approved ones"""
+        approved_at = timezone.make_aware(datetime(self.year, 1, 1))
+        approvals = []
+        for request in requests:
+            for supervisor in self.supervisors.get(request.employee_id, []):
+                approval = LEAVE_APPROVALS.chain_entry(request, supervisor)
+                if request.status == 'approved':
+                    approval.status = 'approved'
+                    setattr(approval, LEAVE_APPROVALS.decided_at_field, approved_at)
+                approvals.append(approval)
+        self._create(LeaveApproval, approvals)
@@ -17,6 +17,8 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from .instrumentation import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
 
@@ -24,4 +26,6 @@ urlpatterns = [
     path('employee/', include('employee.urls')),
     path('leave/', include('leave_management.urls')),
     path('attendance/', include('attendence.urls')),
+
+    path('metrics', metrics, name='metrics'),
 ]
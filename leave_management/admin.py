@@ -2,11 +2,12 @@
 
 from django.contrib import admin
 from django.utils import timezone
-from .models import LeaveGroup, Supervisor, LeavePolicy, LeaveRequest, LeaveApproval, LeaveReset, AllowedLeaveTypes, CutOffDate, holiday
+from .models import LeaveGroup, Supervisor, LeavePolicy, LeaveRequest, LeaveApproval, LeaveReset, AllowedLeaveTypes, CutOffDate, holiday, LeaveBalance, BackgroundJob
 from .models import Supervisor
 from employee.models import Employee
 from django import forms
 from .utils import LeaveTransfer
+from . import ledger
 from django.core.exceptions import ValidationError
 
 class HolidayAdmin(admin.ModelAdmin):
@@ -20,6 +21,12 @@ class LeaveResetAdmin(admin.ModelAdmin):
     search_fields = ('is_active', 'created_at', 'updated_at')
     ordering = ('created_at',)
 
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'key', 'status', 'attempts', 'run_after', 'updated_at')
+    list_filter = ('status', 'task')
+    search_fields = ('task', 'key')
+    ordering = ('-id',)
+
 class LeaveGroupAdmin(admin.ModelAdmin):
     list_display = ('name',)
     search_fields = ('name',)
@@ -98,11 +105,16 @@ class LeaveRequestAdmin(admin.ModelAdmin):
     get_leave_type.short_description = 'Leave Type'
 
     def approve_requests(self, request, queryset):
+        employee_ids = set(queryset.values_list('employee_id', flat=True))
         queryset.update(status='approved', approved_at=timezone.now())
+        # Bulk updates skip the ledger signals, so resync the affected employees
+        ledger.rebuild(employee_ids=employee_ids)
     approve_requests.short_description = "Mark selected requests as approved"
 
     def reject_requests(self, request, queryset):
+        employee_ids = set(queryset.values_list('employee_id', flat=True))
         queryset.update(status='rejected', approved_at=timezone.now())
+        ledger.rebuild(employee_ids=employee_ids)
     reject_requests.short_description = "Mark selected requests as rejected"
 
 class LeaveApprovalAdmin(admin.ModelAdmin):
@@ -127,6 +139,22 @@ class LeaveApprovalAdmin(admin.ModelAdmin):
         return obj.leave_request.leave_policy.get_leave_type_display()
     get_leave_type.short_description = 'Leave Type'
 
+class LeaveBalanceAdmin(admin.ModelAdmin):
+    list_display = (
+        'employee',
+        'leave_policy',
+        'period_start',
+        'used_days',
+        'pending_days',
+        'transferred_in',
+        'transferred_out',
+        'updated_at'
+    )
+    list_filter = ('period_start', 'leave_policy__leave_type')
+    search_fields = ('employee__employee_id',)
+    raw_id_fields = ('employee', 'leave_policy')
+    readonly_fields = ('updated_at',)
+
 @admin.register(AllowedLeaveTypes)
 class AllowedLeaveTypesAdmin(admin.ModelAdmin):
     filter_horizontal = ('allowed_types',)
@@ -145,4 +173,6 @@ admin.site.register(LeaveReset, LeaveResetAdmin)
 admin.site.register(LeaveTransfer, LeaveTransferAdmin)
 # admin.site.register(AllowedLeaveTypes, AllowedLeaveTypesAdmin)
 admin.site.register(CutOffDate)
-admin.site.register(holiday, HolidayAdmin)
\ No newline at end of file
+admin.site.register(holiday, HolidayAdmin)
+admin.site.register(LeaveBalance, LeaveBalanceAdmin)
+admin.site.register(BackgroundJob, BackgroundJobAdmin)
\ No newline at end of file
@@ -0,0 +1,287 @@
+"""
+Multi-level approval engine shared by leave requests and attendance adjustments.
+
+Both workflows work the same way: a request gets one pending approval per supervisor
+level, a rejection at any level rejects the request and all of its approvals, and an
+approval at level n approves the pending levels below it and moves the request to
+pending_L{n+1}, or to approved when there is no higher level. `ApprovalWorkflow`
+describes one such workflow (its models and field names plus a few hooks) and carries
+out chain creation and transitions set-based, with a fixed number of queries whatever
+the number of requests.
+
+`ApprovalBatch` applies many {id, status, comments} decisions in one transaction on top
+of it: the decided rows are written with one bulk_update and the workflow moves with a
+handful of UPDATEs. For leave, days_count is never recomputed since a decision cannot
+change the dates.
+"""
+from collections import defaultdict
+from datetime import date
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import config_cache, ledger
+from .models import LeaveApproval, LeaveRequest, Supervisor
+from .serializers import ApprovalDecisionSerializer
+
+
+FINAL_STATUSES = ('approved', 'rejected')
+
+
+class ApprovalWorkflow:
+    """Models, field names and hooks of one multi-level approval workflow"""
+    approval_model = None
+    request_model = None
+    # Foreign key from the approval to the request it decides
+    request_field = None
+    # Timestamp set on the approval when it is decided
+    decided_at_field = None
+    request_label = 'request'
+
+    def request_id(self, approval):
+        return getattr(approval, f'{self.request_field}_id')
+
+    def chain_entry(self, request, supervisor):
+        return self.approval_model(**{
+            self.request_field: request,
+            'supervisor': supervisor,
+            'level': supervisor.level,
+            'status': 'pending',
+        })
+
+    def create_chains(self, requests, supervisors=None):
+        """
+        Insert the pending approval chain of every request in one statement.
+
+        `supervisors` maps employee id -> Supervisor rows ordered by level; it is loaded
+        here when the caller hasn't already got it.
+        """
+        if supervisors is None:
+            supervisors = defaultdict(list)
+            for supervisor in Supervisor.objects.filter(
+                employee_id__in={request.employee_id for request in requests}
+            ).order_by('level'):
+                supervisors[supervisor.employee_id].append(supervisor)
+
+        return self.approval_model.objects.bulk_create([
+            self.chain_entry(request, supervisor)
+            for request in requests
+            for supervisor in supervisors.get(request.employee_id, [])
+        ])
+
+    def create_chain_for(self, request_id):
+        """The chain of one request by id, unless it already has one, so it is safe to retry"""
+        request = self.request_model.objects.filter(pk=request_id).first()
+        if request is None or self.approval_model.objects.filter(**{self.request_field: request}).exists():
+            return []
+        return self.create_chains([request])
+
+    def transition(self, approvals, now=None):
+        """
+        Move the requests of already saved, decided approvals to their next status.
+
+        Each approval must belong to a different request. The request objects attached
+        to the approvals are updated in memory to match the database.
+        """
+        now = now or timezone.now()
+        approvals_of = self.approval_model.objects
+        rejected = [self.request_id(approval) for approval in approvals if approval.status == 'rejected']
+        approved = [approval for approval in approvals if approval.status == 'approved']
+        new_status = {}
+
+        # A rejection at any level rejects the whole request and all of its approvals
+        if rejected:
+            approvals_of.filter(**{f'{self.request_field}_id__in': rejected}).update(
+                status='rejected', **{self.decided_at_field: now}
+            )
+            new_status.update((request_id, 'rejected') for request_id in rejected)
+
+        if approved:
+            # Approving at a level also approves the pending levels below it
+            approvals_of.filter(
+                reduce(or_, (
+                    Q(**{f'{self.request_field}_id': self.request_id(approval), 'level__lt': approval.level})
+                    for approval in approved
+                )),
+                status='pending'
+            ).update(status='approved', **{self.decided_at_field: now})
+
+            levels = set(approvals_of.filter(
+                **{f'{self.request_field}_id__in': [self.request_id(approval) for approval in approved]}
+            ).values_list(f'{self.request_field}_id', 'level'))
+            for approval in approved:
+                next_level = approval.level + 1
+                if (self.request_id(approval), next_level) in levels:
+                    new_status[self.request_id(approval)] = f'pending_L{next_level}'
+                else:
+                    new_status[self.request_id(approval)] = 'approved'
+
+        by_status = defaultdict(list)
+        for request_id, status in new_status.items():
+            by_status[status].append(request_id)
+        for status, request_ids in by_status.items():
+            updates = {'status': status}
+            if status in FINAL_STATUSES:
+                updates['approved_at'] = now
+            self.request_model.objects.filter(pk__in=request_ids).update(**updates)
+
+        requests = []
+        for approval in approvals:
+            request = getattr(approval, self.request_field)
+            if request.pk not in new_status:
+                continue
+            request.status = new_status[request.pk]
+            if request.status in FINAL_STATUSES:
+                request.approved_at = now
+            requests.append(request)
+        self.after_transition(requests)
+        return new_status
+
+    def describe(self, approval):
+        """One row of a bulk-decide response"""
+        return {
+            'id': approval.id,
+            'status': approval.status,
+            self.request_field: self.request_id(approval),
+            'request_status': getattr(approval, self.request_field).status,
+        }
+
+    # Hooks
+
+    def load_context(self):
+        """Anything decisions are validated against, loaded once per batch"""
+        return None
+
+    def check_decision(self, request, context):
+        """An error message when the request can't be decided now, else None"""
+        return None
+
+    def after_transition(self, requests):
+        """Called with the requests whose status changed, since update() sends no signals"""
+
+
+class LeaveApprovalWorkflow(ApprovalWorkflow):
+    approval_model = LeaveApproval
+    request_model = LeaveRequest
+    request_field = 'leave_request'
+    decided_at_field = 'approve_date'
+    request_label = 'leave request'
+
+    def chain_entry(self, request, supervisor):
+        entry = super().chain_entry(request, supervisor)
+        entry.leave_policy = request.leave_policy
+        return entry
+
+    def load_context(self):
+        return config_cache.cutoff_day()
+
+    def check_decision(self, request, cutoff_day):
+        today = date.today()
+        from_date = request.from_date
+        if from_date and today.day > cutoff_day and from_date.month == today.month and from_date.day<=cutoff_day:
+            return f"You cannot approve for leave for dates before or on the {cutoff_day}th of this month after the cutoff date."
+        return None
+
+    def after_transition(self, requests):
+        ledger.record_request_changes(requests)
+
+
+LEAVE_APPROVALS = LeaveApprovalWorkflow()
+
+
+def create_leave_approval_chain(request_id):
+    """Job run for a new leave request when the job queue is on"""
+    LEAVE_APPROVALS.create_chain_for(request_id)
+
+
+class ApprovalBatch:
+    """Validates and applies a batch of {id, status, comments} decisions for one workflow"""
+    workflow = None
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.errors = []
+        self.decided = []
+
+    def run(self):
+        parsed = self._parse_rows()
+        if parsed:
+            with transaction.atomic():
+                # Lock only the approval rows: PostgreSQL refuses FOR UPDATE on the nullable
+                # side of the outer join select_related makes to the request
+                approvals = self.workflow.approval_model.objects.select_for_update(of=('self',)).select_related(
+                    self.workflow.request_field
+                ).in_bulk([data['id'] for _, data in parsed])
+                context = self.workflow.load_context()
+                accepted = self._validate(parsed, approvals, context)
+                if accepted:
+                    self._apply(accepted)
+
+        self.errors.sort(key=lambda error: error['index'])
+        return self.decided, self.errors
+
+    def _parse_rows(self):
+        parsed = []
+        for index, row in enumerate(self.rows):
+            serializer = ApprovalDecisionSerializer(data=row)
+            if serializer.is_valid():
+                parsed.append((index, serializer.validated_data))
+            else:
+                self.errors.append({'index': index, 'errors': serializer.errors})
+        return parsed
+
+    def _reject_row(self, index, message):
+        self.errors.append({'index': index, 'errors': {'non_field_errors': [message]}})
+
+    def _validate(self, parsed, approvals, context):
+        label = self.workflow.request_label
+        accepted = []
+        decided_requests = set()
+        for index, data in parsed:
+            approval = approvals.get(data['id'])
+            if approval is None:
+                self.errors.append({'index': index, 'errors': {'id': [f'Invalid pk "{data["id"]}" - object does not exist.']}})
+                continue
+            request = getattr(approval, self.workflow.request_field)
+            if request is None:
+                self._reject_row(index, f'This approval is not linked to a {label}.')
+                continue
+            if approval.status != 'pending':
+                self._reject_row(index, f'This approval has already been {approval.status}.')
+                continue
+            if request.status in FINAL_STATUSES:
+                self._reject_row(index, f'The {label} has already been {request.status}.')
+                continue
+            if request.pk in decided_requests:
+                self._reject_row(index, f'Another decision in this batch already covers this {label}.')
+                continue
+            message = self.workflow.check_decision(request, context)
+            if message:
+                self._reject_row(index, message)
+                continue
+
+            decided_requests.add(request.pk)
+            accepted.append((approval, data))
+        return accepted
+
+    def _apply(self, accepted):
+        now = timezone.now()
+        decided_at = self.workflow.decided_at_field
+        approvals = []
+        for approval, data in accepted:
+            approval.status = data['status']
+            if 'comments' in data:
+                approval.comments = data['comments']
+            if not getattr(approval, decided_at):
+                setattr(approval, decided_at, now)
+            approvals.append(approval)
+        self.workflow.approval_model.objects.bulk_update(approvals, ['status', 'comments', decided_at])
+        self.workflow.transition(approvals, now)
+        self.decided = approvals
+
+
+class LeaveApprovalBatch(ApprovalBatch):
+    workflow = LEAVE_APPROVALS
@@ -0,0 +1,120 @@
+"""
+Response cache for the leave balance endpoints.
+
+Responses are stored in the Django cache (LEAVE_BALANCE_CACHE alias, see settings.py)
+under a key made of the request scope and version counters:
+
+* one counter per employee, bumped whenever that employee's ledger rows or employee row
+  change;
+* a roster counter, bumped with every employee counter and on supervisor changes, for the
+  responses that cover many employees;
+* a policy counter, bumped when leave policies, groups or reset periods change.
+
+Every write that moves a balance goes through LedgerDelta.apply or ledger.rebuild, which
+report the affected employees here. That covers leave requests, approvals (including bulk
+decisions that bypass signals) and transfers. Old entries are never deleted; they stop
+being addressed and expire. The ETag is derived from the same key, so a client holding a
+current copy gets a 304 from a single cache read without the balance being recomputed.
+"""
+import hashlib
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import config_cache
+
+
+POLICY_VERSION = 'leave-balance:v:policies'
+ROSTER_VERSION = 'leave-balance:v:roster'
+
+BalanceScope = namedtuple('BalanceScope', ['parts', 'version_keys'])
+
+
+def _cache():
+    return caches[getattr(settings, 'LEAVE_BALANCE_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'LEAVE_BALANCE_CACHE_TIMEOUT', 300)
+
+
+def employee_version_key(employee_pk):
+    return f'leave-balance:v:employee:{employee_pk}'
+
+
+def employee_scope(employee_pk, from_date, to_date):
+    return BalanceScope(('employee', employee_pk, from_date, to_date), (POLICY_VERSION, employee_version_key(employee_pk)))
+
+
+def roster_scope(*parts):
+    return BalanceScope(parts, (POLICY_VERSION, ROSTER_VERSION))
+
+
+def _versions(cache, keys):
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        # Start from the clock rather than 1, so a counter that was evicted can never
+        # come back at a value that still addresses stale entries
+        for key in missing:
+            cache.add(key, time.time_ns())
+        found.update(cache.get_many(missing))
+    # A backend that keeps nothing (DummyCache) must never produce a matching ETag
+    return [found.get(key, time.time_ns()) for key in keys]
+
+
+def cached_response(request, scope, compute):
+    """Serve `compute()` from the cache, or a 304 when If-None-Match is still current"""
+    cache = _cache()
+    versions = _versions(cache, scope.version_keys)
+    key = ':'.join(['leave-balance', *map(str, scope.parts), *map(str, versions)])
+    etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    data = cache.get(key)
+    if data is None:
+        # After reading the versions: a policy change they include has already bumped the
+        # configuration generation, so this process cannot compute it with the old policies
+        config_cache.sync_config_cache()
+        data = compute()
+        cache.set(key, data, _timeout())
+    return Response(data, headers=headers)
+
+
+def _bump(keys):
+    cache = _cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns())
+
+
+def _bump_now_and_on_commit(keys):
+    keys = list(keys)
+    _bump(keys)
+    # Again after commit, in case another request cached pre-commit data in between
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def employees_changed(employee_ids):
+    employee_ids = {employee_id for employee_id in employee_ids if employee_id}
+    if employee_ids:
+        _bump_now_and_on_commit([employee_version_key(pk) for pk in employee_ids] + [ROSTER_VERSION])
+
+
+def roster_changed():
+    _bump_now_and_on_commit([ROSTER_VERSION])
+
+
+def policies_changed():
+    _bump_now_and_on_commit([POLICY_VERSION])
@@ -0,0 +1,143 @@
+"""
+Bulk submission of leave requests.
+
+Everything a request is validated against (cut-off day, employees, policies, each
+employee's last approved request, the allowed-sequence map and the supervisor chain) is
+loaded once per batch. Rows are then validated in memory and the valid ones are written,
+together with their approval entries and ledger deltas, in a single transaction.
+"""
+from collections import defaultdict
+
+from django.db import connection, models, transaction
+from django.db.models import OuterRef, Subquery
+
+from employee.models import Employee
+from . import config_cache, ledger
+from .approvals import LEAVE_APPROVALS
+from .holiday_calendar import get_holiday_calendar
+from .models import AllowedLeaveTypes, LeavePolicy, LeaveRequest, Supervisor
+from .serializers import LeaveRequestBulkItemSerializer
+
+
+class BulkLeaveSubmission:
+    """Validates and creates a batch of leave requests with a fixed number of queries"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.errors = []
+        self.created = []
+
+    def run(self):
+        parsed = self._parse_rows()
+        if parsed:
+            self._load_context(parsed)
+
+        pending = []
+        for index, data in parsed:
+            row_errors = self._validate(data)
+            if row_errors:
+                self.errors.append({'index': index, 'errors': row_errors})
+            else:
+                pending.append(self._build_request(data))
+
+        if pending:
+            with transaction.atomic():
+                self.created = self._insert(pending)
+
+        self.errors.sort(key=lambda error: error['index'])
+        return self.created, self.errors
+
+    def _parse_rows(self):
+        parsed = []
+        for index, row in enumerate(self.rows):
+            serializer = LeaveRequestBulkItemSerializer(data=row)
+            if serializer.is_valid():
+                parsed.append((index, serializer.validated_data))
+            else:
+                self.errors.append({'index': index, 'errors': serializer.errors})
+        return parsed
+
+    def _load_context(self, parsed):
+        employee_ids = {data['employee'] for _, data in parsed}
+        policy_ids = {data['leave_policy'] for _, data in parsed}
+
+        self.cutoff_day = config_cache.cutoff_day()
+
+        last_approved = LeaveRequest.objects.filter(
+            employee=OuterRef('pk'),
+            status='approved'
+        ).order_by('-created_at').values('leave_policy_id')[:1]
+        self.employees = Employee.objects.filter(pk__in=employee_ids).annotate(
+            last_approved_policy_id=Subquery(last_approved)
+        ).in_bulk()
+
+        last_policy_ids = {
+            employee.last_approved_policy_id for employee in self.employees.values()
+            if employee.last_approved_policy_id
+        }
+        self.policies = LeavePolicy.objects.in_bulk(policy_ids | last_policy_ids)
+
+        # leave_policy_id -> ids of the policies allowed after it; a sequence with no
+        # allowed types still blocks everything, so keys are kept even when empty
+        self.allowed_sequences = {}
+        for leave_policy_id, allowed_id in AllowedLeaveTypes.objects.filter(
+            leave_policy_id__in=last_policy_ids
+        ).values_list('leave_policy_id', 'allowed_types'):
+            allowed = self.allowed_sequences.setdefault(leave_policy_id, set())
+            if allowed_id is not None:
+                allowed.add(allowed_id)
+
+        self.supervisors = defaultdict(list)
+        for supervisor in Supervisor.objects.filter(employee_id__in=employee_ids).order_by('level'):
+            self.supervisors[supervisor.employee_id].append(supervisor)
+
+        self.calendar = get_holiday_calendar()
+
+    def _validate(self, data):
+        employee = self.employees.get(data['employee'])
+        leave_policy = self.policies.get(data['leave_policy'])
+        errors = {}
+        if employee is None:
+            errors['employee'] = [f'Invalid pk "{data["employee"]}" - object does not exist.']
+        if leave_policy is None:
+            errors['leave_policy'] = [f'Invalid pk "{data["leave_policy"]}" - object does not exist.']
+        if errors:
+            return errors
+
+        last_approved_policy = self.policies.get(employee.last_approved_policy_id)
+        allowed_policy_ids = None
+        if last_approved_policy and last_approved_policy.pk in self.allowed_sequences:
+            allowed_policy_ids = self.allowed_sequences[last_approved_policy.pk]
+
+        messages = LeaveRequest.validation_errors(
+            employee, leave_policy, data['from_date'], data['to_date'], self.cutoff_day,
+            last_approved_policy, allowed_policy_ids
+        )
+        if messages:
+            return {'non_field_errors': messages}
+        return None
+
+    def _build_request(self, data):
+        leave_request = LeaveRequest(
+            employee=self.employees[data['employee']],
+            leave_policy=self.policies[data['leave_policy']],
+            from_date=data['from_date'],
+            to_date=data['to_date'],
+            is_half_day=data.get('is_half_day', False),
+            reason=data.get('reason'),
+        )
+        leave_request.days_count = leave_request.calculate_days_count(self.calendar)
+        return leave_request
+
+    def _insert(self, requests):
+        if not connection.features.can_return_rows_from_bulk_insert:
+            # Without primary keys from the insert the approvals can't be linked in bulk;
+            # save row by row and let the post_save receivers build the chain and ledger.
+            for leave_request in requests:
+                models.Model.save(leave_request)
+            return requests
+
+        LeaveRequest.objects.bulk_create(requests)
+        LEAVE_APPROVALS.create_chains(requests, self.supervisors)
+        ledger.record_request_changes(requests)
+        return requests
@@ -0,0 +1,179 @@
+"""
+Process-wide cache of the leave configuration tables.
+
+The cut-off day, the active reset period, the leave groups and the active policies of each
+group are read on nearly every request but change a few times a year. Each is loaded on
+first use and kept until a save or delete of the underlying model drops it (see the
+receivers in models.py), so hot paths read them without touching the database. Hits and
+misses are counted per entry; `cache_stats()` reports them.
+
+Each process holds its own copy, so every invalidation also bumps a generation counter in
+the shared Django cache. A process compares it with the generation its copy was loaded
+under at most every CONFIG_CACHE_SYNC_INTERVAL seconds, and always before a balance
+response is computed (see balance_cache.py), and drops everything when it has moved on.
+A change saved through one worker therefore reaches the others too.
+
+Cached instances are shared between requests and must be treated as read-only.
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from django.db import DatabaseError
+
+
+DEFAULT_CUTOFF_DAY = 25
+GENERATION_KEY = 'leave-config:generation'
+
+# Cache entries dropped when a row of the model is saved or deleted
+MODEL_ENTRIES = {
+    'CutOffDate': ('cutoff_day',),
+    'LeaveReset': ('reset_period',),
+    'LeaveGroup': ('leave_groups',),
+    'LeavePolicy': ('active_policies',),
+}
+
+
+class ConfigCache:
+    """Named values loaded on first use and kept until invalidated, with hit/miss counters"""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+        self._generation = None
+        self._synced_at = None
+
+    def sync(self, force=False):
+        """Drop every entry if another process invalidated the configuration since it was loaded"""
+        now = time.monotonic()
+        interval = getattr(settings, 'CONFIG_CACHE_SYNC_INTERVAL', 1.0)
+        if not force and self._synced_at is not None and now - self._synced_at < interval:
+            return
+        self._synced_at = now
+        # Start from the clock, so a counter that was evicted never comes back at an old value
+        shared_cache.add(GENERATION_KEY, time.time_ns())
+        generation = shared_cache.get(GENERATION_KEY)
+        if generation != self._generation:
+            with self._lock:
+                self._values.clear()
+                self._generation = generation
+
+    def _bump_generation(self):
+        try:
+            generation = shared_cache.incr(GENERATION_KEY)
+        except ValueError:
+            generation = time.time_ns()
+            shared_cache.set(GENERATION_KEY, generation)
+        # What is left here is current; only the other processes need to reload
+        self._generation = generation
+
+    def get(self, name, loader):
+        self.sync()
+        try:
+            value = self._values[name]
+        except KeyError:
+            with self._lock:
+                if name in self._values:
+                    self.hits[name] += 1
+                else:
+                    self.misses[name] += 1
+                    self._values[name] = loader()
+                return self._values[name]
+        self.hits[name] += 1
+        return value
+
+    def invalidate(self, *names):
+        """Drop the given entries, or every entry when none are named"""
+        with self._lock:
+            if not names:
+                self._values.clear()
+            for name in names:
+                self._values.pop(name, None)
+            self._bump_generation()
+
+    def stats(self):
+        return {
+            name: {'hits': self.hits[name], 'misses': self.misses[name], 'cached': name in self._values}
+            for name in sorted(set(self.hits) | set(self.misses))
+        }
+
+
+_cache = ConfigCache()
+
+
+def _load_cutoff_day():
+    from .models import CutOffDate
+    cutoff = CutOffDate.objects.first()
+    return cutoff.cut_off_day if cutoff else DEFAULT_CUTOFF_DAY
+
+
+def cutoff_day():
+    """Day of the month after which the current month can no longer be applied for or approved"""
+    try:
+        return _cache.get('cutoff_day', _load_cutoff_day)
+    except DatabaseError:
+        # Not cached, so the real value is picked up once the table is reachable
+        return DEFAULT_CUTOFF_DAY
+
+
+def _load_reset_period():
+    from .models import LeaveReset
+    return LeaveReset.objects.filter(is_active=True).first()
+
+
+def active_reset_period():
+    """The active LeaveReset, or None when leave periods follow the calendar year"""
+    return _cache.get('reset_period', _load_reset_period)
+
+
+def _load_leave_groups():
+    from .models import LeaveGroup
+    return {group.pk: group for group in LeaveGroup.objects.all()}
+
+
+def leave_groups():
+    """Every LeaveGroup by id"""
+    return _cache.get('leave_groups', _load_leave_groups)
+
+
+def get_leave_group(name):
+    """The LeaveGroup with this name; raises LeaveGroup.DoesNotExist like objects.get(name=...)"""
+    from .models import LeaveGroup
+    for group in leave_groups().values():
+        if group.name == name:
+            return group
+    raise LeaveGroup.DoesNotExist(f'No leave group named {name!r}')
+
+
+def _load_active_policies():
+    from .models import LeavePolicy
+    by_group = defaultdict(list)
+    for policy in LeavePolicy.objects.filter(is_active=True).order_by('pk'):
+        by_group[policy.leave_group_id].append(policy)
+    return dict(by_group)
+
+
+def active_policies_by_group():
+    """leave_group_id -> active LeavePolicy rows ordered by id"""
+    return _cache.get('active_policies', _load_active_policies)
+
+
+def invalidate_for(model_name):
+    _cache.invalidate(*MODEL_ENTRIES.get(model_name, ()))
+
+
+def invalidate_config_cache():
+    _cache.invalidate()
+
+
+def sync_config_cache():
+    """Catch up with invalidations made by other processes now, rather than within the sync interval"""
+    _cache.sync(force=True)
+
+
+def cache_stats():
+    return _cache.stats()
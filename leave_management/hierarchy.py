@@ -0,0 +1,123 @@
+"""
+Transitive supervisor hierarchy.
+
+Supervisor rows are direct edges: a supervisor oversees an employee at some approval
+level. SupervisorClosure stores one row for every (ancestor, descendant) pair connected
+through those edges, with the shortest chain length as depth. "Everyone under this head
+at any depth" then becomes a single indexed subquery rather than a loop over
+Supervisor.objects.filter(supervisor=...).
+
+The Supervisor signals keep the table current. A new edge links every ancestor of the
+supervisor to every descendant of the employee in a few statements. A removed or moved
+edge can break chains that other edges still cover, so the subtree under it is rebuilt
+from the remaining edges instead. Bulk writes to Supervisor send no signals and must be
+followed by `rebuild()`.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+
+from employee.models import Employee
+from .models import Supervisor, SupervisorClosure
+
+
+BATCH_SIZE = 500
+
+
+def team_ids(supervisor, max_depth=None):
+    """Subquery of the ids of everyone under `supervisor`, down to `max_depth` levels (all when None)"""
+    rows = SupervisorClosure.objects.filter(ancestor=supervisor)
+    if max_depth is not None:
+        rows = rows.filter(depth__lte=max_depth)
+    return rows.values('descendant_id')
+
+
+def team_members(supervisor, max_depth=None):
+    """Employees under `supervisor`; depth 1 is the direct team"""
+    return Employee.objects.filter(pk__in=team_ids(supervisor, max_depth))
+
+
+def parse_depth(value, default=1):
+    """?depth= as a level count, or None for "all"; raises ValueError on anything else"""
+    if value in (None, ''):
+        return default
+    if value == 'all':
+        return None
+    depth = int(value)
+    if depth < 1:
+        raise ValueError('depth must be a positive number or "all"')
+    return depth
+
+
+@transaction.atomic
+def link(supervisor_id, employee_id):
+    """Add the pairs created by a new supervisor -> employee edge"""
+    ancestors = {supervisor_id: 0}
+    ancestors.update(SupervisorClosure.objects.filter(descendant_id=supervisor_id).values_list('ancestor_id', 'depth'))
+    descendants = {employee_id: 0}
+    descendants.update(SupervisorClosure.objects.filter(ancestor_id=employee_id).values_list('descendant_id', 'depth'))
+
+    wanted = {
+        (ancestor_id, descendant_id): ancestor_depth + 1 + descendant_depth
+        for ancestor_id, ancestor_depth in ancestors.items()
+        for descendant_id, descendant_depth in descendants.items()
+        # A cycle in the edges must not make anyone their own ancestor
+        if ancestor_id != descendant_id
+    }
+
+    shortened = []
+    for row in SupervisorClosure.objects.filter(ancestor_id__in=ancestors, descendant_id__in=descendants):
+        depth = wanted.pop((row.ancestor_id, row.descendant_id), None)
+        if depth is not None and depth < row.depth:
+            row.depth = depth
+            shortened.append(row)
+    SupervisorClosure.objects.bulk_update(shortened, ['depth'], batch_size=BATCH_SIZE)
+    SupervisorClosure.objects.bulk_create([
+        SupervisorClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+        for (ancestor_id, descendant_id), depth in wanted.items()
+    ], batch_size=BATCH_SIZE)
+
+
+def unlink(employee_ids):
+    """Rebuild the pairs under employees whose incoming edge was removed or moved"""
+    affected = set(employee_ids)
+    affected.update(SupervisorClosure.objects.filter(ancestor_id__in=affected).values_list('descendant_id', flat=True))
+    rebuild(affected)
+
+
+def ancestor_depths(employee_id, parents):
+    """Shortest distance to every ancestor, walking up the supervisor edges breadth-first"""
+    depths = {}
+    frontier = [employee_id]
+    depth = 0
+    while frontier:
+        depth += 1
+        upper = []
+        for node in frontier:
+            for parent in parents.get(node, ()):
+                if parent not in depths and parent != employee_id:
+                    depths[parent] = depth
+                    upper.append(parent)
+        frontier = upper
+    return depths
+
+
+@transaction.atomic
+def rebuild(employee_ids=None):
+    """Recompute the ancestor pairs of the given employees, or of everyone when None"""
+    parents = defaultdict(set)
+    for supervisor_id, employee_id in Supervisor.objects.values_list('supervisor_id', 'employee_id'):
+        if supervisor_id != employee_id:
+            parents[employee_id].add(supervisor_id)
+
+    if employee_ids is None:
+        SupervisorClosure.objects.all().delete()
+        employee_ids = list(parents)
+    else:
+        SupervisorClosure.objects.filter(descendant_id__in=employee_ids).delete()
+
+    SupervisorClosure.objects.bulk_create([
+        SupervisorClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth)
+        for descendant_id in employee_ids
+        for ancestor_id, depth in ancestor_depths(descendant_id, parents).items()
+    ], batch_size=BATCH_SIZE)
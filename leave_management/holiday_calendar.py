@@ -0,0 +1,108 @@
+"""
+In-memory index of the holiday table.
+
+Holiday ranges are loaded once, merged into sorted non-overlapping intervals and paired
+with prefix sums, so membership and "how many holidays fall in [a, b]" are answered with
+a binary search instead of a query per day. The cached calendar is dropped whenever a
+holiday is saved or deleted (see the receivers in models.py).
+"""
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+
+class HolidayCalendar:
+    """Sorted, merged holiday intervals with prefix sums for O(log n) range queries"""
+
+    def __init__(self, ranges):
+        merged = []
+        for start, end in sorted((start.toordinal(), end.toordinal()) for start, end in ranges if start and end and start <= end):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        self._starts = [start for start, _ in merged]
+        self._ends = [end for _, end in merged]
+        # _prefix[i] is the number of holiday days in the first i intervals
+        self._prefix = [0]
+        # Sorted holiday ordinals per weekday (Monday=0), for weekmask-aware counting
+        self._by_weekday = [[] for _ in range(7)]
+        for start, end in merged:
+            self._prefix.append(self._prefix[-1] + end - start + 1)
+            for ordinal in range(start, end + 1):
+                # date.fromordinal(1) is a Monday, so (ordinal - 1) % 7 is the weekday
+                self._by_weekday[(ordinal - 1) % 7].append(ordinal)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def _days_before(self, ordinal):
+        """Number of holiday days strictly before the given ordinal"""
+        index = bisect_left(self._starts, ordinal)
+        total = self._prefix[index]
+        if index and self._ends[index - 1] >= ordinal:
+            # The previous interval runs past the ordinal; drop its tail
+            total -= self._ends[index - 1] - ordinal + 1
+        return total
+
+    def is_holiday(self, day):
+        index = bisect_right(self._starts, day.toordinal()) - 1
+        return index >= 0 and self._ends[index] >= day.toordinal()
+
+    def count_holidays(self, start, end):
+        """Number of holiday days in the inclusive range [start, end]"""
+        if start > end:
+            return 0
+        return self._days_before(end.toordinal() + 1) - self._days_before(start.toordinal())
+
+    def count_holidays_on(self, start, end, weekdays):
+        """Number of holiday days in [start, end] that fall on one of the given weekdays"""
+        if start > end:
+            return 0
+        first, last = start.toordinal(), end.toordinal()
+        return sum(
+            bisect_right(self._by_weekday[weekday], last) - bisect_left(self._by_weekday[weekday], first)
+            for weekday in weekdays
+        )
+
+    def count_working_days(self, start, end):
+        """Number of non-holiday days in the inclusive range [start, end]"""
+        if start > end:
+            return 0
+        return (end - start).days + 1 - self.count_holidays(start, end)
+
+    def holidays_between(self, start, end):
+        """Every holiday date in the inclusive range [start, end], in order"""
+        first, last = start.toordinal(), end.toordinal()
+        days = []
+        for index in range(max(bisect_right(self._starts, first) - 1, 0), len(self._starts)):
+            if self._starts[index] > last:
+                break
+            for ordinal in range(max(self._starts[index], first), min(self._ends[index], last) + 1):
+                days.append(date.fromordinal(ordinal))
+        return days
+
+
+_calendar = None
+_lock = threading.Lock()
+
+
+def get_holiday_calendar():
+    """Return the process-wide holiday calendar, loading it on first use"""
+    global _calendar
+    calendar = _calendar
+    if calendar is None:
+        from .models import holiday
+
+        with _lock:
+            if _calendar is None:
+                _calendar = HolidayCalendar(holiday.objects.values_list('from_date', 'to_date'))
+            calendar = _calendar
+    return calendar
+
+
+def invalidate_holiday_calendar(**kwargs):
+    global _calendar
+    with _lock:
+        _calendar = None
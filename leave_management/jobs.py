@@ -0,0 +1,125 @@
+"""
+Database-backed queue for the side effects of a write.
+
+Creating a leave or adjustment request's approval chain, transferring leave after an
+employee changes leave group and deriving shifts from new punches normally run inside the
+transaction of the write that causes them. With JOB_QUEUE on, those writers call
+`enqueue` instead, and the `run_jobs` worker runs the work later. The API worker only
+pays for one INSERT.
+
+`enqueue` inserts the job on transaction.on_commit: a worker never picks up work for a
+change that is not visible yet, and a rolled back write leaves no job behind. Outside an
+atomic block on_commit runs at once, so writers enqueue from post_save, after their own
+statement. A job can be lost if the process dies between the commit and the insert; the
+scheduled `derive_shifts` run covers derivation in that case.
+
+* Each job runs in its own transaction. A failed attempt leaves nothing behind and is
+  retried after an exponential backoff (JOB_RETRY_DELAY, doubled per attempt), up to
+  JOB_MAX_ATTEMPTS; the error is kept on the row.
+* Jobs are claimed with a conditional UPDATE, so several workers can poll one table.
+  A job whose worker died is claimed again after JOB_LOCK_TIMEOUT. Tasks may therefore
+  run twice and must be idempotent.
+* Jobs enqueued with the same `key` while one is still pending collapse into it, e.g.
+  every punch of a burst schedules the same single derivation run.
+"""
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import BackgroundJob
+
+
+def queue_enabled():
+    return getattr(settings, 'JOB_QUEUE', False)
+
+
+def enqueue(task, payload=None, key=None, run_after=None):
+    """
+    Schedule `task` (a dotted path) to be called with `payload` as keyword arguments.
+    The job is inserted when the current transaction commits, and not at all on rollback.
+    """
+    transaction.on_commit(lambda: add_job(task, payload, key, run_after))
+
+
+def add_job(task, payload=None, key=None, run_after=None):
+    """Insert a job now and return it; for callers that already run after the change is committed"""
+    fields = {'task': task, 'payload': payload or {}, 'key': key, 'run_after': run_after or timezone.now()}
+    if key is None:
+        return BackgroundJob.objects.create(**fields)
+
+    pending = BackgroundJob.objects.filter(key=key, status='pending').first()
+    if pending is not None:
+        return pending
+    try:
+        with transaction.atomic():
+            return BackgroundJob.objects.create(**fields)
+    except IntegrityError:
+        # Enqueued concurrently by another writer
+        return BackgroundJob.objects.get(key=key, status='pending')
+
+
+def _due(now):
+    stale = now - timedelta(seconds=getattr(settings, 'JOB_LOCK_TIMEOUT', 600))
+    return Q(status='pending', run_after__lte=now) | Q(status='running', locked_at__lt=stale)
+
+
+def claim(now=None):
+    """Mark the oldest due job as running and return it, or None when nothing is due"""
+    now = now or timezone.now()
+    for pk in BackgroundJob.objects.filter(_due(now)).order_by('pk').values_list('pk', flat=True)[:20]:
+        # Only one worker's UPDATE can still match the due condition
+        claimed = BackgroundJob.objects.filter(_due(now), pk=pk).update(
+            status='running', locked_at=now, attempts=F('attempts') + 1
+        )
+        if claimed:
+            return BackgroundJob.objects.get(pk=pk)
+    return None
+
+
+def run_job(job):
+    """Run a claimed job; returns True when it succeeded"""
+    try:
+        with transaction.atomic():
+            import_string(job.task)(**job.payload)
+    except Exception:
+        _failed(job, traceback.format_exc())
+        return False
+
+    BackgroundJob.objects.filter(pk=job.pk).update(status='done', locked_at=None, last_error='', updated_at=timezone.now())
+    return True
+
+
+def _failed(job, error):
+    now = timezone.now()
+    if job.attempts >= getattr(settings, 'JOB_MAX_ATTEMPTS', 5):
+        BackgroundJob.objects.filter(pk=job.pk).update(status='failed', locked_at=None, last_error=error, updated_at=now)
+        return
+
+    retry_at = now + timedelta(seconds=getattr(settings, 'JOB_RETRY_DELAY', 30) * 2 ** (job.attempts - 1))
+    try:
+        with transaction.atomic():
+            BackgroundJob.objects.filter(pk=job.pk).update(
+                status='pending', run_after=retry_at, locked_at=None, last_error=error, updated_at=now
+            )
+    except IntegrityError:
+        # A newer job with the same key is already pending and will redo this work
+        BackgroundJob.objects.filter(pk=job.pk).update(status='failed', locked_at=None, last_error=error, updated_at=now)
+
+
+def run_pending(limit=None):
+    """Run due jobs until none is left (or `limit` have run); returns (succeeded, failed)"""
+    succeeded = failed = 0
+    while limit is None or succeeded + failed < limit:
+        job = claim()
+        if job is None:
+            break
+        if run_job(job):
+            succeeded += 1
+        else:
+            failed += 1
+    return succeeded, failed
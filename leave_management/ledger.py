@@ -0,0 +1,368 @@
+"""
+Keeps the LeaveBalance ledger in sync with leave requests and transfers.
+
+Each LeaveRequest and LeaveTransfer remembers the values it was loaded with. When it is
+saved or deleted, the contribution of the old state is subtracted from the ledger and the
+contribution of the new state is added, so only the affected rows are touched. `rebuild`
+recomputes everything from the raw rows and reports where the stored totals drifted.
+"""
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from employee.models import Employee
+from . import balance_cache, config_cache
+from .models import LeaveBalance, LeaveRequest, LeaveReset
+
+
+PENDING_STATUSES = ['pending_L1', 'pending_L2', 'pending_L3']
+PROBATION_DAYS = 90
+LEDGER_FIELDS = ('used_days', 'pending_days', 'probation_days', 'transferred_in', 'transferred_out')
+
+RequestState = namedtuple('RequestState', [
+    'employee_id', 'leave_policy_id', 'status', 'from_date', 'to_date', 'days_count',
+])
+TransferState = namedtuple('TransferState', [
+    'employee_id', 'from_leave_policy_id', 'to_leave_policy_id',
+    'from_leave_group_id', 'to_leave_group_id', 'days_transferred', 'year', 'is_reversed',
+])
+DriftEntry = namedtuple('DriftEntry', [
+    'employee_id', 'leave_policy_id', 'period_start', 'field', 'stored', 'expected',
+])
+
+# Marks instances loaded with deferred fields, whose previous contribution is unknown
+UNKNOWN_STATE = object()
+
+
+def loaded_state(instance, state_class):
+    """State the instance had in the database, taken from the values it was loaded with"""
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is None:
+        return None
+    if not all(field in loaded for field in state_class._fields):
+        return UNKNOWN_STATE
+    return _normalize(state_class(*(loaded[field] for field in state_class._fields)))
+
+
+def capture_state(instance, state_class):
+    return _normalize(state_class(*(getattr(instance, field) for field in state_class._fields)))
+
+
+def _normalize(state):
+    # days_count is a float right after LeaveRequest.save computes it, a Decimal once loaded
+    if isinstance(state, RequestState):
+        return state._replace(days_count=_to_decimal(state.days_count))
+    return state._replace(days_transferred=_to_decimal(state.days_transferred))
+
+
+def _remember_state(instance, state):
+    if state is None:
+        instance._loaded_values = None
+    else:
+        instance._loaded_values = {**(getattr(instance, '_loaded_values', None) or {}), **state._asdict()}
+
+
+def _to_decimal(value):
+    return Decimal(str(value or 0))
+
+
+class PeriodResolver:
+    """Resolves reset periods in memory from the cached active LeaveReset"""
+
+    def __init__(self):
+        self.reset_period = config_cache.active_reset_period()
+
+    def __call__(self, day):
+        return LeaveReset.get_period_bounds(self.reset_period, day)
+
+
+def request_contributions(state, joining_date, resolve_period):
+    """Ledger amounts a leave request in the given state accounts for"""
+    if not state or not (state.employee_id and state.leave_policy_id and state.from_date and state.to_date):
+        return []
+
+    if state.status == 'approved':
+        field = 'used_days'
+    elif state.status in PENDING_STATUSES:
+        field = 'pending_days'
+    else:
+        return []
+
+    period_start, period_end = resolve_period(state.from_date)
+    # Requests crossing a reset boundary are not counted in either period
+    if state.to_date > period_end:
+        return []
+
+    days = _to_decimal(state.days_count)
+    amounts = {field: days}
+    if state.status == 'approved' and joining_date and state.to_date <= joining_date + timedelta(days=PROBATION_DAYS):
+        amounts['probation_days'] = days
+
+    return [((state.employee_id, state.leave_policy_id, period_start), period_end, amounts)]
+
+
+def transfer_contributions(state, resolve_period):
+    """Ledger amounts a leave transfer in the given state accounts for"""
+    if not state or state.is_reversed or not (state.employee_id and state.year):
+        return []
+
+    period_start, period_end = resolve_period(state.year)
+    days = _to_decimal(state.days_transferred)
+    contributions = []
+
+    if state.to_leave_group_id and state.to_leave_policy_id:
+        contributions.append((
+            (state.employee_id, state.to_leave_policy_id, period_start), period_end, {'transferred_in': days}
+        ))
+
+    # Transfers within the same group are never counted as outgoing
+    if state.from_leave_group_id and state.from_leave_policy_id and state.from_leave_group_id != state.to_leave_group_id:
+        contributions.append((
+            (state.employee_id, state.from_leave_policy_id, period_start), period_end, {'transferred_out': days}
+        ))
+
+    return contributions
+
+
+class LedgerDelta:
+    """Accumulates signed changes per ledger row and writes them as set-based F() updates"""
+
+    BATCH_SIZE = 500
+
+    def __init__(self):
+        self.changes = defaultdict(lambda: defaultdict(Decimal))
+        self.period_ends = {}
+
+    def add(self, contributions, sign=1):
+        for key, period_end, amounts in contributions:
+            self.period_ends[key] = period_end
+            for field, amount in amounts.items():
+                self.changes[key][field] += sign * amount
+
+    def apply(self):
+        changes = {}
+        for key, amounts in self.changes.items():
+            amounts = {field: amount for field, amount in amounts.items() if amount}
+            if amounts:
+                changes[key] = amounts
+
+        keys = list(changes)
+        for index in range(0, len(keys), self.BATCH_SIZE):
+            batch = keys[index:index + self.BATCH_SIZE]
+            with transaction.atomic():
+                self._apply_batch({key: changes[key] for key in batch})
+        balance_cache.employees_changed({employee_id for employee_id, _, _ in changes})
+
+    def _row_ids(self, keys):
+        rows = LeaveBalance.objects.filter(
+            employee_id__in={key[0] for key in keys},
+            leave_policy_id__in={key[1] for key in keys},
+            period_start__in={key[2] for key in keys},
+        ).values_list('pk', 'employee_id', 'leave_policy_id', 'period_start')
+        wanted = set(keys)
+        return {(employee_id, leave_policy_id, period_start): pk
+                for pk, employee_id, leave_policy_id, period_start in rows
+                if (employee_id, leave_policy_id, period_start) in wanted}
+
+    def _apply_batch(self, changes):
+        row_ids = self._row_ids(changes)
+        missing = [key for key in changes if key not in row_ids]
+        if missing:
+            # Create empty rows first so concurrent writers only ever race on increments
+            LeaveBalance.objects.bulk_create([
+                LeaveBalance(
+                    employee_id=employee_id,
+                    leave_policy_id=leave_policy_id,
+                    period_start=period_start,
+                    period_end=self.period_ends[(employee_id, leave_policy_id, period_start)],
+                )
+                for employee_id, leave_policy_id, period_start in missing
+            ], ignore_conflicts=True)
+            row_ids = self._row_ids(changes)
+
+        # One UPDATE per field, each row incremented by its own amount
+        now = timezone.now()
+        for field in LEDGER_FIELDS:
+            amounts_by_row = {row_ids[key]: amounts[field] for key, amounts in changes.items() if field in amounts}
+            if not amounts_by_row:
+                continue
+            increment = Case(
+                *(When(pk=pk, then=Value(amount)) for pk, amount in amounts_by_row.items()),
+                default=Value(Decimal(0)),
+                output_field=LeaveBalance._meta.get_field(field),
+            )
+            LeaveBalance.objects.filter(pk__in=list(amounts_by_row)).update(
+                **{field: F(field) + increment, 'updated_at': now}
+            )
+
+
+def _joining_dates(employee_ids):
+    employee_ids = {employee_id for employee_id in employee_ids if employee_id}
+    if not employee_ids:
+        return {}
+    return dict(Employee.objects.filter(pk__in=employee_ids).values_list('pk', 'joining_date'))
+
+
+def record_request_change(instance, deleted=False):
+    """Apply the ledger delta for a saved or deleted leave request"""
+    old_state = loaded_state(instance, RequestState)
+    new_state = None if deleted else capture_state(instance, RequestState)
+    _remember_state(instance, new_state)
+
+    if old_state is UNKNOWN_STATE:
+        rebuild(employee_ids=[instance.employee_id])
+        return
+    if old_state == new_state:
+        return
+
+    joining_dates = _joining_dates([state.employee_id for state in (old_state, new_state) if state])
+    resolve_period = PeriodResolver()
+
+    delta = LedgerDelta()
+    if old_state:
+        delta.add(request_contributions(old_state, joining_dates.get(old_state.employee_id), resolve_period), -1)
+    if new_state:
+        delta.add(request_contributions(new_state, joining_dates.get(new_state.employee_id), resolve_period))
+    delta.apply()
+
+
+def record_request_changes(instances):
+    """
+    Apply ledger deltas for many leave requests written without signals, e.g. by
+    bulk_create or queryset.update(). Each instance must carry its new values.
+    """
+    changes = []
+    unknown = []
+    for instance in instances:
+        old_state = loaded_state(instance, RequestState)
+        new_state = capture_state(instance, RequestState)
+        _remember_state(instance, new_state)
+        if old_state is UNKNOWN_STATE:
+            unknown.append(instance.employee_id)
+        elif old_state != new_state:
+            changes.append((old_state, new_state))
+
+    if unknown:
+        rebuild(employee_ids=unknown)
+    if not changes:
+        return
+
+    joining_dates = _joining_dates([state.employee_id for pair in changes for state in pair if state])
+    resolve_period = PeriodResolver()
+
+    delta = LedgerDelta()
+    for old_state, new_state in changes:
+        if old_state:
+            delta.add(request_contributions(old_state, joining_dates.get(old_state.employee_id), resolve_period), -1)
+        delta.add(request_contributions(new_state, joining_dates.get(new_state.employee_id), resolve_period))
+    delta.apply()
+
+
+def record_transfer_change(instance, deleted=False):
+    """Apply the ledger delta for a saved or deleted leave transfer"""
+    old_state = loaded_state(instance, TransferState)
+    new_state = None if deleted else capture_state(instance, TransferState)
+    _remember_state(instance, new_state)
+
+    if old_state is UNKNOWN_STATE:
+        rebuild(employee_ids=[instance.employee_id])
+        return
+    if old_state == new_state:
+        return
+
+    resolve_period = PeriodResolver()
+    delta = LedgerDelta()
+    delta.add(transfer_contributions(old_state, resolve_period), -1)
+    delta.add(transfer_contributions(new_state, resolve_period))
+    delta.apply()
+
+
+def schedule_rebuild(employee_ids=None):
+    """
+    Rebuild the ledger once the current transaction commits, on the job queue when it is
+    on. Used when a change moves contributions between rows, e.g. a new reset period.
+    """
+    from . import jobs
+    if jobs.queue_enabled():
+        key = 'ledger-rebuild' if employee_ids is None else None
+        jobs.enqueue('leave_management.ledger.rebuild', {'employee_ids': employee_ids}, key=key)
+        return
+    transaction.on_commit(lambda: rebuild(employee_ids=employee_ids))
+
+
+def rebuild(employee_ids=None, dry_run=False):
+    """
+    Recompute ledger rows from LeaveRequest and LeaveTransfer.
+
+    Returns the list of DriftEntry values where the stored ledger disagreed with the
+    recomputed totals. Unless dry_run is set, the stored rows are corrected.
+    """
+    from .utils import LeaveTransfer
+
+    requests = LeaveRequest.objects.all()
+    transfers = LeaveTransfer.objects.all()
+    stored_rows = LeaveBalance.objects.all()
+    employees = Employee.objects.all()
+    if employee_ids is not None:
+        employee_ids = [employee_id for employee_id in employee_ids if employee_id]
+        requests = requests.filter(employee_id__in=employee_ids)
+        transfers = transfers.filter(employee_id__in=employee_ids)
+        stored_rows = stored_rows.filter(employee_id__in=employee_ids)
+        employees = employees.filter(pk__in=employee_ids)
+
+    joining_dates = dict(employees.values_list('pk', 'joining_date'))
+    resolve_period = PeriodResolver()
+
+    expected = LedgerDelta()
+    for values in requests.order_by().values_list(*RequestState._fields).iterator():
+        state = RequestState(*values)
+        expected.add(request_contributions(state, joining_dates.get(state.employee_id), resolve_period))
+    for values in transfers.order_by().values_list(*TransferState._fields).iterator():
+        expected.add(transfer_contributions(TransferState(*values), resolve_period))
+
+    stored = {
+        (row.employee_id, row.leave_policy_id, row.period_start): row
+        for row in stored_rows
+    }
+
+    drift = []
+    to_create = []
+    to_update = []
+    for key in sorted(set(expected.changes) | set(stored)):
+        totals = expected.changes.get(key, {})
+        row = stored.get(key)
+        changed = False
+        for field in LEDGER_FIELDS:
+            expected_value = totals.get(field, Decimal(0))
+            stored_value = getattr(row, field) if row else Decimal(0)
+            if Decimal(stored_value) != expected_value:
+                drift.append(DriftEntry(*key, field, stored_value, expected_value))
+                changed = True
+
+        if not changed or dry_run:
+            continue
+        if row:
+            for field in LEDGER_FIELDS:
+                setattr(row, field, totals.get(field, Decimal(0)))
+            to_update.append(row)
+        else:
+            employee_id, leave_policy_id, period_start = key
+            to_create.append(LeaveBalance(
+                employee_id=employee_id,
+                leave_policy_id=leave_policy_id,
+                period_start=period_start,
+                period_end=expected.period_ends[key],
+                **{field: totals.get(field, Decimal(0)) for field in LEDGER_FIELDS}
+            ))
+
+    with transaction.atomic():
+        LeaveBalance.objects.bulk_create(to_create, batch_size=500)
+        LeaveBalance.objects.bulk_update(to_update, list(LEDGER_FIELDS), batch_size=500)
+    if not dry_run:
+        balance_cache.employees_changed({entry.employee_id for entry in drift})
+
+    return drift
@@ -0,0 +1,56 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from leave import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every GET endpoint (queries, wall time, peak memory) against synthetic organisations '
+        'of several sizes. Runs in a separate test database; the configured database is not touched.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales', nargs='+', type=int, default=list(benchmarks.DEFAULT_SCALES), metavar='EMPLOYEES',
+            help='Organisation sizes to benchmark, in employees'
+        )
+        parser.add_argument('--days', type=int, default=365, help='Days of attendance to generate')
+        parser.add_argument('--repeat', type=int, default=3, help='Requests per endpoint; the median time is kept')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the generated data')
+        parser.add_argument('--output', help='Write the results to this JSON file instead of stdout')
+        parser.add_argument('--baseline', help='Report endpoints that regressed against this earlier results file')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            report = benchmarks.run_benchmarks(
+                scales=options['scales'],
+                days=options['days'],
+                repeat=options['repeat'],
+                seed=options['seed'],
+                log=lambda message: self.stderr.write(message),
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                regressions = benchmarks.compare(json.load(file), report)
+            for line in regressions:
+                self.stderr.write(self.style.WARNING(line))
+            if not regressions:
+                self.stderr.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from employee.models import Employee
+from leave.synthetic import OrgGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the configured database with a synthetic organisation: leave groups and policies, departments, '
+        'branches, employees, supervisor chains, holidays, a year of punches, leave requests and approvals. '
+        'The same seed always produces the same data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=1000, help='Number of employees')
+        parser.add_argument('--team-size', type=int, default=8, help='Direct reports per manager')
+        parser.add_argument('--levels', type=int, default=3, help='Supervisor levels per employee')
+        parser.add_argument('--year', type=int, help='Year of attendance and leave (default: last year)')
+        parser.add_argument('--days', type=int, default=365, help='Days of attendance to generate from 1 January')
+        parser.add_argument('--leave-requests', type=int, default=2, help='Leave requests per employee')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument(
+            '--prefix', default='E',
+            help='Prefix of generated employee ids and RFID codes; use a new one to add to an existing organisation'
+        )
+        parser.add_argument(
+            '--with-signals', action='store_true',
+            help='Save rows one by one so every model signal fires (much slower) instead of bulk inserting'
+        )
+        parser.add_argument(
+            '--derive', action='store_true',
+            help='Derive shifts and attendance summaries from the punches now, rather than leaving it to the next '
+                 'incremental derivation run'
+        )
+
+    def handle(self, *args, **options):
+        if Employee.objects.filter(employee_id__startswith=options['prefix']).exists():
+            raise CommandError(
+                f"Employees with prefix {options['prefix']!r} already exist; pass another --prefix"
+            )
+
+        started = time.perf_counter()
+        org = OrgGenerator(
+            employees=options['employees'],
+            team_size=options['team_size'],
+            levels=options['levels'],
+            year=options['year'],
+            days=options['days'],
+            leave_requests=options['leave_requests'],
+            seed=options['seed'],
+            prefix=options['prefix'],
+            signals=options['with_signals'],
+            derive=options['derive'],
+        ).generate()
+
+        for name, count in org.counts.items():
+            self.stdout.write(f'{name}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(org.employees)} employees for {org.year} in {time.perf_counter() - started:.1f}s'
+        ))
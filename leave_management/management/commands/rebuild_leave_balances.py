@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from employee.models import Employee
+from leave_management import ledger
+
+
+class Command(BaseCommand):
+    help = 'Recompute the LeaveBalance ledger from leave requests and transfers and report any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--employee', action='append', dest='employees', metavar='EMPLOYEE_ID',
+            help='Only rebuild balances for this employee_id (can be repeated)'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report drift without correcting the stored balances'
+        )
+
+    def handle(self, *args, **options):
+        employee_ids = None
+        if options['employees']:
+            employee_ids = list(
+                Employee.objects.filter(employee_id__in=options['employees']).values_list('pk', flat=True)
+            )
+
+        drift = ledger.rebuild(employee_ids=employee_ids, dry_run=options['dry_run'])
+
+        for entry in drift:
+            self.stdout.write(self.style.WARNING(
+                f"Employee {entry.employee_id}, policy {entry.leave_policy_id}, period {entry.period_start}: "
+                f"{entry.field} stored {entry.stored} but expected {entry.expected}"
+            ))
+
+        rows = len({(entry.employee_id, entry.leave_policy_id, entry.period_start) for entry in drift})
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Leave balance ledger is consistent - no drift found"))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"Found drift in {rows} balance rows (dry run, nothing changed)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Corrected drift in {rows} balance rows"))
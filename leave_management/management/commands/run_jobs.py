@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from leave_management import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued background jobs (approval chains, leave transfers, shift derivation). Keeps polling '
+        'unless --once is given; run one or more of these next to the web workers when JOB_QUEUE=1.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run the jobs that are due, then exit')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait when no job is due')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            succeeded, failed = jobs.run_pending()
+            if succeeded or failed:
+                self.stdout.write(f'Ran {succeeded} jobs, {failed} failed')
+            if options['once']:
+                break
+            if not (succeeded or failed):
+                time.sleep(options['sleep'])
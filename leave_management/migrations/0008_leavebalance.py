@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employee', '0002_initial'),
+        ('leave_management', '0007_holiday_leaverequest_is_holiday'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaveBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField()),
+                ('used_days', models.DecimalField(decimal_places=1, default=0, max_digits=6)),
+                ('pending_days', models.DecimalField(decimal_places=1, default=0, max_digits=6)),
+                ('probation_days', models.DecimalField(decimal_places=1, default=0, max_digits=6)),
+                ('transferred_in', models.DecimalField(decimal_places=2, default=0, max_digits=7)),
+                ('transferred_out', models.DecimalField(decimal_places=2, default=0, max_digits=7)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leave_balances', to='employee.employee')),
+                ('leave_policy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='leave_management.leavepolicy')),
+            ],
+            options={
+                'verbose_name': 'Leave Balance',
+                'verbose_name_plural': 'Leave Balances',
+                'indexes': [models.Index(fields=['period_start', 'employee'], name='leave_manag_period__2fc580_idx')],
+                'unique_together': {('employee', 'leave_policy', 'period_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employee', '0002_initial'),
+        ('leave_management', '0008_leavebalance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='leaveapproval',
+            index=models.Index(fields=['supervisor', 'status', 'level'], name='leaveappr_sup_status_lvl_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['status', 'employee'], name='leavereq_status_employee_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:57
+
+import django.db.models.deletion
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def backfill_supervisor_closure(apps, schema_editor):
+    """Walk up the existing supervisor edges from every supervised employee"""
+    Supervisor = apps.get_model('leave_management', 'Supervisor')
+    SupervisorClosure = apps.get_model('leave_management', 'SupervisorClosure')
+
+    parents = defaultdict(set)
+    for supervisor_id, employee_id in Supervisor.objects.values_list('supervisor_id', 'employee_id'):
+        if supervisor_id != employee_id:
+            parents[employee_id].add(supervisor_id)
+
+    rows = []
+    for employee_id in parents:
+        seen = {employee_id}
+        frontier = [employee_id]
+        depth = 0
+        while frontier:
+            depth += 1
+            upper = []
+            for node in frontier:
+                for parent in parents.get(node, ()):
+                    if parent not in seen:
+                        seen.add(parent)
+                        upper.append(parent)
+                        rows.append(SupervisorClosure(ancestor_id=parent, descendant_id=employee_id, depth=depth))
+            frontier = upper
+    SupervisorClosure.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employee', '0002_initial'),
+        ('leave_management', '0009_approval_inbox_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SupervisorClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='closure_descendants', to='employee.employee')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='closure_ancestors', to='employee.employee')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ancestor', 'depth'], name='supclosure_ancestor_depth_idx'), models.Index(fields=['descendant'], name='supclosure_descendant_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor', 'descendant'), name='unique_supervisor_closure_pair')],
+            },
+        ),
+        migrations.RunPython(backfill_supervisor_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employee', '0003_hot_query_indexes'),
+        ('leave_management', '0010_supervisor_closure'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='leaveapproval',
+            name='leaveappr_sup_status_lvl_idx',
+        ),
+        migrations.AddIndex(
+            model_name='holiday',
+            index=models.Index(fields=['from_date', 'to_date'], name='holiday_dates_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaveapproval',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['supervisor', 'level'], name='leaveappr_pending_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaveapproval',
+            index=models.Index(fields=['leave_request', 'level', 'status'], name='leaveappr_req_lvl_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['employee', 'status', 'from_date', 'to_date'], name='leavereq_emp_status_dates_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['employee', 'leave_policy', 'status'], name='leavereq_emp_policy_status_idx'),
+        ),
+    ]
@@ -0,0 +1,94 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import migrations
+
+
+# Frozen copies of the ledger rules (leave_management/ledger.py) as of this migration
+PENDING_STATUSES = ('pending_L1', 'pending_L2', 'pending_L3')
+PROBATION_DAYS = 90
+
+
+def period_bounds(reset, day):
+    if reset is None:
+        return day.replace(month=1, day=1), day.replace(month=12, day=31)
+    start = day.replace(month=reset.start_month, day=reset.start_day)
+    end = day.replace(month=reset.end_month, day=reset.end_day)
+    if reset.end_month < reset.start_month:
+        if day >= start:
+            end = end.replace(year=day.year + 1)
+        else:
+            start = start.replace(year=day.year - 1)
+    return start, end
+
+
+def backfill_leave_balances(apps, schema_editor):
+    """Fill the LeaveBalance ledger from the leave requests and transfers written before it existed"""
+    Employee = apps.get_model('employee', 'Employee')
+    LeaveBalance = apps.get_model('leave_management', 'LeaveBalance')
+    LeaveRequest = apps.get_model('leave_management', 'LeaveRequest')
+    LeaveReset = apps.get_model('leave_management', 'LeaveReset')
+    LeaveTransfer = apps.get_model('leave_management', 'LeaveTransfer')
+
+    reset = LeaveReset.objects.filter(is_active=True).first()
+    joining_dates = dict(Employee.objects.values_list('pk', 'joining_date'))
+    totals = defaultdict(lambda: defaultdict(Decimal))
+    period_ends = {}
+
+    def add(employee_id, leave_policy_id, day, amounts):
+        start, end = period_bounds(reset, day)
+        period_ends[(employee_id, leave_policy_id, start)] = end
+        for field, amount in amounts.items():
+            totals[(employee_id, leave_policy_id, start)][field] += amount
+        return end
+
+    requests = LeaveRequest.objects.filter(
+        employee__isnull=False, leave_policy__isnull=False, from_date__isnull=False, to_date__isnull=False,
+        status__in=('approved', *PENDING_STATUSES),
+    ).values_list('employee_id', 'leave_policy_id', 'status', 'from_date', 'to_date', 'days_count')
+    for employee_id, leave_policy_id, status, from_date, to_date, days_count in requests.order_by().iterator():
+        # Requests crossing a reset boundary are not counted in either period
+        if to_date > period_bounds(reset, from_date)[1]:
+            continue
+        days = Decimal(str(days_count or 0))
+        amounts = {'used_days' if status == 'approved' else 'pending_days': days}
+        joining_date = joining_dates.get(employee_id)
+        if status == 'approved' and joining_date and to_date <= joining_date + timedelta(days=PROBATION_DAYS):
+            amounts['probation_days'] = days
+        add(employee_id, leave_policy_id, from_date, amounts)
+
+    transfers = LeaveTransfer.objects.filter(
+        is_reversed=False, employee__isnull=False, year__isnull=False
+    ).values_list(
+        'employee_id', 'from_leave_policy_id', 'to_leave_policy_id', 'from_leave_group_id', 'to_leave_group_id',
+        'days_transferred', 'year',
+    )
+    for employee_id, from_policy, to_policy, from_group, to_group, days, year in transfers.order_by().iterator():
+        days = Decimal(str(days or 0))
+        if to_group and to_policy:
+            add(employee_id, to_policy, year, {'transferred_in': days})
+        # Transfers within the same group are never counted as outgoing
+        if from_group and from_policy and from_group != to_group:
+            add(employee_id, from_policy, year, {'transferred_out': days})
+
+    LeaveBalance.objects.all().delete()
+    LeaveBalance.objects.bulk_create([
+        LeaveBalance(
+            employee_id=employee_id, leave_policy_id=leave_policy_id, period_start=period_start,
+            period_end=period_ends[(employee_id, leave_policy_id, period_start)], **amounts
+        )
+        for (employee_id, leave_policy_id, period_start), amounts in totals.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employee', '0003_hot_query_indexes'),
+        ('leave_management', '0012_background_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_leave_balances, migrations.RunPython.noop),
+    ]
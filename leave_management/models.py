@@ -1,12 +1,14 @@
 from tarfile import NUL
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
 from django.utils import timezone
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from employee.models import Employee
+from . import config_cache
+from leave.instrumentation import instrument
 User = get_user_model()
 from datetime import date
 
@@ -43,6 +45,36 @@ class Supervisor(models.Model):
         # # Update the employee's supervisors through the M2M relationship
         # if not self.employee.supervisors.filter(pk=self.supervisor.pk).exists():
         #     self.employee.supervisors.add(self.supervisor)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored edge so the closure table can follow a moved supervisor row
+        loaded = dict(zip(field_names, values))
+        instance._loaded_edge = (loaded.get('supervisor_id'), loaded.get('employee_id'))
+        return instance
+
+
+class SupervisorClosure(models.Model):
+    """
+    Every (ancestor, descendant) pair connected through Supervisor rows, with the length
+    of the shortest chain between them. Maintained by leave_management.hierarchy.
+    """
+    ancestor = models.ForeignKey('employee.Employee', on_delete=models.CASCADE, related_name='closure_descendants')
+    descendant = models.ForeignKey('employee.Employee', on_delete=models.CASCADE, related_name='closure_ancestors')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='unique_supervisor_closure_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['ancestor', 'depth'], name='supclosure_ancestor_depth_idx'),
+            models.Index(fields=['descendant'], name='supclosure_descendant_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor} > {self.descendant} (Depth {self.depth})"
     
     
 
@@ -118,6 +150,9 @@ class holiday(models.Model):
     class Meta:
         verbose_name = "Holiday"
         verbose_name_plural = "Holidays"
+        indexes = [
+            models.Index(fields=['from_date', 'to_date'], name='holiday_dates_idx'),
+        ]
 
     def clean(self):
         errors = []
@@ -140,7 +175,41 @@ class holiday(models.Model):
         
         super().save(*args, **kwargs)
 
-class LeaveRequest(models.Model):
+@receiver(post_save, sender=holiday)
+@receiver(post_delete, sender=holiday)
+def invalidate_holiday_calendar_cache(sender, **kwargs):
+    """Drop the cached holiday calendar so the next lookup reloads it"""
+    from .holiday_calendar import invalidate_holiday_calendar
+    invalidate_holiday_calendar()
+    # Also drop it after commit, in case another thread reloaded it mid-transaction
+    transaction.on_commit(invalidate_holiday_calendar)
+
+class LoadedValuesMixin:
+    """Remembers the stored values of a row, so the balance ledger can apply deltas on save"""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # The reloaded fields now hold the stored values
+        attnames = {}
+        for field in self._meta.concrete_fields:
+            attnames[field.name] = attnames[field.attname] = field.attname
+        if fields is None:
+            reloaded = set(attnames.values()) - self.get_deferred_fields()
+        else:
+            reloaded = {attnames[name] for name in fields if name in attnames}
+        self._loaded_values = {
+            **(getattr(self, '_loaded_values', None) or {}),
+            **{attname: getattr(self, attname) for attname in reloaded},
+        }
+
+
+class LeaveRequest(LoadedValuesMixin, models.Model):
     STATUS_CHOICES = [
         ('pending_L1', 'Pending Level 1'),
         ('pending_L2', 'Pending Level 2'),
@@ -163,36 +232,81 @@ class LeaveRequest(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'employee'], name='leavereq_status_employee_idx'),
+            # An employee's requests in a status over a date range (used days, overlaps)
+            models.Index(fields=['employee', 'status', 'from_date', 'to_date'], name='leavereq_emp_status_dates_idx'),
+            # An employee's requests of one policy, e.g. the last approved leave type
+            models.Index(fields=['employee', 'leave_policy', 'status'], name='leavereq_emp_policy_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.employee} - {self.leave_policy.get_leave_type_display()} ({self.status})"
-    
+
     def is_holiday_range(self, date):
-        holidays = holiday.objects.filter(from_date__lte=date, to_date__gte=date)
-        return holidays.exists()
+        from .holiday_calendar import get_holiday_calendar
+        return get_holiday_calendar().is_holiday(date)
     
-    def clean(self):
+    @staticmethod
+    def validation_errors(employee, leave_policy, from_date, to_date, cutoff_day,
+                          last_approved_policy=None, allowed_policy_ids=None):
+        """
+        Business rules for a new leave request, evaluated without touching the database.
+
+        `last_approved_policy` is the policy of the employee's latest approved request and
+        `allowed_policy_ids` the policies allowed after it (None when no sequence is defined).
+        """
         errors = []
 
-        if self.leave_policy:
-            if self.leave_policy.gender != 'any' and self.leave_policy.gender != self.employee.gender:
+        if leave_policy and employee:
+            if leave_policy.gender != 'any' and leave_policy.gender != employee.gender:
                 errors.append(
-                    f"This leave policy is only applicable for {self.leave_policy.gender} employees, "
-                    f"but {self.employee} is {self.employee.gender}."
+                    f"This leave policy is only applicable for {leave_policy.gender} employees, "
+                    f"but {employee} is {employee.gender}."
                 )
-        
-        try:
-            cutoff = CutOffDate.objects.first()
-            cutoff_day = cutoff.cut_off_day if cutoff else 25
-        except:
-            cutoff_day = 25
 
         today = date.today()
-        if today.day > cutoff_day and self.from_date.month == today.month and self.from_date.day<=cutoff_day:
-            errors.append(f"You cannot apply for leave for dates before or on the {cutoff_day}th of this month after the cutoff date.")
-        if today.day < cutoff_day and self.from_date.month < today.month and self.from_date.day<=cutoff_day:
-            errors.append(f"You cannot apply for leave for dates before or on the {cutoff_day}th of previous month before the cutoff date.")
+        if from_date:
+            if today.day > cutoff_day and from_date.month == today.month and from_date.day<=cutoff_day:
+                errors.append(f"You cannot apply for leave for dates before or on the {cutoff_day}th of this month after the cutoff date.")
+            if today.day < cutoff_day and from_date.month < today.month and from_date.day<=cutoff_day:
+                errors.append(f"You cannot apply for leave for dates before or on the {cutoff_day}th of previous month before the cutoff date.")
+
+        if employee and leave_policy and last_approved_policy and allowed_policy_ids is not None:
+            if leave_policy.pk not in allowed_policy_ids:
+                errors.append(
+                    f'{leave_policy.get_leave_type_display()} leave cannot be applied after '
+                    f'{last_approved_policy.get_leave_type_display()} leave.'
+                )
+
+        # Only validate dates if both are provided
+        if from_date and to_date:
+            if from_date > to_date:
+                errors.append("End date cannot be before start date")
+            
+            if leave_policy and leave_policy.effective_from == 'joining':
+                if employee and employee.joining_date:
+                    if from_date < employee.joining_date:
+                        errors.append('Leave cannot be applied before joining date.')
+            
+            if leave_policy and leave_policy.effective_from == 'confirmation':
+                if employee and employee.confirmation_date:
+                    if from_date < employee.confirmation_date:
+                        errors.append('Leave cannot be applied before confirmation date.') 
+            
+            if leave_policy and leave_policy.effective_from == 'one_year':
+                if employee and employee.joining_date:
+                    one_year_anniversary = employee.joining_date + timezone.timedelta(days=365)
+                    if from_date < one_year_anniversary:
+                        errors.append('Leave cannot be applied before one year of service.') 
+
+        return errors
+
+    def clean(self):
+        cutoff_day = config_cache.cutoff_day()
 
+        last_approved_policy = None
+        allowed_policy_ids = None
         if self.employee and self.leave_policy:
             last_approved = LeaveRequest.objects.filter(
                 employee=self.employee,
@@ -200,45 +314,48 @@ class LeaveRequest(models.Model):
             ).order_by('-created_at').first()
 
             if last_approved:
+                last_approved_policy = last_approved.leave_policy
                 try:
                     allowed_sequence = AllowedLeaveTypes.objects.get(
                         leave_policy=last_approved.leave_policy
                     )
-                    if not allowed_sequence.allowed_types.filter(pk=self.leave_policy.pk).exists():
-                        errors.append(
-                            f'{self.leave_policy.get_leave_type_display()} leave cannot be applied after '
-                            f'{last_approved.leave_policy.get_leave_type_display()} leave.'
-                        )
+                    allowed_policy_ids = set(allowed_sequence.allowed_types.values_list('pk', flat=True))
                 except AllowedLeaveTypes.DoesNotExist:
                     # No restrictions defined for this leave type
                     pass
 
-        
-        # Only validate dates if both are provided
-        if self.from_date and self.to_date:
-            if self.from_date > self.to_date:
-                errors.append("End date cannot be before start date")
-            
-            if self.leave_policy and self.leave_policy.effective_from == 'joining':
-                if self.employee and self.employee.joining_date and self.from_date:
-                    if self.from_date < self.employee.joining_date:
-                        errors.append('Leave cannot be applied before joining date.')
-            
-            if self.leave_policy and self.leave_policy.effective_from == 'confirmation':
-                if self.employee and self.employee.confirmation_date and self.from_date:
-                    if self.from_date < self.employee.confirmation_date:
-                        errors.append('Leave cannot be applied before confirmation date.') 
-            
-            if self.leave_policy and self.leave_policy.effective_from == 'one_year':
-                if self.employee and self.employee.joining_date and self.from_date:
-                    one_year_anniversary = self.employee.joining_date + timezone.timedelta(days=365)
-                    if self.from_date < one_year_anniversary:
-                        errors.append('Leave cannot be applied before one year of service.') 
-    
+        errors = self.validation_errors(
+            self.employee, self.leave_policy, self.from_date, self.to_date, cutoff_day,
+            last_approved_policy, allowed_policy_ids
+        )
         if errors:
             raise ValidationError(errors)
 
-        
+    DAY_COUNT_FIELDS = ('from_date', 'to_date', 'is_half_day', 'is_holiday')
+
+    def _day_count_inputs_changed(self):
+        """Whether days_count may differ from the stored value (always true for new rows)"""
+        loaded = getattr(self, '_loaded_values', None)
+        if not loaded or self.days_count is None:
+            return True
+        return any(field not in loaded or loaded[field] != getattr(self, field) for field in self.DAY_COUNT_FIELDS)
+
+    def calculate_days_count(self, calendar=None):
+        """Leave days between from_date and to_date, skipping holidays unless is_holiday is set"""
+        if calendar is None:
+            from .holiday_calendar import get_holiday_calendar
+            calendar = get_holiday_calendar()
+
+        if self.is_holiday:
+            days = (self.to_date - self.from_date).days + 1
+        else:
+            days = calendar.count_working_days(self.from_date, self.to_date)
+
+        if self.is_half_day and self.from_date == self.to_date:
+            days *= 0.5
+        return days
+
+    @instrument
     def save(self, *args, **kwargs):
         # Call clean method before saving
         # self.clean()
@@ -254,16 +371,8 @@ class LeaveRequest(models.Model):
         #         self.days_count = 1
         #     else:
         #         self.days_count = delta
-        if self.from_date and self.to_date:
-            days = 0
-            for i in range((self.to_date - self.from_date).days + 1):
-                day = self.from_date + timezone.timedelta(days=i)
-
-                if not self.is_holiday and self.is_holiday_range(day):
-                    continue
-
-                days += 0.5 if self.is_half_day and (self.to_date - self.from_date).days == 0 else 1
-            self.days_count = days
+        if self.from_date and self.to_date and self._day_count_inputs_changed():
+            self.days_count = self.calculate_days_count()
             
         
         # Set approved_at timestamp when status changes to approved/rejected
@@ -290,17 +399,25 @@ class LeaveApproval(models.Model):
     approve_date = models.DateTimeField(null=True, blank=True)
     comments = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Serves the approval inbox: a supervisor's pending approvals at a given level. Only
+            # pending rows are indexed, so it stays small however many decisions pile up.
+            models.Index(
+                fields=['supervisor', 'level'], condition=models.Q(status='pending'),
+                name='leaveappr_pending_inbox_idx'
+            ),
+            # The chain of one request, as walked by every approval transition
+            models.Index(fields=['leave_request', 'level', 'status'], name='leaveappr_req_lvl_status_idx'),
+        ]
+
     def __str__(self):
         return f"{self.leave_request} | Level-{self.level} | {self.status}"
             
     def clean(self):
         errors = []
 
-        try:
-            cutoff = CutOffDate.objects.first()
-            cutoff_day = cutoff.cut_off_day if cutoff else 25
-        except:
-            cutoff_day = 25
+        cutoff_day = config_cache.cutoff_day()
             
         today = date.today()
         if today.day > cutoff_day and self.leave_request.from_date.month == today.month and self.leave_request.from_date.day<=cutoff_day:
@@ -309,16 +426,8 @@ class LeaveApproval(models.Model):
         if errors:
             raise ValidationError(errors)
 
+    @instrument
     def save(self, *args, **kwargs):
-        # Track status changes for balance updates
-        old_status = None
-        if self.pk:
-            try:
-                old_instance = LeaveApproval.objects.get(pk=self.pk)
-                old_status = old_instance.status
-            except LeaveApproval.DoesNotExist:
-                pass
-        
         # Set approval timestamp
         if self.status in ['approved', 'rejected'] and not self.approve_date:
             self.approve_date = timezone.now()
@@ -331,75 +440,62 @@ class LeaveApproval(models.Model):
         # Handle workflow progression
         if self.leave_request and (self.status == 'approved' or self.status == 'rejected'):
             self._handle_workflow_progression()
-        
 
     def _handle_workflow_progression(self):
-        # try:
-        #     self.leave_request.full_clean()
-        #     self.leave_request.save()
-        # except ValidationError as e:
-        #     # Attach the error to this object so admin can display it
-        #     raise ValidationError({'__all__': e.messages})
-        leave_request = self.leave_request
-        
-        if self.status == 'rejected':
-            # Reject the entire request
-            leave_request.status = 'rejected'
-            leave_request.approved_at = timezone.now()
-            leave_request.save()
-            
-            # Reject ALL approvals when any supervisor rejects
-            LeaveApproval.objects.filter(
-                leave_request=leave_request
-            ).update(
-                status='rejected',
-                approve_date=timezone.now()
-            )
-        elif self.status == 'approved':
-            # Auto-approve all lower level approvals when a higher level approves
-            LeaveApproval.objects.filter(
-                leave_request=leave_request,
-                level__lt=self.level,
-                status='pending'
-            ).update(
-                status='approved',
-                approve_date=timezone.now()
-            )
-            
-            # Check if there are higher level approvals needed
-            next_level = self.level + 1
-            has_next_approval = LeaveApproval.objects.filter(
-                leave_request=leave_request,
-                level=next_level
-            ).exists()
-            
-            if has_next_approval:
-                # Move to next approval level
-                leave_request.status = f'pending_L{next_level}'
-                leave_request.save()
-            else:
-                # Final approval - update approved_at
-                leave_request.status = 'approved'
-                leave_request.approved_at = timezone.now()
-                leave_request.save()
+        from .approvals import LEAVE_APPROVALS
+        LEAVE_APPROVALS.transition([self])
+
+
+@receiver(post_save, sender=Supervisor)
+def update_supervisor_closure_on_save(sender, instance, created, raw=False, **kwargs):
+    """Keep the transitive hierarchy in step with a new or moved supervisor edge"""
+    if raw:
+        return
+    from . import hierarchy
+    edge = (instance.supervisor_id, instance.employee_id)
+    loaded = getattr(instance, '_loaded_edge', None)
+    if created or loaded is None:
+        hierarchy.link(*edge)
+    elif loaded != edge:
+        hierarchy.unlink({loaded[1], instance.employee_id})
+    instance._loaded_edge = edge
 
 
+@receiver(post_delete, sender=Supervisor)
+def update_supervisor_closure_on_delete(sender, instance, **kwargs):
+    from . import hierarchy
+    hierarchy.unlink({instance.employee_id})
+
 
 @receiver(post_save, sender=LeaveRequest)
+@instrument
 def create_approval_entries(sender, instance, created, **kwargs):
     """Create approval entries for new leave requests"""
     if created and instance.employee:
-        # Get supervisors ordered by level
-        supervisors = Supervisor.objects.filter(employee=instance.employee).order_by('level')
-        
-        for sup in supervisors:
-            LeaveApproval.objects.create(
-                leave_request=instance,
-                leave_policy=instance.leave_policy,
-                supervisor=sup,
-                level=sup.level,
-                status='pending'
+        from . import jobs
+        if jobs.queue_enabled():
+            jobs.enqueue(
+                'leave_management.approvals.create_leave_approval_chain',
+                {'request_id': instance.pk}, key=f'leave-approval-chain:{instance.pk}'
             )
+            return
+        from .approvals import LEAVE_APPROVALS
+        LEAVE_APPROVALS.create_chains([instance])
+
+@receiver(post_save, sender=LeaveRequest)
+def update_balance_ledger_on_save(sender, instance, raw=False, **kwargs):
+    """Apply balance ledger deltas when a leave request changes"""
+    if raw:
+        return
+    from .ledger import record_request_change
+    record_request_change(instance)
+
+
+@receiver(post_delete, sender=LeaveRequest)
+def update_balance_ledger_on_delete(sender, instance, **kwargs):
+    from .ledger import record_request_change
+    record_request_change(instance, deleted=True)
+
 
 class LeaveReset(models.Model):
     MONTH_CHOICES = [
@@ -435,7 +531,12 @@ class LeaveReset(models.Model):
     def get_current_period(cls, date):
         """Get the current leave period for a given date"""
         # Get the first active reset period (if exists)
-        reset_period = cls.objects.filter(is_active=True).first()
+        reset_period = config_cache.active_reset_period()
+        return cls.get_period_bounds(reset_period, date)
+
+    @staticmethod
+    def get_period_bounds(reset_period, date):
+        """Get the leave period containing date for an already loaded reset period"""
         # If no active reset period, return default calendar year
         if not reset_period:
             # Default to calendar year if no reset period is configured
@@ -460,5 +561,131 @@ class LeaveReset(models.Model):
         return start_date, end_date
 
 
+class LeaveBalance(models.Model):
+    """Running leave totals per employee, policy and reset period, kept in sync by ledger.py"""
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='leave_balances')
+    leave_policy = models.ForeignKey(LeavePolicy, on_delete=models.CASCADE, related_name='balances')
+    period_start = models.DateField()
+    period_end = models.DateField()
+    used_days = models.DecimalField(max_digits=6, decimal_places=1, default=0)
+    pending_days = models.DecimalField(max_digits=6, decimal_places=1, default=0)
+    probation_days = models.DecimalField(max_digits=6, decimal_places=1, default=0)
+    transferred_in = models.DecimalField(max_digits=7, decimal_places=2, default=0)
+    transferred_out = models.DecimalField(max_digits=7, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('employee', 'leave_policy', 'period_start')
+        indexes = [
+            models.Index(fields=['period_start', 'employee']),
+        ]
+        verbose_name = "Leave Balance"
+        verbose_name_plural = "Leave Balances"
+
+    def __str__(self):
+        return f"{self.employee} - {self.leave_policy} ({self.period_start} to {self.period_end})"
 
 
+class BackgroundJob(models.Model):
+    """A side effect deferred to the `run_jobs` worker, see jobs.py"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    # Dotted path of the function to call with `payload` as keyword arguments
+    task = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict, blank=True)
+    # At most one pending job per key; enqueueing it again while pending is a no-op
+    key = models.CharField(max_length=200, blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'], condition=models.Q(status='pending'), name='backgroundjob_pending_key_uniq'
+            ),
+        ]
+        indexes = [
+            # The worker's poll: due pending jobs and stale running ones, oldest first
+            models.Index(fields=['status', 'run_after'], name='backgroundjob_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} ({self.status})"
+
+
+@receiver(post_save, sender=CutOffDate)
+@receiver(post_delete, sender=CutOffDate)
+@receiver(post_save, sender=LeaveReset)
+@receiver(post_delete, sender=LeaveReset)
+@receiver(post_save, sender=LeaveGroup)
+@receiver(post_delete, sender=LeaveGroup)
+@receiver(post_save, sender=LeavePolicy)
+@receiver(post_delete, sender=LeavePolicy)
+def invalidate_leave_config_cache(sender, **kwargs):
+    """Drop the cached configuration read from this model so the next lookup reloads it"""
+    config_cache.invalidate_for(sender.__name__)
+    # Also drop it after commit, in case another thread reloaded it mid-transaction
+    transaction.on_commit(lambda: config_cache.invalidate_for(sender.__name__))
+
+
+@receiver(post_save, sender=LeaveReset)
+@receiver(post_delete, sender=LeaveReset)
+@receiver(post_save, sender=LeaveGroup)
+@receiver(post_delete, sender=LeaveGroup)
+@receiver(post_save, sender=LeavePolicy)
+@receiver(post_delete, sender=LeavePolicy)
+def invalidate_balance_responses_on_policy_change(sender, **kwargs):
+    from .balance_cache import policies_changed
+    policies_changed()
+
+
+@receiver(post_save, sender=LeaveReset)
+@receiver(post_delete, sender=LeaveReset)
+def rebuild_balance_ledger_on_reset_change(sender, raw=False, **kwargs):
+    """Ledger rows are keyed by reset period, so a new active reset regroups every row"""
+    if raw:
+        return
+    from .ledger import schedule_rebuild
+    schedule_rebuild()
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+def invalidate_balance_responses_on_employee_change(sender, instance, **kwargs):
+    """Leave group, probation dates and the name all show up in balance responses"""
+    from .balance_cache import employees_changed
+    employees_changed([instance.pk])
+
+
+@receiver(pre_save, sender=Employee)
+def remember_joining_date_change(sender, instance, raw=False, **kwargs):
+    if raw or not instance.pk:
+        return
+    old_joining_date = Employee.objects.filter(pk=instance.pk).values_list('joining_date', flat=True).first()
+    if old_joining_date != instance.joining_date:
+        instance._joining_date_changed = True
+
+
+@receiver(post_save, sender=Employee)
+def rebuild_balance_ledger_on_joining_date_change(sender, instance, **kwargs):
+    """Probation usage is counted from the joining date, so move it when that date changes"""
+    if instance.__dict__.pop('_joining_date_changed', False):
+        from .ledger import schedule_rebuild
+        schedule_rebuild([instance.pk])
+
+
+@receiver(post_save, sender=Supervisor)
+@receiver(post_delete, sender=Supervisor)
+def invalidate_balance_responses_on_team_change(sender, **kwargs):
+    from .balance_cache import roster_changed
+    roster_changed()
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Supervisor, LeavePolicy, LeaveRequest, LeaveApproval, AllowedLeaveTypes, CutOffDate, holiday
+from .models import Supervisor, LeavePolicy, LeaveRequest, LeaveApproval, AllowedLeaveTypes, holiday
+from . import config_cache
 from django.utils import timezone
 from datetime import date
 
@@ -50,11 +51,7 @@ class LeaveRequestSerializer(serializers.ModelSerializer):
             if leave_policy.gender != 'any' and leave_policy.gender != employee.gender:
                 raise serializers.ValidationError('Leave policy gender does not match with employee gender')
         
-        try:
-            cutoff = CutOffDate.objects.first()
-            cutoff_day = cutoff.cut_off_day if cutoff else 25
-        except:
-            cutoff_day = 25
+        cutoff_day = config_cache.cutoff_day()
             
         today = date.today()
         if today.day > cutoff_day and from_date.month == today.month and from_date.day<=cutoff_day:
@@ -112,17 +109,22 @@ class LeaveRequestSerializer(serializers.ModelSerializer):
         
         return data
 
+class LeaveRequestBulkItemSerializer(serializers.Serializer):
+    """Field-level parsing of one bulk submission row; business rules are checked per batch"""
+    employee = serializers.IntegerField()
+    leave_policy = serializers.IntegerField()
+    from_date = serializers.DateField()
+    to_date = serializers.DateField()
+    is_half_day = serializers.BooleanField(default=False)
+    reason = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
 class LeaveApprovalSerializer(serializers.ModelSerializer):
     leave_request_details = LeaveRequestSerializer(source='leave_request', read_only=True)
     supervisor = serializers.StringRelatedField()  # Changed to use method field
 
     def validate(self, data):
         leave_request = data.get('leave_request')
-        try:
-            cutoff = CutOffDate.objects.first()
-            cutoff_day = cutoff.cut_off_day if cutoff else 25
-        except:
-            cutoff_day = 25
+        cutoff_day = config_cache.cutoff_day()
             
         today = date.today()
         if today.day > cutoff_day and leave_request.from_date.month == today.month and leave_request.from_date.day<=cutoff_day:
@@ -140,3 +142,21 @@ class LeaveApprovalSerializer(serializers.ModelSerializer):
     #         return obj.supervisor.supervisor.employee_name
     #     return None
 
+class LeaveApprovalInboxSerializer(LeaveApprovalSerializer):
+    """An approval waiting on a supervisor, with enough request detail to act on it"""
+    employee_id = serializers.CharField(source='leave_request.employee.employee_id', read_only=True)
+    employee_name = serializers.CharField(source='leave_request.employee.__str__', read_only=True)
+    leave_type = serializers.CharField(source='leave_request.leave_policy.leave_type', read_only=True)
+    request_status = serializers.CharField(source='leave_request.status', read_only=True)
+    reason = serializers.CharField(source='leave_request.reason', read_only=True)
+
+    class Meta(LeaveApprovalSerializer.Meta):
+        fields = LeaveApprovalSerializer.Meta.fields + [
+            'level', 'created_date', 'employee_id', 'employee_name', 'leave_type', 'request_status', 'reason'
+        ]
+
+class ApprovalDecisionSerializer(serializers.Serializer):
+    """One approve/reject decision in a batch"""
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=['approved', 'rejected'])
+    comments = serializers.CharField(required=False, allow_blank=True, allow_null=True)
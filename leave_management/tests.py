@@ -1,24 +1,50 @@
+import json
+import re
+from datetime import date, datetime, time, timedelta
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+from unittest import skipUnless
 
-from django.test import TestCase
 from django.contrib.auth import get_user_model
-from employee.models import Employee
-from leave_management.models import LeaveGroup, LeavePolicy, LeaveRequest
-from leave_management.views import EmployeeLeaveBalanceAPI
-from datetime import date, timedelta
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from attendence.models import Attendance, AttendanceSummary, ShiftInOut
+from employee.models import Branch, Department, Employee
+from leave import benchmarks, synthetic
+from leave.instrumentation import hook_metrics, instrument
+from leave.middleware import QueryBudgetExceeded, QueryProfilingMiddleware, normalize_sql
+from leave.synthetic import OrgGenerator
+from leave_management import config_cache, hierarchy, jobs, ledger
+from leave_management.balance import LeaveBalanceEngine
+from leave_management.holiday_calendar import HolidayCalendar, get_holiday_calendar, invalidate_holiday_calendar
+from leave_management.models import (
+    AllowedLeaveTypes, BackgroundJob, CutOffDate, LeaveApproval, LeaveBalance, LeaveGroup, LeavePolicy,
+    LeaveRequest, LeaveReset, Supervisor, SupervisorClosure, holiday,
+)
+from leave_management.utils import LeaveBalanceCalculator, LeaveTransfer
+from leave_management.workdays import WorkingDayCounter, compile_weekmask
+from users.models import User
 
-# Create your tests here.
 
 class LeaveBalanceTestCase(TestCase):
     def setUp(self):
-        self.user = get_user_model().objects.create_user(
-            username='testuser',
-            password='password'
-        )
-        self.leave_group = LeaveGroup.objects.create(name='Test Group')
+        config_cache.invalidate_config_cache()
+        cache.clear()
+        CutOffDate.objects.create(cut_off_day=0)
+        self.user = User.objects.create(name='testuser', email='testuser@example.com')
+        self.leave_group = LeaveGroup.objects.create(id='test_group', name='Test Group')
         self.employee = Employee.objects.create(
             employee_id='123',
-            employee_name='Test Employee',
-            user=self.user,
+            employee_name=self.user,
             leave_group=self.leave_group,
             joining_date=date(2023, 1, 1)
         )
@@ -26,40 +52,1234 @@ class LeaveBalanceTestCase(TestCase):
             leave_type='emergency',
             total_leave_days=5,
             leave_group=self.leave_group,
+            count_weekends=True,
             is_active=True
         )
 
     def test_multiple_approved_leaves(self):
         # Create and approve the first leave request
-        leave1 = LeaveRequest.objects.create(
+        LeaveRequest.objects.create(
             employee=self.employee,
             leave_policy=self.leave_policy,
             from_date=date(2024, 2, 1),
             to_date=date(2024, 2, 2),
-            leave_days=2,
             status='approved'
         )
 
         # Create and approve the second leave request
-        leave2 = LeaveRequest.objects.create(
+        LeaveRequest.objects.create(
             employee=self.employee,
             leave_policy=self.leave_policy,
             from_date=date(2024, 3, 5),
             to_date=date(2024, 3, 5),
-            leave_days=1,
             status='approved'
         )
 
         # Calculate the leave balance
-        calculator = EmployeeLeaveBalanceAPI()
-        balance_data = calculator.get_employee_balance(
-            self.employee.employee_id,
-            date(2024, 1, 1),
-            date(2024, 12, 31)
+        response = self.client.get(
+            f'/leave/leave-balance/employee/{self.employee.employee_id}/',
+            {'from_date': '2024-01-01', 'to_date': '2024-12-31'}
         )
 
         # Verify the results
+        self.assertEqual(response.status_code, 200)
+        balance_data = response.json()
         self.assertEqual(len(balance_data), 1)
         balance = balance_data[0]
-        self.assertEqual(balance['total_used'], 3)
-        self.assertEqual(balance['remaining'], 2)
\ No newline at end of file
+        self.assertEqual(balance['used'], 3)
+        self.assertEqual(balance['remaining'], 2)
+
+
+class LeaveBalanceEngineTestCase(TestCase):
+    def setUp(self):
+        self.group = LeaveGroup.objects.create(id='general_regular', name='General Staff (Regular)')
+        self.other_group = LeaveGroup.objects.create(id='general_probation', name='General Staff (Probation)')
+        self.casual = LeavePolicy.objects.create(leave_type='casual', total_leave_days=12, leave_group=self.group)
+        self.medical = LeavePolicy.objects.create(leave_type='medical', total_leave_days=15, leave_group=self.group)
+        self.old_casual = LeavePolicy.objects.create(leave_type='casual', total_leave_days=10, leave_group=self.other_group)
+        self.employees = [self._create_employee(i) for i in range(3)]
+
+    def _create_employee(self, index):
+        user = User.objects.create(name=f'user{index}', email=f'user{index}@example.com')
+        return Employee.objects.create(
+            employee_id=f'E{index}',
+            employee_name=user,
+            leave_group=self.group,
+            employment_type='general_regular',
+            joining_date=date(2020, 1, 1)
+        )
+
+    def _add_request(self, employee, policy, from_date, to_date, days, status):
+        # bulk_create skips save() validation, which depends on today's cut-off date
+        LeaveRequest.objects.bulk_create([LeaveRequest(
+            employee=employee, leave_policy=policy, from_date=from_date,
+            to_date=to_date, days_count=days, status=status
+        )])
+        ledger.rebuild(employee_ids=[employee.pk])
+
+    def test_used_pending_and_transfers(self):
+        employee = self.employees[0]
+        self._add_request(employee, self.casual, date(2024, 2, 1), date(2024, 2, 2), 2, 'approved')
+        self._add_request(employee, self.casual, date(2024, 3, 5), date(2024, 3, 5), 0.5, 'approved')
+        self._add_request(employee, self.old_casual, date(2024, 4, 1), date(2024, 4, 1), 1, 'pending_L1')
+        self._add_request(employee, self.casual, date(2023, 4, 1), date(2023, 4, 1), 1, 'approved')
+        LeaveTransfer.objects.create(
+            employee=employee, from_leave_policy=self.old_casual, to_leave_policy=self.casual,
+            from_leave_group=self.other_group, to_leave_group=self.group,
+            days_transferred=3, year=date(2024, 1, 15)
+        )
+
+        engine = LeaveBalanceEngine(date(2024, 1, 1), date(2024, 12, 31))
+        rows = engine.balances_for(Employee.objects.filter(pk=employee.pk))
+
+        self.assertEqual([row['leave_type'] for row in rows], ['casual', 'medical'])
+        casual = rows[0]
+        self.assertEqual(casual['used'], 2.5)
+        self.assertEqual(casual['pending'], 1)
+        self.assertEqual(casual['transferred_in'], 3)
+        self.assertEqual(casual['transferred_out'], 0)
+        self.assertEqual(casual['remaining'], 12 - 2.5 - 1 - 3)
+        self.assertEqual(rows[1]['remaining'], 15)
+
+    def test_probation_adjustment(self):
+        employee = self.employees[1]
+        Employee.objects.filter(pk=employee.pk).update(
+            employment_type='general_probation', joining_date=date(2024, 1, 1)
+        )
+        self._add_request(employee, self.casual, date(2024, 2, 1), date(2024, 2, 1), 1, 'approved')
+        self._add_request(employee, self.casual, date(2024, 6, 1), date(2024, 6, 1), 1, 'approved')
+
+        engine = LeaveBalanceEngine(date(2024, 1, 1), date(2024, 12, 31))
+        casual = engine.balances_for(Employee.objects.filter(pk=employee.pk))[0]
+
+        self.assertEqual(casual['used'], 2)
+        self.assertEqual(casual['probation_adjustment'], 1)
+
+    def test_query_count_does_not_grow_with_employees(self):
+        for employee in self.employees:
+            self._add_request(employee, self.casual, date(2024, 2, 1), date(2024, 2, 1), 1, 'approved')
+
+        engine = LeaveBalanceEngine(date(2024, 1, 1), date(2024, 12, 31))
+        # Active policies come from the config cache once it is warm
+        config_cache.active_policies_by_group()
+        with self.assertNumQueries(2):
+            engine.balances_for(Employee.objects.filter(pk=self.employees[0].pk))
+        with self.assertNumQueries(2):
+            rows = engine.balances_for(Employee.objects.all())
+        self.assertEqual(len(rows), 6)
+
+    def test_balance_endpoints(self):
+        supervisor = self.employees[0]
+        for employee in self.employees[1:]:
+            Supervisor.objects.create(employee=employee, supervisor=supervisor, level=1)
+
+        response = self.client.get('/leave/leave-balance/employee/E1/', {'year': 2024})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+        response = self.client.get('/leave/leave-balance/supervisor/E0/', {'year': 2024})
+        self.assertEqual({row['employee_id'] for row in response.json()}, {'E1', 'E2'})
+
+        response = self.client.get('/leave/leave-balance/', {'year': 2024})
+        self.assertEqual(len(response.json()), 6)
+
+
+class LeaveBalanceLedgerTestCase(TestCase):
+    def setUp(self):
+        # A cut-off day of 0 disables the cut-off validation so tests don't depend on today's date
+        CutOffDate.objects.create(cut_off_day=0)
+        self.group = LeaveGroup.objects.create(id='general_regular', name='General Staff (Regular)')
+        self.policy = LeavePolicy.objects.create(leave_type='casual', total_leave_days=12, leave_group=self.group)
+        user = User.objects.create(name='ledger', email='ledger@example.com')
+        self.employee = Employee.objects.create(
+            employee_id='L1', employee_name=user, leave_group=self.group,
+            employment_type='general_regular', joining_date=date(2020, 1, 1)
+        )
+
+    def _balance(self):
+        return LeaveBalance.objects.get(employee=self.employee, leave_policy=self.policy, period_start=date(2024, 1, 1))
+
+    def test_status_changes_move_days_between_columns(self):
+        request = LeaveRequest.objects.create(
+            employee=self.employee, leave_policy=self.policy,
+            from_date=date(2024, 5, 6), to_date=date(2024, 5, 8)
+        )
+        self.assertEqual((self._balance().pending_days, self._balance().used_days), (3, 0))
+
+        request = LeaveRequest.objects.get(pk=request.pk)
+        request.status = 'approved'
+        request.save()
+        self.assertEqual((self._balance().pending_days, self._balance().used_days), (0, 3))
+
+        request.delete()
+        self.assertEqual((self._balance().pending_days, self._balance().used_days), (0, 0))
+
+    def test_refreshed_requests_apply_their_delta_once(self):
+        request = LeaveRequest.objects.create(
+            employee=self.employee, leave_policy=self.policy,
+            from_date=date(2024, 5, 6), to_date=date(2024, 5, 8)
+        )
+        stale = LeaveRequest.objects.get(pk=request.pk)
+        elsewhere = LeaveRequest.objects.get(pk=request.pk)
+        elsewhere.status = 'approved'
+        elsewhere.save()
+
+        stale.refresh_from_db()
+        stale.status = 'rejected'
+        stale.save()
+        self.assertEqual((self._balance().pending_days, self._balance().used_days), (0, 0))
+        self.assertEqual(ledger.rebuild(dry_run=True), [])
+
+    def test_rebuild_reports_and_fixes_drift(self):
+        LeaveRequest.objects.create(
+            employee=self.employee, leave_policy=self.policy, status='approved',
+            from_date=date(2024, 5, 6), to_date=date(2024, 5, 6)
+        )
+        LeaveBalance.objects.update(used_days=5)
+
+        drift = ledger.rebuild(dry_run=True)
+        self.assertEqual([(entry.field, entry.stored, entry.expected) for entry in drift], [('used_days', 5, 1)])
+        self.assertEqual(self._balance().used_days, 5)
+
+        output = StringIO()
+        call_command('rebuild_leave_balances', stdout=output)
+        self.assertIn('Corrected drift in 1 balance rows', output.getvalue())
+        self.assertEqual(self._balance().used_days, 1)
+        self.assertEqual(ledger.rebuild(), [])
+
+    def test_backfill_migration_fills_the_ledger(self):
+        LeaveRequest.objects.create(
+            employee=self.employee, leave_policy=self.policy, status='approved',
+            from_date=date(2024, 5, 6), to_date=date(2024, 5, 7)
+        )
+        LeaveBalance.objects.all().delete()
+
+        migration = import_module('leave_management.migrations.0013_backfill_leave_balances')
+        state = MigrationExecutor(connection).loader.project_state(('leave_management', '0013_backfill_leave_balances'))
+        migration.backfill_leave_balances(state.apps, None)
+        self.assertEqual(self._balance().used_days, 2)
+        self.assertEqual(ledger.rebuild(dry_run=True), [])
+
+    def test_reset_change_regroups_ledger_rows(self):
+        config_cache.invalidate_config_cache()
+        LeaveRequest.objects.create(
+            employee=self.employee, leave_policy=self.policy, status='approved',
+            from_date=date(2024, 5, 6), to_date=date(2024, 5, 6)
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reset = LeaveReset.objects.create(start_month=7, start_day=1, end_month=6, end_day=30)
+        fiscal = LeaveBalance.objects.get(employee=self.employee, period_start=date(2023, 7, 1))
+        self.assertEqual((fiscal.period_end, fiscal.used_days), (date(2024, 6, 30), 1))
+        self.assertEqual(self._balance().used_days, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reset.delete()
+        self.assertEqual(self._balance().used_days, 1)
+        self.assertEqual(ledger.rebuild(dry_run=True), [])
+
+    def test_joining_date_change_recounts_probation_days(self):
+        LeaveRequest.objects.create(
+            employee=self.employee, leave_policy=self.policy, status='approved',
+            from_date=date(2024, 5, 6), to_date=date(2024, 5, 6)
+        )
+        self.assertEqual(self._balance().probation_days, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.employee.joining_date = date(2024, 4, 1)
+            self.employee.save()
+        self.assertEqual(self._balance().probation_days, 1)
+        self.assertEqual(ledger.rebuild(dry_run=True), [])
+
+
+class HolidayCalendarTestCase(TestCase):
+    def setUp(self):
+        invalidate_holiday_calendar()
+        config_cache.invalidate_config_cache()
+
+    def test_range_queries_on_merged_intervals(self):
+        calendar = HolidayCalendar([
+            (date(2024, 3, 26), date(2024, 3, 26)),
+            (date(2024, 4, 9), date(2024, 4, 12)),
+            (date(2024, 4, 11), date(2024, 4, 14)),
+            (date(2024, 4, 15), date(2024, 4, 15)),
+        ])
+
+        self.assertEqual(len(calendar), 2)
+        self.assertTrue(calendar.is_holiday(date(2024, 4, 13)))
+        self.assertFalse(calendar.is_holiday(date(2024, 4, 16)))
+        self.assertEqual(calendar.count_holidays(date(2024, 3, 1), date(2024, 4, 30)), 8)
+        self.assertEqual(calendar.count_holidays(date(2024, 4, 10), date(2024, 4, 11)), 2)
+        self.assertEqual(calendar.count_working_days(date(2024, 4, 1), date(2024, 4, 30)), 23)
+        self.assertEqual(
+            calendar.holidays_between(date(2024, 4, 14), date(2024, 5, 1)),
+            [date(2024, 4, 14), date(2024, 4, 15)]
+        )
+
+    def test_signals_invalidate_cached_calendar(self):
+        self.assertFalse(get_holiday_calendar().is_holiday(date(2024, 12, 16)))
+        victory_day = holiday.objects.create(name='Victory Day', from_date=date(2024, 12, 16), to_date=date(2024, 12, 16))
+        self.assertTrue(get_holiday_calendar().is_holiday(date(2024, 12, 16)))
+        victory_day.delete()
+        self.assertFalse(get_holiday_calendar().is_holiday(date(2024, 12, 16)))
+
+    def test_leave_request_day_count_does_not_query_per_day(self):
+        CutOffDate.objects.create(cut_off_day=0)
+        group = LeaveGroup.objects.create(id='general_regular', name='General Staff (Regular)')
+        policy = LeavePolicy.objects.create(leave_type='maternity', total_leave_days=180, leave_group=group)
+        user = User.objects.create(name='holiday', email='holiday@example.com')
+        employee = Employee.objects.create(employee_id='H1', employee_name=user, leave_group=group)
+        holiday.objects.create(name='Eid', from_date=date(2024, 4, 9), to_date=date(2024, 4, 12))
+        get_holiday_calendar()
+
+        request = LeaveRequest(employee=employee, leave_policy=policy, from_date=date(2024, 1, 1), to_date=date(2024, 6, 28))
+        with CaptureQueriesContext(connection) as queries:
+            request.save()
+
+        self.assertEqual(request.days_count, 180 - 4)
+        self.assertLess(len(queries), 20)
+
+
+class WorkingDayCounterTestCase(TestCase):
+    def setUp(self):
+        self.calendar = HolidayCalendar([(date(2024, 4, 9), date(2024, 4, 12))])
+        self.counter = WorkingDayCounter(self.calendar)
+        self.policy = SimpleNamespace(count_weekends=False, count_holidays=False, allow_half_day=True)
+
+    def _naive_count(self, start, end, office_days, count_weekends, count_holidays):
+        weekend = compile_weekmask(office_days).weekend_days
+        days = 0
+        while start <= end:
+            if (count_weekends or start.weekday() not in weekend) and (count_holidays or not self.calendar.is_holiday(start)):
+                days += 1
+            start += timedelta(days=1)
+        return days
+
+    def test_matches_day_by_day_walk(self):
+        for office_days in ('Monday-Friday', 'Sunday-Thursday', 'Saturday-Wednesday', 'bogus', ''):
+            for start, end in [
+                (date(2024, 4, 1), date(2024, 4, 30)),
+                (date(2024, 4, 10), date(2024, 4, 10)),
+                (date(2024, 1, 3), date(2024, 12, 29)),
+                (date(2024, 4, 13), date(2024, 4, 15)),
+            ]:
+                for count_weekends in (False, True):
+                    for count_holidays in (False, True):
+                        self.assertEqual(
+                            self.counter.count(start, end, office_days, count_weekends, count_holidays),
+                            self._naive_count(start, end, office_days, count_weekends, count_holidays),
+                            (office_days, start, end, count_weekends, count_holidays)
+                        )
+
+    def test_weekend_days_and_half_days(self):
+        employee = SimpleNamespace(office_days='Sunday-Thursday')
+        self.assertEqual(LeaveBalanceCalculator.get_weekend_days(employee), [4, 5])
+        # Wednesday, half day
+        self.assertEqual(self.counter.count_for(date(2024, 4, 3), date(2024, 4, 3), employee, self.policy, True), 0.5)
+        # Friday is a weekend day for this employee
+        self.assertEqual(self.counter.count_for(date(2024, 4, 5), date(2024, 4, 5), employee, self.policy, True), 0)
+
+    def test_batch_counts(self):
+        regular = SimpleNamespace(office_days='Monday-Friday')
+        teacher = SimpleNamespace(office_days='Sunday-Thursday')
+        counts = self.counter.count_many([
+            (date(2024, 4, 1), date(2024, 4, 7), regular, self.policy),
+            (date(2024, 4, 1), date(2024, 4, 7), teacher, self.policy),
+            (date(2024, 4, 8), date(2024, 4, 8), regular, self.policy, True),
+        ])
+        self.assertEqual(counts, [5, 5, 0.5])
+
+
+class BulkLeaveSubmissionTestCase(TestCase):
+    url = '/leave/api/leave-requests/bulk/'
+
+    def setUp(self):
+        invalidate_holiday_calendar()
+        config_cache.invalidate_config_cache()
+        CutOffDate.objects.create(cut_off_day=0)
+        self.group = LeaveGroup.objects.create(id='general_regular', name='General Staff (Regular)')
+        self.casual = LeavePolicy.objects.create(leave_type='casual', total_leave_days=12, leave_group=self.group)
+        self.medical = LeavePolicy.objects.create(leave_type='medical', total_leave_days=15, leave_group=self.group)
+        self.employees = []
+        for index in range(4):
+            user = User.objects.create(name=f'bulk{index}', email=f'bulk{index}@example.com')
+            self.employees.append(Employee.objects.create(
+                employee_id=f'B{index}', employee_name=user, leave_group=self.group,
+                employment_type='general_regular', joining_date=date(2020, 1, 1)
+            ))
+        self.manager = self.employees[0]
+        for employee in self.employees[1:]:
+            Supervisor.objects.create(employee=employee, supervisor=self.manager, level=1)
+        holiday.objects.create(name='Eid', from_date=date(2024, 4, 10), to_date=date(2024, 4, 11))
+
+    def _row(self, employee, policy=None, from_date='2024-04-09', to_date='2024-04-12'):
+        return {
+            'employee': employee.pk, 'leave_policy': (policy or self.casual).pk,
+            'from_date': from_date, 'to_date': to_date,
+        }
+
+    def test_valid_rows_are_created_with_approvals_and_ledger(self):
+        response = self.client.post(self.url, [
+            self._row(self.employees[1]),
+            self._row(self.employees[2], from_date='2024-04-15', to_date='2024-04-15'),
+        ], content_type='application/json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['errors'], [])
+        created = response.json()['created']
+        # The two Eid days are not counted
+        self.assertEqual([row['days_count'] for row in created], ['2.0', '1.0'])
+        self.assertEqual(LeaveApproval.objects.filter(status='pending', level=1).count(), 2)
+        self.assertEqual(
+            LeaveBalance.objects.get(employee=self.employees[1], leave_policy=self.casual).pending_days, 2
+        )
+        self.assertEqual(ledger.rebuild(dry_run=True), [])
+
+    def test_failures_are_reported_per_row(self):
+        AllowedLeaveTypes.objects.create(leave_policy=self.medical).allowed_types.add(self.medical)
+        LeaveRequest.objects.bulk_create([LeaveRequest(
+            employee=self.employees[3], leave_policy=self.medical, status='approved',
+            from_date=date(2024, 3, 1), to_date=date(2024, 3, 1), days_count=1
+        )])
+
+        response = self.client.post(self.url, {'requests': [
+            self._row(self.employees[1]),
+            self._row(self.employees[2], from_date='2024-04-12', to_date='2024-04-09'),
+            self._row(self.employees[2], policy=SimpleNamespace(pk=999)),
+            {'employee': self.employees[2].pk},
+            self._row(self.employees[3]),
+            self._row(self.employees[3], policy=self.medical),
+        ]}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 207)
+        errors = {error['index']: error['errors'] for error in response.json()['errors']}
+        self.assertEqual(sorted(errors), [1, 2, 3, 4])
+        self.assertEqual(errors[1], {'non_field_errors': ['End date cannot be before start date']})
+        self.assertIn('leave_policy', errors[2])
+        self.assertIn('from_date', errors[3])
+        self.assertEqual(errors[4], {'non_field_errors': ['Casual Leave leave cannot be applied after Medical Leave leave.']})
+        self.assertEqual(len(response.json()['created']), 2)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def submit(rows):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.url, rows, content_type='application/json')
+            self.assertEqual(response.status_code, 201)
+            return len(queries)
+
+        # The holiday calendar and the config tables are loaded once per process, not per submission
+        get_holiday_calendar()
+        config_cache.cutoff_day()
+        config_cache.active_reset_period()
+        small = submit([self._row(self.employees[1])])
+        large = submit([
+            self._row(employee, policy, from_date=f'2024-05-{day:02d}', to_date=f'2024-05-{day:02d}')
+            for employee in self.employees for policy in (self.casual, self.medical) for day in (6, 7)
+        ])
+        self.assertEqual(small, large)
+
+
+class ApprovalChainMixin:
+    """Manager M supervises E1-E3 at level 1; director D supervises E1 at level 2"""
+
+    def setUp(self):
+        invalidate_holiday_calendar()
+        config_cache.invalidate_config_cache()
+        CutOffDate.objects.create(cut_off_day=0)
+        group = LeaveGroup.objects.create(id='general_regular', name='General Staff (Regular)')
+        self.policy = LeavePolicy.objects.create(leave_type='casual', total_leave_days=12, leave_group=group)
+        self.people = {}
+        for code in ('M', 'D', 'E1', 'E2', 'E3'):
+            user = User.objects.create(name=f'inbox {code}', email=f'{code.lower()}@example.com')
+            self.people[code] = Employee.objects.create(
+                employee_id=code, employee_name=user, leave_group=group, joining_date=date(2020, 1, 1)
+            )
+        for code in ('E1', 'E2', 'E3'):
+            Supervisor.objects.create(employee=self.people[code], supervisor=self.people['M'], level=1)
+        Supervisor.objects.create(employee=self.people['E1'], supervisor=self.people['D'], level=2)
+
+        self.requests = {
+            code: LeaveRequest.objects.create(
+                employee=self.people[code], leave_policy=self.policy,
+                from_date=date(2024, 5, 6), to_date=date(2024, 5, 7)
+            )
+            for code in ('E1', 'E2', 'E3')
+        }
+
+
+class LeaveApprovalInboxTestCase(ApprovalChainMixin, TestCase):
+    url = '/leave/api/leave-approvals/inbox/'
+
+    def _inbox(self, supervisor, **params):
+        return self.client.get(self.url, {'supervisor': supervisor, **params}).json()
+
+    def test_only_approvals_at_the_current_level_are_listed(self):
+        with self.assertNumQueries(2):
+            body = self._inbox('M')
+        self.assertEqual([row['employee_id'] for row in body['results']], ['E1', 'E2', 'E3'])
+        self.assertEqual(body['results'][0]['leave_type'], 'casual')
+        self.assertEqual(self._inbox('D')['results'], [])
+
+        approval = LeaveApproval.objects.get(leave_request=self.requests['E1'], level=1)
+        approval.status = 'approved'
+        approval.save()
+
+        self.assertEqual([row['employee_id'] for row in self._inbox('M')['results']], ['E2', 'E3'])
+        director = self._inbox('D')['results']
+        self.assertEqual([(row['employee_id'], row['level'], row['request_status']) for row in director],
+                         [('E1', 2, 'pending_L2')])
+
+    def test_cursor_pagination(self):
+        first = self._inbox('M', limit=2)
+        self.assertEqual(len(first['results']), 2)
+        second = self.client.get(first['next']).json()
+        self.assertEqual([row['employee_id'] for row in second['results']], ['E3'])
+        self.assertIsNone(second['next'])
+
+    def test_supervisor_is_required(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'supervisor': 'NOPE'}).status_code, 404)
+
+
+class LeaveApprovalBatchTestCase(ApprovalChainMixin, TestCase):
+    url = '/leave/api/leave-approvals/bulk-decide/'
+
+    def _approval(self, code, level=1):
+        return LeaveApproval.objects.get(leave_request=self.requests[code], level=level)
+
+    def _decide(self, decisions):
+        return self.client.post(self.url, decisions, content_type='application/json')
+
+    def _request_status(self, code):
+        return LeaveRequest.objects.get(pk=self.requests[code].pk).status
+
+    def test_decisions_progress_the_workflow(self):
+        response = self._decide([
+            {'id': self._approval('E1').pk, 'status': 'approved', 'comments': 'ok'},
+            {'id': self._approval('E2').pk, 'status': 'rejected'},
+            {'id': self._approval('E3').pk, 'status': 'approved'},
+        ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['request_status'] for row in response.json()['decided']], ['pending_L2', 'rejected', 'approved'])
+        self.assertEqual(
+            [self._request_status(code) for code in ('E1', 'E2', 'E3')], ['pending_L2', 'rejected', 'approved']
+        )
+        self.assertEqual(self._approval('E1').comments, 'ok')
+        self.assertEqual(self._approval('E1', level=2).status, 'pending')
+        self.assertIsNotNone(LeaveRequest.objects.get(pk=self.requests['E3'].pk).approved_at)
+
+        # The director now approves E1's request at level 2
+        response = self._decide([{'id': self._approval('E1', level=2).pk, 'status': 'approved'}])
+        self.assertEqual(self._request_status('E1'), 'approved')
+
+        balance = LeaveBalance.objects.get(employee=self.people['E3'], leave_policy=self.policy)
+        self.assertEqual((balance.used_days, balance.pending_days), (2, 0))
+        self.assertEqual(ledger.rebuild(dry_run=True), [])
+
+    def test_saving_one_approval_uses_the_same_workflow(self):
+        director = self._approval('E1', level=2)
+        director.status = 'approved'
+        director.save()
+        self.assertEqual(self._request_status('E1'), 'approved')
+        self.assertEqual(self._approval('E1').status, 'approved')
+
+        approval = self._approval('E2')
+        approval.status = 'rejected'
+        approval.save()
+        self.assertEqual(self._request_status('E2'), 'rejected')
+        self.assertIsNotNone(LeaveRequest.objects.get(pk=self.requests['E2'].pk).approved_at)
+
+        balance = LeaveBalance.objects.get(employee=self.people['E1'], leave_policy=self.policy)
+        self.assertEqual((balance.used_days, balance.pending_days), (2, 0))
+        self.assertEqual(ledger.rebuild(dry_run=True), [])
+
+    def test_failures_are_reported_per_row(self):
+        self._decide([{'id': self._approval('E2').pk, 'status': 'rejected'}])
+
+        response = self._decide([
+            {'id': self._approval('E1').pk, 'status': 'approved'},
+            {'id': self._approval('E2').pk, 'status': 'approved'},
+            {'id': 999, 'status': 'approved'},
+            {'id': self._approval('E3').pk, 'status': 'maybe'},
+            {'id': self._approval('E1', level=2).pk, 'status': 'approved'},
+        ])
+
+        self.assertEqual(response.status_code, 207)
+        errors = {error['index']: error['errors'] for error in response.json()['errors']}
+        self.assertEqual(sorted(errors), [1, 2, 3, 4])
+        self.assertEqual(errors[1], {'non_field_errors': ['This approval has already been rejected.']})
+        self.assertIn('id', errors[2])
+        self.assertIn('status', errors[3])
+        self.assertIn('already covers', errors[4]['non_field_errors'][0])
+        self.assertEqual(self._request_status('E1'), 'pending_L2')
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        def decide(codes):
+            with CaptureQueriesContext(connection) as queries:
+                self._decide([{'id': self._approval(code).pk, 'status': 'approved'} for code in codes])
+            return len(queries)
+
+        user = User.objects.create(name='inbox E4', email='e4@example.com')
+        self.people['E4'] = Employee.objects.create(employee_id='E4', employee_name=user, joining_date=date(2020, 1, 1))
+        Supervisor.objects.create(employee=self.people['E4'], supervisor=self.people['M'], level=1)
+        self.requests['E4'] = LeaveRequest.objects.create(
+            employee=self.people['E4'], leave_policy=self.policy,
+            from_date=date(2024, 5, 6), to_date=date(2024, 5, 7)
+        )
+
+        approvals = {code: self._approval(code) for code in ('E2', 'E3', 'E4')}
+        self._approval = lambda code: approvals[code]
+        # Every request here ends up approved, so the same UPDATEs run for one or many
+        self.assertEqual(decide(['E2']), decide(['E3', 'E4']))
+
+    def test_status_changes_keep_the_stored_day_count(self):
+        leave_request = LeaveRequest.objects.get(pk=self.requests['E1'].pk)
+        self.assertEqual(leave_request.days_count, 2)
+        holiday.objects.create(name='Declared later', from_date=date(2024, 5, 7), to_date=date(2024, 5, 7))
+
+        leave_request.status = 'pending_L2'
+        leave_request.save()
+        self.assertEqual(LeaveRequest.objects.get(pk=leave_request.pk).days_count, 2)
+
+        leave_request.to_date = date(2024, 5, 9)
+        leave_request.save()
+        self.assertEqual(LeaveRequest.objects.get(pk=leave_request.pk).days_count, 3)
+
+
+class SupervisorHierarchyTestCase(TestCase):
+    def setUp(self):
+        group = LeaveGroup.objects.create(id='hierarchy', name='Hierarchy')
+        LeavePolicy.objects.create(leave_type='casual', total_leave_days=12, leave_group=group)
+        self.people = {}
+        for name in ('head', 'vp', 'manager', 'staff1', 'staff2'):
+            user = User.objects.create(name=f'org-{name}', email=f'org-{name}@example.com')
+            self.people[name] = Employee.objects.create(
+                employee_id=name, employee_name=user, leave_group=group, joining_date=date(2020, 1, 1)
+            )
+        self._edge('head', 'vp')
+        self._edge('vp', 'manager')
+        self._edge('manager', 'staff1')
+        self._edge('manager', 'staff2')
+        # A shortcut: staff2 also reports to the vp directly, at approval level 2
+        self.shortcut = self._edge('vp', 'staff2', level=2)
+
+    def _edge(self, supervisor, employee, level=1):
+        return Supervisor.objects.create(supervisor=self.people[supervisor], employee=self.people[employee], level=level)
+
+    def _depths(self, ancestor):
+        return {
+            row.descendant.employee_id: row.depth
+            for row in SupervisorClosure.objects.filter(ancestor=self.people[ancestor]).select_related('descendant')
+        }
+
+    def _team(self, name, depth):
+        return set(hierarchy.team_members(self.people[name], depth).values_list('employee_id', flat=True))
+
+    def test_closure_follows_shortest_chains(self):
+        self.assertEqual(self._depths('head'), {'vp': 1, 'manager': 2, 'staff1': 3, 'staff2': 2})
+        self.assertEqual(self._team('vp', 1), {'manager', 'staff2'})
+        self.assertEqual(self._team('head', None), {'vp', 'manager', 'staff1', 'staff2'})
+
+        with self.assertNumQueries(1):
+            list(hierarchy.team_members(self.people['head'], None))
+
+    def test_removed_and_moved_edges(self):
+        self.shortcut.delete()
+        self.assertEqual(self._depths('head')['staff2'], 3)
+        self.assertEqual(self._team('vp', 1), {'manager'})
+
+        edge = Supervisor.objects.get(supervisor=self.people['vp'], employee=self.people['manager'])
+        edge.supervisor = self.people['head']
+        edge.save()
+        self.assertEqual(self._depths('head'), {'vp': 1, 'manager': 1, 'staff1': 2, 'staff2': 2})
+        self.assertEqual(self._depths('vp'), {})
+
+        incremental = set(SupervisorClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+        hierarchy.rebuild()
+        self.assertEqual(set(SupervisorClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth')), incremental)
+
+    def test_cycles_do_not_loop(self):
+        self._edge('staff1', 'head')
+        self.assertNotIn('staff1', self._depths('staff1'))
+        self.assertEqual(self._depths('staff1')['manager'], 3)
+
+    def test_supervisor_views_accept_depth(self):
+        response = self.client.get('/leave/leave-balance/supervisor/head/', {'year': 2024})
+        self.assertEqual({row['employee_id'] for row in response.json()}, {'vp'})
+
+        response = self.client.get('/leave/leave-balance/supervisor/head/', {'year': 2024, 'depth': 'all'})
+        self.assertEqual({row['employee_id'] for row in response.json()}, {'vp', 'manager', 'staff1', 'staff2'})
+
+        response = self.client.get('/attendance/supervisor/head/4/', {'year': 2024, 'depth': 2})
+        self.assertEqual(
+            {row['employee'] for row in response.json()},
+            {self.people[name].pk for name in ('vp', 'manager', 'staff2')}
+        )
+
+        self.assertEqual(self.client.get('/leave/leave-balance/supervisor/head/', {'depth': 0}).status_code, 400)
+        self.assertEqual(self.client.get('/attendance/supervisor/head/', {'depth': 'deep'}).status_code, 400)
+
+
+class LeaveConfigCacheTestCase(TestCase):
+    def setUp(self):
+        config_cache.invalidate_config_cache()
+        self.group = LeaveGroup.objects.create(id='general_regular', name='general_regular')
+
+    def _counts(self, name):
+        entry = config_cache.cache_stats().get(name, {'hits': 0, 'misses': 0})
+        return entry['hits'], entry['misses']
+
+    def test_hot_reads_skip_the_database_until_config_changes(self):
+        # Counters are process-wide, so compare against where this test started
+        cutoff_hits, cutoff_misses = self._counts('cutoff_day')
+        _, reset_misses = self._counts('reset_period')
+        CutOffDate.objects.create(cut_off_day=20)
+        self.assertEqual(config_cache.cutoff_day(), 20)
+        config_cache.active_reset_period()
+        with self.assertNumQueries(0):
+            self.assertEqual(config_cache.cutoff_day(), 20)
+            self.assertIsNone(config_cache.active_reset_period())
+            LeaveReset.get_current_period(date(2024, 3, 1))
+
+        cutoff = CutOffDate.objects.get()
+        cutoff.cut_off_day = 15
+        cutoff.save()
+        self.assertEqual(config_cache.cutoff_day(), 15)
+
+        LeaveReset.objects.create(start_month=7, start_day=1, end_month=6, end_day=30)
+        with self.assertNumQueries(1):
+            self.assertEqual(LeaveReset.get_current_period(date(2024, 3, 1)), (date(2023, 7, 1), date(2024, 6, 30)))
+
+        self.assertEqual(self._counts('cutoff_day'), (cutoff_hits + 1, cutoff_misses + 2))
+        self.assertEqual(self._counts('reset_period')[1], reset_misses + 2)
+
+    def test_policies_and_groups(self):
+        casual = LeavePolicy.objects.create(leave_type='casual', total_leave_days=12, leave_group=self.group)
+        LeavePolicy.objects.create(leave_type='medical', total_leave_days=15, leave_group=self.group, is_active=False)
+        self.assertEqual(config_cache.active_policies_by_group(), {self.group.pk: [casual]})
+        self.assertEqual(config_cache.get_leave_group('general_regular'), self.group)
+
+        annual = LeavePolicy.objects.create(leave_type='annual', total_leave_days=20, leave_group=self.group)
+        self.assertEqual(config_cache.active_policies_by_group()[self.group.pk], [casual, annual])
+
+        self.group.delete()
+        with self.assertRaises(LeaveGroup.DoesNotExist):
+            config_cache.get_leave_group('general_regular')
+        self.assertEqual(config_cache.active_policies_by_group(), {})
+
+    def test_invalidation_from_another_process(self):
+        CutOffDate.objects.create(cut_off_day=20)
+        self.assertEqual(config_cache.cutoff_day(), 20)
+
+        # Saved through another worker: this process only sees its generation bump
+        CutOffDate.objects.update(cut_off_day=12)
+        cache.incr(config_cache.GENERATION_KEY)
+        with override_settings(CONFIG_CACHE_SYNC_INTERVAL=3600):
+            self.assertEqual(config_cache.cutoff_day(), 20)
+            config_cache.sync_config_cache()
+            self.assertEqual(config_cache.cutoff_day(), 12)
+
+        CutOffDate.objects.update(cut_off_day=8)
+        cache.incr(config_cache.GENERATION_KEY)
+        with override_settings(CONFIG_CACHE_SYNC_INTERVAL=0):
+            self.assertEqual(config_cache.cutoff_day(), 8)
+
+
+class BalanceResponseCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        invalidate_holiday_calendar()
+        config_cache.invalidate_config_cache()
+        CutOffDate.objects.create(cut_off_day=0)
+        self.group = LeaveGroup.objects.create(id='general_regular', name='General Staff (Regular)')
+        self.other_group = LeaveGroup.objects.create(id='teachers_regular', name='Teachers (Regular)')
+        self.casual = LeavePolicy.objects.create(leave_type='casual', total_leave_days=12, leave_group=self.group)
+        LeavePolicy.objects.create(leave_type='annual', total_leave_days=20, leave_group=self.other_group)
+        self.employees = []
+        for index in range(2):
+            user = User.objects.create(name=f'cached{index}', email=f'cached{index}@example.com')
+            self.employees.append(Employee.objects.create(
+                employee_id=f'C{index}', employee_name=user, leave_group=self.group,
+                employment_type='general_regular', joining_date=date(2020, 1, 1)
+            ))
+
+    def _get(self, url, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(url, {'year': 2024}, **headers)
+
+    def test_repeat_requests_skip_recomputation(self):
+        url = '/leave/leave-balance/employee/C0/'
+        first = self._get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first['ETag'])
+
+        # Only the employee lookup; the balance comes from the cache
+        with self.assertNumQueries(1):
+            again = self._get(url)
+        self.assertEqual(again.json(), first.json())
+
+        with self.assertNumQueries(1):
+            not_modified = self._get(url, first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], first['ETag'])
+
+        etag = self._get('/leave/leave-balance/')['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self._get('/leave/leave-balance/', etag).status_code, 304)
+
+    def test_writes_invalidate_only_what_they_touch(self):
+        etags = {url: self._get(url)['ETag'] for url in (
+            '/leave/leave-balance/employee/C0/', '/leave/leave-balance/employee/C1/', '/leave/leave-balance/',
+        )}
+
+        response = self.client.post('/leave/api/leave-requests/bulk/', [{
+            'employee': self.employees[0].pk, 'leave_policy': self.casual.pk,
+            'from_date': '2024-04-09', 'to_date': '2024-04-10',
+        }], content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        changed = self._get('/leave/leave-balance/employee/C0/', etags['/leave/leave-balance/employee/C0/'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()[0]['pending'], 2)
+        self.assertEqual(self._get('/leave/leave-balance/employee/C1/', etags['/leave/leave-balance/employee/C1/']).status_code, 304)
+        self.assertEqual(self._get('/leave/leave-balance/', etags['/leave/leave-balance/']).status_code, 200)
+
+        # Moving an employee to another group changes the policies they are shown
+        etag = self._get('/leave/leave-balance/employee/C1/')['ETag']
+        employee = self.employees[1]
+        employee.leave_group = self.other_group
+        employee.save()
+        response = self._get('/leave/leave-balance/employee/C1/', etag)
+        self.assertEqual([row['leave_type'] for row in response.json()], ['annual'])
+
+        # As does editing a policy, for everyone
+        etag = self._get('/leave/leave-balance/employee/C0/')['ETag']
+        self.casual.total_leave_days = 14
+        self.casual.save()
+        response = self._get('/leave/leave-balance/employee/C0/', etag)
+        self.assertEqual(response.json()[0]['total_allowed'], 14)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Plans are checked against the SQLite EXPLAIN QUERY PLAN format')
+class HotQueryPlanTestCase(TestCase):
+    """The filters the API runs on every request must be answered from an index, never a table scan"""
+
+    def assertIndexed(self, queryset, *index_names):
+        plan = queryset.explain()
+        # "SCAN table" without "USING ... INDEX" reads every row
+        full_scans = [line for line in plan.splitlines() if re.search(r'\bSCAN \w+$', line)]
+        self.assertEqual(full_scans, [], plan)
+        # Names generated by Django (unique_together) are matched on their prefix
+        for name in index_names:
+            self.assertRegex(plan, rf'USING (COVERING )?INDEX {name}')
+
+    def test_leave_requests(self):
+        self.assertIndexed(LeaveRequest.objects.filter(
+            employee_id=1, status='approved', from_date__gte=date(2024, 1, 1), to_date__lte=date(2024, 12, 31)
+        ), 'leavereq_emp_status_dates_idx')
+        self.assertIndexed(
+            LeaveRequest.objects.filter(employee_id=1, leave_policy_id=2, status='approved'),
+            'leavereq_emp_policy_status_idx'
+        )
+        self.assertIndexed(LeaveRequest.objects.filter(employee_id=1, status='approved').order_by('-created_at')[:1])
+
+    def test_leave_approvals(self):
+        # Approval transitions walk the chain of one request
+        self.assertIndexed(
+            LeaveApproval.objects.filter(leave_request_id=1, level__lt=2, status='pending'),
+            'leaveappr_req_lvl_status_idx'
+        )
+        self.assertIndexed(LeaveApproval.objects.filter(leave_request_id=1, level=2), 'leaveappr_req_lvl_status_idx')
+        # The inbox reads only pending rows, from the partial index
+        self.assertIndexed(LeaveApproval.objects.filter(
+            supervisor__in=Supervisor.objects.filter(supervisor_id=1).values('pk'), status='pending', level=1
+        ), 'leaveappr_pending_inbox_idx')
+        self.assertIndexed(LeaveApproval.objects.filter(
+            Q(level=1, leave_request__status='pending_L1') | Q(level=2, leave_request__status='pending_L2'),
+            supervisor__in=Supervisor.objects.filter(supervisor_id=1).values('pk'),
+            status='pending'
+        ))
+
+    def test_holidays_and_employees(self):
+        self.assertIndexed(
+            holiday.objects.filter(from_date__lte=date(2024, 4, 30), to_date__gte=date(2024, 4, 1)),
+            'holiday_dates_idx'
+        )
+        self.assertIndexed(
+            Employee.objects.filter(status='active', leave_group__isnull=False), 'employee_status_group_idx'
+        )
+
+    def test_attendance(self):
+        start = timezone.make_aware(datetime(2024, 4, 1))
+        self.assertIndexed(Attendance.objects.filter(
+            employee_id__in=[1, 2], attendance_date__gte=start, attendance_date__lt=start + timedelta(days=1)
+        ), 'attendence_attendance_employee_id_attendance_date')
+        self.assertIndexed(AttendanceSummary.objects.filter(
+            employee_id__in=[1, 2], attendance_day__gte=date(2024, 4, 1), attendance_day__lte=date(2024, 4, 30)
+        ))
+        self.assertIndexed(Attendance.objects.order_by('-attendance_date', 'id')[:100], 'attendance_date_id_idx')
+        # Shift derivation groups punches by local day and filters them by local time
+        self.assertIndexed(Attendance.objects.filter(
+            employee_id__in=[1, 2], attendance_day__gte=date(2024, 4, 1), attendance_day__lte=date(2024, 4, 2),
+            attendance_time__gte=time(8, 0)
+        ), 'attendance_emp_day_time_idx')
+
+
+class BenchmarkSuiteTestCase(TestCase):
+    def setUp(self):
+        config_cache.invalidate_config_cache()
+        cache.clear()
+
+    def test_generated_org(self):
+        org = OrgGenerator(employees=12, team_size=2, days=14, seed=3).generate()
+
+        self.assertEqual(Employee.objects.count(), 12)
+        self.assertEqual(set(Supervisor.objects.values_list('level', flat=True)), {1, 2, 3})
+        # Employee 11 reports to 5, who reports to 2, who reports to the head
+        chain = Supervisor.objects.filter(employee=org.employees[11]).order_by('level')
+        self.assertEqual([row.supervisor for row in chain], [org.employees[5], org.employees[2], org.head])
+        self.assertEqual(hierarchy.team_members(org.head, max_depth=None).count(), 11)
+        self.assertTrue(Attendance.objects.exists())
+        self.assertTrue(ShiftInOut.objects.exists())
+        self.assertEqual(LeaveRequest.objects.filter(status='pending_L1').count(), 12)
+        # Two requests each, so every supervisor row has a pending and an approved decision
+        self.assertEqual(LeaveApproval.objects.filter(status='pending').count(), Supervisor.objects.count())
+        self.assertEqual(LeaveApproval.objects.filter(status='approved').count(), Supervisor.objects.count())
+        self.assertEqual(ledger.rebuild(dry_run=True), [])
+
+    def test_every_get_endpoint_is_measured(self):
+        org = OrgGenerator(employees=6, days=7).generate()
+        results = benchmarks.EndpointBenchmark(org, repeat=1).run()
+
+        self.assertIn('leaveapproval-inbox', results)
+        self.assertIn('supervisor-monthly-attendance-summary', results)
+        self.assertNotIn('leaverequest-bulk', results)
+        measured = {name: result for name, result in results.items() if 'skipped' not in result}
+        self.assertEqual({name: result['status'] for name, result in measured.items() if result['status'] != 200}, {})
+        self.assertEqual(measured['employee-leave-balance-detail']['url'], f'/leave/leave-balance/employee/{org.employees[1].employee_id}/')
+        self.assertTrue(all(result['queries'] > 0 and result['peak_kib'] > 0 for result in measured.values()))
+
+    def test_compare_reports_regressions(self):
+        def report(queries, wall_ms):
+            return {'scales': {'10': {'endpoints': {'employee-list': {'queries': queries, 'wall_ms': wall_ms}}}}}
+
+        self.assertEqual(benchmarks.compare(report(2, 10), report(2, 12)), [])
+        self.assertEqual(
+            benchmarks.compare(report(2, 10), report(40, 50)),
+            ['10 employee-list: 2 -> 40 queries', '10 employee-list: 10 -> 50 ms']
+        )
+
+
+class GenerateOrgCommandTestCase(TestCase):
+    def setUp(self):
+        config_cache.invalidate_config_cache()
+        cache.clear()
+        invalidate_holiday_calendar()
+
+    def test_generates_the_whole_organisation(self):
+        output = StringIO()
+        call_command('generate_org', employees=10, days=60, year=2024, stdout=output)
+
+        self.assertIn('Generated 10 employees for 2024', output.getvalue())
+        self.assertEqual(Employee.objects.count(), 10)
+        self.assertFalse(Employee.objects.filter(department=None).exists())
+        self.assertEqual(Department.objects.count(), len(synthetic.DEPARTMENTS))
+        self.assertEqual(Branch.objects.count(), len(synthetic.BRANCHES))
+        self.assertTrue(holiday.objects.filter(from_date=date(2024, 2, 21)).exists())
+        # No punches on the 21 February holiday or at weekends, and derivation was left for later
+        self.assertFalse(Attendance.objects.filter(attendance_day=date(2024, 2, 21)).exists())
+        self.assertFalse(Attendance.objects.filter(attendance_day=date(2024, 1, 6)).exists())
+        self.assertFalse(ShiftInOut.objects.exists())
+        self.assertEqual(ledger.rebuild(dry_run=True), [])
+
+        # A second org under another prefix reuses the reference data and holidays
+        call_command('generate_org', employees=3, days=10, year=2024, prefix='F', stdout=StringIO())
+        self.assertEqual(Employee.objects.count(), 13)
+        self.assertEqual(Department.objects.count(), len(synthetic.DEPARTMENTS))
+        self.assertEqual(Branch.objects.count(), len(synthetic.BRANCHES))
+        self.assertEqual(holiday.objects.filter(from_date=date(2024, 2, 21)).count(), 1)
+
+        with self.assertRaises(CommandError):
+            call_command('generate_org', employees=2, days=1, stdout=StringIO())
+
+    def test_raw_punches_match_the_orm(self):
+        org = OrgGenerator(employees=2, days=3, year=2024, leave_requests=0, derive=False).generate()
+
+        for punch in Attendance.objects.all():
+            day, moment = punch.attendance_day, punch.attendance_time
+            punch.fill_local_fields()
+            self.assertEqual((day, moment), (punch.attendance_day, punch.attendance_time))
+            self.assertEqual(punch.rfid_no, punch.employee.rfid_code)
+        self.assertEqual(org.counts['Attendance'], Attendance.objects.count())
+
+    def test_same_seed_with_or_without_signals(self):
+        def snapshot():
+            return (
+                list(Employee.objects.order_by('employee_id').values_list('employee_id', 'leave_group_id', 'department__name')),
+                list(Supervisor.objects.order_by('employee__employee_id', 'level').values_list('employee__employee_id', 'supervisor__employee_id')),
+                list(LeaveRequest.objects.order_by('employee__employee_id', 'from_date').values_list('employee__employee_id', 'from_date', 'to_date', 'days_count')),
+                sorted(Attendance.objects.values_list('rfid_no', 'attendance_date')),
+            )
+
+        OrgGenerator(employees=5, team_size=2, days=10, year=2024, leave_requests=1, seed=4).generate()
+        bulk = snapshot()
+        call_command('flush', interactive=False, verbosity=0)
+        cache.clear()
+        invalidate_holiday_calendar()
+        org = OrgGenerator(employees=5, team_size=2, days=10, year=2024, leave_requests=1, seed=4, signals=True).generate()
+
+        self.assertEqual(snapshot(), bulk)
+        self.assertEqual(org.counts['LeaveRequest'], 5)
+        # The approval chains came from the LeaveRequest receiver rather than the generator
+        self.assertEqual(LeaveApproval.objects.count(), Supervisor.objects.count())
+        self.assertEqual(ledger.rebuild(dry_run=True), [])
+
+
+@override_settings(QUERY_PROFILING=True, QUERY_PROFILING_SAMPLE_RATE=1.0, QUERY_PROFILING_REPEAT_THRESHOLD=5)
+class QueryProfilingMiddlewareTestCase(TestCase):
+    def setUp(self):
+        config_cache.invalidate_config_cache()
+        cache.clear()
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql('SELECT "a"."id" FROM "a" WHERE ("a"."b" IN (%s, %s, %s) AND "a"."c" = \'x\')\n LIMIT 21'),
+            'SELECT "a"."id" FROM "a" WHERE ("a"."b" IN (...) AND "a"."c" = ?) LIMIT ?'
+        )
+        self.assertEqual(normalize_sql('SELECT * FROM t1 WHERE id IN (%s)'), normalize_sql('SELECT * FROM t1 WHERE id IN (%s, %s)'))
+
+    def test_headers_and_log(self):
+        with self.assertLogs('leave.queries', 'INFO') as logs:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/employee/employees/')
+
+        self.assertEqual(response['X-Query-Count'], str(len(queries)))
+        self.assertRegex(response['Server-Timing'], rf'^db;dur=[\d.]+;desc="{len(queries)} queries", total;dur=[\d.]+$')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['view'], record['status'], record['queries']), ('employee-list', 200, len(queries)))
+        self.assertEqual(record['repeated'], [])
+
+    def test_repeated_statements_are_flagged(self):
+        def per_row_loop(request):
+            for pk in range(6):
+                Employee.objects.filter(pk=pk).exists()
+            Employee.objects.count()
+            return HttpResponse()
+
+        with self.assertLogs('leave.queries', 'WARNING') as logs:
+            response = QueryProfilingMiddleware(per_row_loop)(RequestFactory().get('/'))
+
+        self.assertEqual(response['X-Query-Count'], '7')
+        [repeated] = json.loads(logs.records[0].getMessage())['repeated']
+        self.assertEqual(repeated['count'], 6)
+        self.assertIn('"employee_employee"."id" = ?', repeated['sql'])
+
+    def test_streaming_responses_are_profiled_until_consumed(self):
+        def rows():
+            for pk in range(3):
+                yield str(Employee.objects.filter(pk=pk).count())
+
+        middleware = QueryProfilingMiddleware(lambda request: StreamingHttpResponse(rows()))
+        with self.assertLogs('leave.queries', 'INFO') as logs:
+            response = middleware(RequestFactory().get('/'))
+            self.assertNotIn('X-Query-Count', response)
+            self.assertEqual(b''.join(response.streaming_content), b'000')
+
+        [record] = [json.loads(log.getMessage()) for log in logs.records]
+        self.assertEqual((record['queries'], record['streaming']), (3, True))
+
+    def test_query_budget(self):
+        with override_settings(QUERY_BUDGETS={'employee-list': 0}):
+            with self.assertLogs('leave.queries', 'WARNING') as logs:
+                self.assertEqual(self.client.get('/employee/employees/').status_code, 200)
+            self.assertEqual(json.loads(logs.records[0].getMessage())['budget'], 0)
+
+            with override_settings(QUERY_BUDGET_STRICT=True), self.assertLogs('leave.queries'):
+                with self.assertRaisesRegex(QueryBudgetExceeded, 'employee-list ran \\d+ queries, over its budget of 0'):
+                    self.client.get('/employee/employees/')
+
+    def test_disabled(self):
+        with override_settings(QUERY_PROFILING=False):
+            self.assertNotIn('X-Query-Count', self.client.get('/employee/employees/'))
+
+
+@override_settings(HOOK_METRICS=True)
+class HookMetricsTestCase(ApprovalChainMixin, TestCase):
+    def setUp(self):
+        hook_metrics.reset()
+        super().setUp()
+
+    def test_hooks_are_counted(self):
+        stats = hook_metrics.stats()
+        self.assertEqual(stats['employee.models.set_employee_dates']['calls'], 5)
+        self.assertEqual(stats['leave_management.models.LeaveRequest.save']['calls'], 3)
+        chains = stats['leave_management.models.create_approval_entries']
+        self.assertEqual((chains['calls'], chains['errors']), (3, 0))
+        self.assertGreaterEqual(chains['queries'], 3)
+        # The receiver runs inside save(), so save() includes its queries and time
+        self.assertGreater(stats['leave_management.models.LeaveRequest.save']['queries'], chains['queries'])
+
+        approval = LeaveApproval.objects.get(leave_request=self.requests['E2'])
+        approval.status = 'approved'
+        approval.save()
+        self.assertEqual(hook_metrics.stats()['leave_management.models.LeaveApproval.save']['calls'], 1)
+
+    def test_errors_and_switch(self):
+        @instrument(name='failing')
+        def failing():
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            failing()
+        self.assertEqual(hook_metrics.stats()['failing']['errors'], 1)
+
+        with override_settings(HOOK_METRICS=False), self.assertRaises(ValueError):
+            failing()
+        self.assertEqual(hook_metrics.stats()['failing']['calls'], 1)
+
+    def test_metrics_endpoint(self):
+        config_cache.cutoff_day()
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE leave_hook_calls_total counter', lines)
+        self.assertIn('leave_hook_calls_total{hook="leave_management.models.LeaveRequest.save"} 3', lines)
+        self.assertTrue(any(line.startswith('leave_hook_seconds_total{hook="employee.models.set_employee_dates"} ') for line in lines))
+        self.assertIn('leave_config_cache_cached{entry="cutoff_day"} 1', lines)
+
+    def test_metrics_endpoint_is_restricted(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.9').status_code, 403)
+
+        staff = get_user_model().objects.create_user('ops', password='secret', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.9').status_code, 200)
+
+
+def failing_job(message):
+    raise ValueError(message)
+
+
+@override_settings(JOB_QUEUE=True, JOB_MAX_ATTEMPTS=2, JOB_RETRY_DELAY=30)
+class BackgroundJobTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        invalidate_holiday_calendar()
+        config_cache.invalidate_config_cache()
+        CutOffDate.objects.create(cut_off_day=0)
+        self.group = LeaveGroup.objects.create(id='general_regular', name='General Staff (Regular)')
+        self.other_group = LeaveGroup.objects.create(id='teachers_regular', name='Teachers (Regular)')
+        self.casual = LeavePolicy.objects.create(leave_type='casual', total_leave_days=12, leave_group=self.group)
+        LeavePolicy.objects.create(leave_type='casual', total_leave_days=10, leave_group=self.other_group)
+        self.people = {}
+        for code in ('M', 'E1'):
+            user = User.objects.create(name=f'job {code}', email=f'job-{code.lower()}@example.com')
+            self.people[code] = Employee.objects.create(
+                employee_id=code, employee_name=user, leave_group=self.group,
+                employment_type='general_regular', joining_date=date(2020, 1, 1), rfid_code=f'RF-{code}'
+            )
+        Supervisor.objects.create(employee=self.people['E1'], supervisor=self.people['M'], level=1)
+
+    def test_approval_chain_is_deferred_to_the_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            request = LeaveRequest.objects.create(
+                employee=self.people['E1'], leave_policy=self.casual, from_date=date(2024, 5, 6), to_date=date(2024, 5, 7)
+            )
+            # Nothing is queued until the request is committed
+            self.assertFalse(BackgroundJob.objects.exists())
+        self.assertFalse(LeaveApproval.objects.exists())
+        job = BackgroundJob.objects.get()
+        self.assertEqual((job.key, job.payload), (f'leave-approval-chain:{request.pk}', {'request_id': request.pk}))
+
+        self.assertEqual(jobs.run_pending(), (1, 0))
+        self.assertEqual(LeaveApproval.objects.get().supervisor.supervisor, self.people['M'])
+        self.assertEqual(BackgroundJob.objects.get().status, 'done')
+
+        # Running it again (a reclaimed job) does not duplicate the chain
+        job.status = 'pending'
+        job.save()
+        self.assertEqual(jobs.run_pending(), (1, 0))
+        self.assertEqual(LeaveApproval.objects.count(), 1)
+
+    def test_retries_then_fails(self):
+        job = jobs.add_job('leave_management.tests.failing_job', {'message': 'boom'})
+
+        self.assertEqual(jobs.run_pending(), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('pending', 1))
+        self.assertIn('ValueError: boom', job.last_error)
+        # Backing off, so not due yet
+        self.assertIsNone(jobs.claim())
+
+        retried = jobs.claim(now=job.run_after)
+        self.assertEqual(retried.pk, job.pk)
+        self.assertFalse(jobs.run_job(retried))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+
+    def test_keys_collapse_pending_jobs(self):
+        first = jobs.add_job('leave_management.tests.failing_job', {'message': 'a'}, key='same')
+        self.assertEqual(jobs.add_job('leave_management.tests.failing_job', {'message': 'a'}, key='same'), first)
+
+        BackgroundJob.objects.filter(pk=first.pk).update(status='done')
+        self.assertNotEqual(jobs.add_job('leave_management.tests.failing_job', {'message': 'a'}, key='same'), first)
+
+    def test_abandoned_job_is_claimed_again(self):
+        job = jobs.add_job('leave_management.tests.failing_job', {'message': 'a'})
+        BackgroundJob.objects.filter(pk=job.pk).update(status='running', locked_at=timezone.now())
+        self.assertIsNone(jobs.claim())
+
+        BackgroundJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.claim().pk, job.pk)
+
+    def test_leave_group_change_is_deferred(self):
+        today = date.today()
+        LeaveRequest.objects.bulk_create([LeaveRequest(
+            employee=self.people['E1'], leave_policy=self.casual, from_date=date(today.year, 1, 2),
+            to_date=date(today.year, 1, 3), days_count=2, status='approved'
+        )])
+        employee = self.people['E1']
+        employee.leave_group = self.other_group
+        with self.captureOnCommitCallbacks(execute=True):
+            employee.save()
+        self.assertFalse(LeaveTransfer.objects.exists())
+
+        self.assertEqual(jobs.run_pending(), (1, 0))
+        transfer = LeaveTransfer.objects.get()
+        self.assertEqual((transfer.from_leave_group, transfer.to_leave_group, transfer.days_transferred), (self.group, self.other_group, 2))
+
+    def test_failed_save_queues_no_transfer(self):
+        employee = self.people['E1']
+        employee.leave_group = self.other_group
+        # Taken by M, so the UPDATE fails after the pre_save receivers have run
+        employee.rfid_code = 'RF-M'
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                employee.save()
+        self.assertEqual(callbacks, [])
+        self.assertFalse(BackgroundJob.objects.exists())
+
+        # Nor does a save whose transaction is rolled back afterwards
+        employee.rfid_code = 'RF-E1'
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(ValueError), transaction.atomic():
+                employee.save()
+                raise ValueError
+        self.assertEqual(callbacks, [])
+        self.assertFalse(BackgroundJob.objects.exists())
+
+    def test_punches_share_one_derivation_job(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/attendance/api/attendance/punches/', [
+                {'rfid_no': 'RF-E1', 'attendance_date': '2024-05-06T09:05:00+06:00'},
+                {'rfid_no': 'RF-E1', 'attendance_date': '2024-05-06T18:10:00+06:00'},
+            ], content_type='application/json')
+            self.assertEqual(response.status_code, 201)
+            Attendance.objects.create(employee=self.people['M'], rfid_no='RF-M', attendance_date=timezone.make_aware(datetime(2024, 5, 6, 9, 0)))
+        self.assertEqual(BackgroundJob.objects.filter(status='pending').count(), 1)
+
+        output = StringIO()
+        call_command('run_jobs', once=True, stdout=output)
+        self.assertIn('Ran 1 jobs, 0 failed', output.getvalue())
+        self.assertTrue(ShiftInOut.objects.filter(employee=self.people['E1']).exists())
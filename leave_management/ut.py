@@ -9,59 +9,14 @@ class LeaveBalanceCalculator:
     @classmethod
     def get_weekend_days(cls, employee):
         """Determine weekend days based on office_days"""
-        if not employee.office_days:
-            return [5, 6]  # Default to Saturday, Sunday
-        
-        try:
-            if '-' in employee.office_days:  # Range format
-                start, end = employee.office_days.lower().split('-')
-                start_day = cls.DAY_MAP[start.strip()]
-                end_day = cls.DAY_MAP[end.strip()]
-                
-                working_days = []
-                current = start_day
-                
-                if start_day <= end_day:
-                    working_days = list(range(start_day, end_day + 1))
-                else:
-                    working_days = list(range(start_day, 7)) + list(range(0, end_day + 1))
-                
-                return sorted(set(range(7)) - set(working_days))
-                
-        except (ValueError, KeyError):
-            return [5, 6]  # Fallback to Sat/Sun
-        
-        return [5, 6]
+        from .workdays import compile_weekmask
+        return list(compile_weekmask(employee.office_days).weekend_days)
     
     @classmethod
     def calculate_leave_days(cls, start_date, end_date, employee, policy, is_half_day=False):
         """Calculate effective leave days considering all rules"""
-        delta = end_date - start_date
-        weekend_days = cls.get_weekend_days(employee)
-        days = 0
-        
-        # Single day leave
-        if delta.days == 0:
-            date = start_date
-            is_weekend = date.weekday() in weekend_days
-            # is_holiday = cls.is_holiday(date, employee)  # Uncomment when implemented
-            
-            if (policy.count_weekends or not is_weekend):  # and (policy.count_holidays or not is_holiday):
-                if policy.allow_half_day and is_half_day:
-                    return 0.5
-                return 1
-            return 0
-        
-        # Multi-day leave
-        for i in range(delta.days + 1):
-            date = start_date + timedelta(days=i)
-            
-            if not policy.count_weekends and date.weekday() in weekend_days:
-                continue
-                
-            days += 1
-        
-        return days
+        from .workdays import WorkingDayCounter
+        return WorkingDayCounter().count_for(start_date, end_date, employee, policy, is_half_day)
     
     @classmethod
     def get_leave_period_for_date(cls, target_date=None):
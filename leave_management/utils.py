@@ -1,14 +1,16 @@
-from .models import LeaveReset, LeavePolicy, LeaveGroup, LeaveRequest
+from .models import LeaveReset, LeavePolicy, LeaveGroup, LeaveRequest, LoadedValuesMixin
+from .workdays import WorkingDayCounter, compile_weekmask
 from employee.models import Employee
 from django.utils import timezone
-from datetime import date, timedelta
-from django.db.models.signals import pre_save
+from datetime import date
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
+from leave.instrumentation import instrument
 from django.db import models
 import uuid
 
 
-class LeaveTransfer(models.Model):
+class LeaveTransfer(LoadedValuesMixin, models.Model):
     """Tracks leave transfers when employees change leave groups"""
     employee = models.ForeignKey('employee.Employee', on_delete=models.CASCADE, related_name='leave_transfers', blank=True, null=True)
     from_leave_policy = models.ForeignKey(LeavePolicy, on_delete=models.CASCADE, related_name='transfers_out', blank=True, null=True)
@@ -51,45 +53,16 @@ class LeaveBalanceCalculator:
 
     @classmethod
     def get_weekend_days(cls, employee):
-        if not employee.office_days:
-            return [5, 6]
-
-        try:
-            if '-' in employee.office_days:
-                start, end = employee.office_days.lower().split('-')
-                start_day = cls.DAY_MAP[start.strip()]
-                end_day = cls.DAY_MAP[end.strip()]
-
-                if start_day <= end_day:
-                    working_days = list(range(start_day, end_day + 1))
-                else:
-                    working_days = list(range(start_day, 7)) + list(range(0, end_day + 1))
-
-                return sorted(set(range(7)) - set(working_days))
-
-        except (ValueError, KeyError):
-            return [5, 6]
-
-        return [5, 6]
+        return list(compile_weekmask(employee.office_days).weekend_days)
 
     @classmethod
     def calculate_leave_days(cls, from_date, to_date, employee, policy, is_half_day=False):
-        delta = to_date - from_date
-        weekend_days = cls.get_weekend_days(employee)
-        days = 0
-
-        for i in range(delta.days + 1):
-            current_day = from_date + timedelta(days=i)
+        return WorkingDayCounter().count_for(from_date, to_date, employee, policy, is_half_day)
 
-            if not policy.count_weekends and current_day.weekday() in weekend_days:
-                continue
-
-            if policy.allow_half_day and is_half_day and delta.days == 0:
-                return 0.5
-
-            days += 1
-
-        return days
+    @classmethod
+    def calculate_leave_days_many(cls, ranges):
+        """Batch variant taking (from_date, to_date, employee, policy[, is_half_day]) tuples"""
+        return WorkingDayCounter().count_many(ranges)
 
     @classmethod
     def get_leave_period_for_date(cls, target_date=None):
@@ -102,7 +75,23 @@ class LeaveBalanceCalculator:
         return cls.get_leave_period_for_date(date(year, 1, 1))
 
 
+@receiver(post_save, sender=LeaveTransfer)
+def update_balance_ledger_on_transfer_save(sender, instance, raw=False, **kwargs):
+    """Apply balance ledger deltas when handle_leave_group_change writes transfers"""
+    if raw:
+        return
+    from .ledger import record_transfer_change
+    record_transfer_change(instance)
+
+
+@receiver(post_delete, sender=LeaveTransfer)
+def update_balance_ledger_on_transfer_delete(sender, instance, **kwargs):
+    from .ledger import record_transfer_change
+    record_transfer_change(instance, deleted=True)
+
+
 @receiver(pre_save, sender=Employee)
+@instrument
 def handle_leave_group_change(sender, instance, **kwargs):
     if not instance.pk:
         return
@@ -115,6 +104,38 @@ def handle_leave_group_change(sender, instance, **kwargs):
     if old_employee.leave_group == instance.leave_group:
         return
 
+    from . import jobs
+    if jobs.queue_enabled():
+        # Queued from post_save, once the UPDATE has succeeded
+        instance._leave_group_change = (old_employee.leave_group_id, instance.leave_group_id)
+        return
+    _transfer_leave(instance, old_employee.leave_group)
+
+
+@receiver(post_save, sender=Employee)
+def queue_leave_transfer(sender, instance, raw=False, **kwargs):
+    change = instance.__dict__.pop('_leave_group_change', None)
+    if change is None or raw:
+        return
+    from . import jobs
+    from_group, to_group = change
+    jobs.enqueue('leave_management.utils.transfer_leave_for_group_change', {
+        'employee_id': instance.pk, 'from_group': from_group, 'to_group': to_group,
+    })
+
+
+def transfer_leave_for_group_change(employee_id, from_group, to_group):
+    """Job run for a leave group change when the job queue is on"""
+    employee = Employee.objects.filter(pk=employee_id).first()
+    if employee is None:
+        return
+    # The change this job was queued for, even if the employee has moved on since;
+    # the job for the next change follows it
+    employee.leave_group_id = to_group
+    _transfer_leave(employee, LeaveGroup.objects.filter(pk=from_group).first())
+
+
+def _transfer_leave(instance, old_leave_group):
     current_date = timezone.now().date()
     reset_start, reset_end = LeaveReset.get_current_period(current_date)
 
@@ -132,10 +153,10 @@ def handle_leave_group_change(sender, instance, **kwargs):
             return
 
         last_transfer = existing_transfers.last()
-        if last_transfer.to_leave_group == old_employee.leave_group:
+        if last_transfer.to_leave_group == old_leave_group:
             _update_existing_transfer(
                 employee=instance,
-                old_employee=old_employee,
+                old_leave_group=old_leave_group,
                 current_date=current_date,
                 existing_transfer=last_transfer,
                 reset_start=reset_start,
@@ -143,10 +164,10 @@ def handle_leave_group_change(sender, instance, **kwargs):
             )
             return
 
-    _create_or_update_transfers(instance, old_employee, current_date, reset_start, reset_end)
+    _create_or_update_transfers(instance, old_leave_group, current_date, reset_start, reset_end)
 
 
-def _update_existing_transfer(employee, old_employee, current_date, existing_transfer, reset_start, reset_end):
+def _update_existing_transfer(employee, old_leave_group, current_date, existing_transfer, reset_start, reset_end):
     new_policies = LeavePolicy.objects.filter(
         leave_group=employee.leave_group,
         is_active=True
@@ -169,14 +190,14 @@ def _update_existing_transfer(employee, old_employee, current_date, existing_tra
         existing_transfer.days_transferred = total_used_days
         existing_transfer.notes = (
             f"Updated: {existing_transfer.from_leave_group}→"
-            f"{old_employee.leave_group}→{employee.leave_group}"
+            f"{old_leave_group}→{employee.leave_group}"
         )
         existing_transfer.save()
 
 
-def _create_or_update_transfers(employee, old_employee, current_date, reset_start, reset_end):
+def _create_or_update_transfers(employee, old_leave_group, current_date, reset_start, reset_end):
     old_policies = LeavePolicy.objects.filter(
-        leave_group=old_employee.leave_group,
+        leave_group=old_leave_group,
         is_active=True
     )
 
@@ -219,11 +240,11 @@ def _create_or_update_transfers(employee, old_employee, current_date, reset_star
                         employee=employee,
                         from_leave_policy=old_policy,
                         to_leave_policy=new_policy,
-                        from_leave_group=old_employee.leave_group,
+                        from_leave_group=old_leave_group,
                         to_leave_group=employee.leave_group,
                         days_transferred=total_used_days,
                         year=current_date,
-                        notes=f"Transfer: {old_employee.leave_group}→{employee.leave_group}"
+                        notes=f"Transfer: {old_leave_group}→{employee.leave_group}"
                     )
 
 
@@ -3,10 +3,9 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.utils import timezone
 from datetime import datetime
-from django.db.models import Max, Sum
+from django.db.models import Max, Q
 from django.core.exceptions import ValidationError
 from django.shortcuts import get_object_or_404
-from datetime import timedelta
 from django.contrib.auth import get_user_model
 from django.db import models
 from datetime import date
@@ -18,11 +17,18 @@ from .serializers import (
     LeavePolicySerializer, 
     LeaveRequestSerializer, 
     LeaveApprovalSerializer,
+    LeaveApprovalInboxSerializer,
     HolidaySerializer
 )
 
 from rest_framework.views import APIView
-from .utils import LeaveBalanceCalculator, LeaveTransfer
+from .utils import LeaveBalanceCalculator
+from .balance import LeaveBalanceEngine
+from . import balance_cache
+from .approvals import LEAVE_APPROVALS, LeaveApprovalBatch
+from .hierarchy import parse_depth, team_members
+from .bulk import BulkLeaveSubmission
+from leave.pagination import KeysetPagination
 from .models import Supervisor
 
 
@@ -48,6 +54,34 @@ class LeaveRequestViewSet(viewsets.ModelViewSet):
     queryset = LeaveRequest.objects.all()
     serializer_class = LeaveRequestSerializer
 
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Submit many leave requests at once.
+
+        Accepts a list of requests (or {"requests": [...]}). Valid rows are created and
+        invalid ones are reported by their index in the submitted list.
+        """
+        rows = request.data.get('requests') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not rows:
+            return Response(
+                {'error': 'Expected a non-empty list of leave requests'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        created, errors = BulkLeaveSubmission(rows).run()
+        if not errors:
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+
+        return Response({
+            'created': self.get_serializer(created, many=True).data,
+            'errors': errors,
+        }, status=response_status)
+
     # @action(detail=False, methods=['get'], url_path='employee/(?P<employee_id>\d+)')
     # def employee_requests(self, request, employee_id=None):
     #     """Get all leave requests for a specific employee"""
@@ -77,6 +111,65 @@ class LeaveApprovalViewSet(viewsets.ModelViewSet):
     queryset = LeaveApproval.objects.all()
     serializer_class = LeaveApprovalSerializer
 
+    @action(detail=False, methods=['get'], url_path='inbox')
+    def inbox(self, request):
+        """
+        Approvals a supervisor can act on now: ?supervisor=<employee_id>
+
+        Only pending approvals whose level matches the request's current pending_L{n}
+        status are returned, oldest first, with cursor pagination (?limit=, ?cursor=).
+        """
+        supervisor_id = request.query_params.get('supervisor')
+        if not supervisor_id:
+            return Response({'error': 'supervisor is required'}, status=status.HTTP_400_BAD_REQUEST)
+        supervisor = get_object_or_404(Employee, employee_id=supervisor_id)
+
+        # pending_L1 requests wait on level 1 approvals, pending_L2 on level 2, ...
+        current_level = Q()
+        for value, _ in LeaveRequest.STATUS_CHOICES:
+            if value.startswith('pending_L'):
+                current_level |= Q(level=int(value[len('pending_L'):]), leave_request__status=value)
+
+        approvals = LeaveApproval.objects.filter(
+            current_level,
+            supervisor__in=Supervisor.objects.filter(supervisor=supervisor).values('pk'),
+            status='pending'
+        ).select_related(
+            'leave_request__employee__employee_name',
+            'leave_request__leave_policy',
+            'supervisor__supervisor__employee_name',
+            'supervisor__employee__employee_name',
+        )
+
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(approvals, request, view=self)
+        return paginator.get_paginated_response(LeaveApprovalInboxSerializer(page, many=True).data)
+
+    @action(detail=False, methods=['post'], url_path='bulk-decide')
+    def bulk_decide(self, request):
+        """
+        Approve or reject many approvals at once: [{"id": ..., "status": "approved", "comments": ...}, ...]
+
+        All accepted decisions and the resulting workflow moves are applied in one
+        transaction; rejected rows are reported by their index in the submitted list.
+        """
+        rows = request.data.get('decisions') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not rows:
+            return Response({'error': 'Expected a non-empty list of decisions'}, status=status.HTTP_400_BAD_REQUEST)
+
+        decided, errors = LeaveApprovalBatch(rows).run()
+        if not errors:
+            response_status = status.HTTP_200_OK
+        elif decided:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+
+        return Response({
+            'decided': [LEAVE_APPROVALS.describe(approval) for approval in decided],
+            'errors': errors,
+        }, status=response_status)
+
     # @action(detail=False, methods=['get'], url_path='pending')
     # def pending_approvals(self, request):
     #     """Get all pending leave approvals"""
@@ -173,163 +266,44 @@ def ensure_date(val):
 
 
 class EmployeeLeaveBalanceAPI(APIView):
-    def get_employees_balance_by_supervisor(self, supervisor_employee_id, from_date, to_date):
+    def get_employees_balance_by_supervisor(self, supervisor_employee_id, from_date, to_date, depth=1):
         try:
-            supervisor = Employee.objects.get(employee_id=supervisor_employee_id)
-            supervisor_entries = Supervisor.objects.filter(supervisor=supervisor)
-
-            if not supervisor_entries.exists():
-                return []
+            from_date = ensure_date(from_date)
+            to_date = ensure_date(to_date)
 
-            employee_ids = [entry.employee.id for entry in supervisor_entries]
+            def compute():
+                supervisor = Employee.objects.get(employee_id=supervisor_employee_id)
+                supervised_employees = team_members(supervisor, depth).filter(
+                    status='active',
+                    leave_group__isnull=False
+                )
+                return LeaveBalanceEngine(from_date, to_date).balances_for(supervised_employees)
 
-            supervised_employees = Employee.objects.filter(
-                id__in=employee_ids,
-                status='active',
-                leave_group__isnull=False
+            return balance_cache.cached_response(
+                self.request,
+                balance_cache.roster_scope('supervisor', supervisor_employee_id, depth, from_date, to_date),
+                compute
             )
 
-            all_balances = []
-            for employee in supervised_employees:
-                try:
-                    employee_balances = self.get_employee_balance(
-                        employee.employee_id, from_date, to_date
-                    )
-                    if isinstance(employee_balances, Response):
-                        all_balances.extend(employee_balances.data)
-                    else:
-                        all_balances.extend(employee_balances)
-                except Exception:
-                    continue
-
-            return Response(all_balances)
-
         except Employee.DoesNotExist:
             raise Exception(f"Supervisor with employee_id {supervisor_employee_id} not found")
         except Exception as e:
             raise Exception(f"Error getting employees balance by supervisor: {str(e)}")
 
-    def calculate_transferred_days(self, employee, policy, from_date, to_date):
-        """Calculate transferred in/out days for a specific policy and period"""
-        reset_start, reset_end = LeaveBalanceCalculator.get_leave_period_for_date(from_date)
-
-        # Calculate transferred IN - days that came FROM other leave groups TO current leave group
-        # This should match leave type and current leave group
-        transferred_in_qs = LeaveTransfer.objects.filter(
-            employee=employee,
-            to_leave_policy__leave_type=policy.leave_type,
-            to_leave_group=employee.leave_group,
-            year__range=(reset_start, reset_end),
-            is_reversed=False
-        )
-        transferred_in = transferred_in_qs.aggregate(total=Sum('days_transferred'))['total'] or 0
-
-        # Calculate transferred OUT - days that went FROM current leave group TO other leave groups
-        # This should match leave type and the from_leave_group should be current group
-        transferred_out_qs = LeaveTransfer.objects.filter(
-        employee=employee,
-        from_leave_policy__leave_type=policy.leave_type,
-        from_leave_group=employee.leave_group,  # Current group was the source
-        year__range=(reset_start, reset_end),
-        is_reversed=False
-    ).exclude(
-        to_leave_group=employee.leave_group  # Exclude transfers within same group
-    )
-        transferred_out = transferred_out_qs.aggregate(total=Sum('days_transferred'))['total'] or 0
-
-        return float(transferred_in), float(transferred_out)
-
     def get_employee_balance(self, employee_id, from_date, to_date):
         try:
             from_date = ensure_date(from_date)
             to_date = ensure_date(to_date)
 
             employee = Employee.objects.get(employee_id=employee_id)
-            if not employee.leave_group:
+            if not employee.leave_group_id:
                 return Response({"error": "Employee has no leave group assigned"}, status=400)
 
-            policies = LeavePolicy.objects.filter(leave_group=employee.leave_group, is_active=True)
-            balances = []
-
-            for policy in policies:
-                # Get the leave period for proper filtering
-                reset_start, reset_end = LeaveBalanceCalculator.get_leave_period_for_date(from_date)
-                
-                # Calculate USED days - use already stored days_count from approved leaves
-                # Filter by leave_type to include leaves from any leave group (for transfers)
-                approved_leaves = LeaveRequest.objects.filter(
-                    employee=employee,
-                    leave_policy=policy,  # Match by leave type, not specific policy
-                    status='approved',
-                    from_date__gte=reset_start,  # Use reset period, not from_date/to_date
-                    to_date__lte=reset_end
-                )
-
-                # Use the stored days_count instead of recalculating
-                current_used = sum(
-                    float(leave.days_count or 0) for leave in approved_leaves
-                )
-
-                # Calculate transferred days properly
-                transferred_in, transferred_out = self.calculate_transferred_days(
-                    employee, policy, from_date, to_date
-                )
-
-                # Calculate PENDING days - use stored days_count
-                pending_leaves = LeaveRequest.objects.filter(
-                    employee=employee,
-                    leave_policy__leave_type=policy.leave_type,
-                    status__in=['pending_L1', 'pending_L2', 'pending_L3'],
-                    from_date__gte=reset_start,
-                    to_date__lte=reset_end
-                )
-
-                pending_days = sum(
-                    float(leave.days_count or 0) for leave in pending_leaves
-                )
-
-                # Probation adjustment calculation
-                probation_adjustment = 0
-                if hasattr(employee, 'joining_date') and employee.joining_date and employee.employment_type and employee.employment_type.endswith('probation'):
-                    probation_end_date = employee.joining_date + timedelta(days=90)
-                    if from_date <= probation_end_date:
-                        probation_leaves = approved_leaves.filter(to_date__lte=probation_end_date)
-                        probation_adjustment = sum(
-                            float(leave.days_count or 0) for leave in probation_leaves
-                        )
-
-                # Calculate remaining balance
-                # For transferred employees: their used days should be counted as transferred_in
-                # so they don't get double-counted in both 'used' and 'transferred_in'
-                remaining = max(
-                    float(policy.total_leave_days or 0)
-                    - current_used
-                    - pending_days
-                    - probation_adjustment
-                    - transferred_in  # ADD transferred_in (these are used days from previous group)
-                    + transferred_out,  # SUBTRACT transferred_out (days moved to other groups)
-                    0
-                )
-
-                balances.append({
-                    "employee_id": employee.employee_id,
-                    "employee_name": str(employee),
-                    "leave_policy_id": policy.id,
-                    "leave_type": policy.leave_type,
-                    "total_allowed": policy.total_leave_days,
-                    "used": current_used,
-                    "pending": pending_days,
-                    "transferred_in": transferred_in,
-                    "transferred_out": transferred_out,
-                    "probation_adjustment": probation_adjustment,
-                    "remaining": remaining,
-                    "counts_holidays": policy.count_holidays,
-                    "counts_weekends": policy.count_weekends,
-                    "from_date": from_date.isoformat(),
-                    "to_date": to_date.isoformat(),
-                })
-
-            return Response(balances, status=200)
+            return balance_cache.cached_response(
+                self.request,
+                balance_cache.employee_scope(employee.pk, from_date, to_date),
+                lambda: LeaveBalanceEngine(from_date, to_date).balances_for(Employee.objects.filter(pk=employee.pk))
+            )
 
         except Employee.DoesNotExist:
             return Response({"error": "Employee not found"}, status=404)
@@ -367,7 +341,14 @@ class EmployeeLeaveBalanceAPI(APIView):
             if employee_id:
                 return self.get_employee_balance(employee_id, start_date, end_date)
             elif supervisor_id:
-                return self.get_employees_balance_by_supervisor(supervisor_id, start_date, end_date)
+                try:
+                    depth = parse_depth(request.query_params.get('depth'))
+                except ValueError:
+                    return Response(
+                        {"error": 'Invalid depth. Use a positive number or "all"'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                return self.get_employees_balance_by_supervisor(supervisor_id, start_date, end_date, depth)
             else:
                 return self.get_all_employees_balance(start_date, end_date)
 
@@ -378,15 +359,14 @@ class EmployeeLeaveBalanceAPI(APIView):
 
     def get_all_employees_balance(self, from_date, to_date):
         try:
+            from_date = ensure_date(from_date)
+            to_date = ensure_date(to_date)
             employees = Employee.objects.filter(status='active', leave_group__isnull=False)
-            all_balances = []
-            
-            for employee in employees:
-                balances = self.get_employee_balance(employee.employee_id, from_date, to_date)
-                if balances.status_code == status.HTTP_200_OK:
-                    all_balances.extend(balances.data)
-            
-            return Response(all_balances, status=status.HTTP_200_OK)
+            return balance_cache.cached_response(
+                self.request,
+                balance_cache.roster_scope('all', from_date, to_date),
+                lambda: LeaveBalanceEngine(from_date, to_date).balances_for(employees)
+            )
             
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -449,9 +429,5 @@ class EmployeeLeaveBalanceAPI(APIView):
 
     def _get_employee_balances(self, employee, from_date, to_date):
         """Helper method to get formatted balances for an employee"""
-        # Reuse your existing get_employee_balance logic
-        # This is just a wrapper to format the data consistently
-        response = self.get_employee_balance(employee.employee_id, from_date, to_date)
-        if response.status_code == status.HTTP_200_OK:
-            return response.data
-        return []
\ No newline at end of file
+        engine = LeaveBalanceEngine(ensure_date(from_date), ensure_date(to_date))
+        return engine.balances_for(Employee.objects.filter(pk=employee.pk))
\ No newline at end of file